@@ -5,14 +5,24 @@ import yagmail
 from datetime import datetime, timedelta
 import logging
 import time
-import csv
-import unicodedata, re
-import glob
 import schedule
 from threading import Thread
 import traceback
 import sys
 
+from ingestao import (
+    CAP_ENDERECO, ESTOQUE_DETALHADO, EXTENSAO_TABELA, EXTENSOES_TABELA, FORMATOS_DATA_AMPLOS,
+    HISTORICO_TRANSACOES, alinhar_categorias, consultar_transacoes,
+    buscar, converter_datas, eh_tabela, fontes_alteradas, gravar_tabela, impressao_fontes, invalidar,
+    ler_manifesto, ler_relatorio, ler_tabela, listar_arquivos, mais_recente, registrar_dependencias,
+    acumular_alertas, contar_alertas, gravar_xlsx_streaming, ler_alertas, ler_publicado,
+    mascara_rotulos, pick_col, publicar, sincronizar_transacoes,
+    cruzar_saidas_cheias, detalhes_por_par, indexar_oportunidades, preparar_posicoes,
+    contar_analisadas, ja_analisadas, registrar_analisadas, aplicar_movimentos, ocupacao_antes_das_saidas,
+    instante_do_snapshot, instante_snapshot_publicado, ocupacao_inicial, ultimo_lote,
+    filtrar_blocos_recentes, ler_transacoes_em_blocos, mascara_transacoes_recentes,
+)
+
 DEBUG_DIR = os.path.join(os.getcwd(), f"_debug_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
 
 def setup_logging():
@@ -53,77 +63,18 @@ def _find_onedrive_subfolder(subfolder_name: str):
 def encontrar_pasta_onedrive_empresa():
     return _find_onedrive_subfolder("Gestão de Estoque - Gestão_Auditoria")
 
-transacoes_analisadas = set()
-
-EXPECTED_COLS_TRANSACOES = [
-    "ID", "COD_CENTRO", "LOCAL_EXPEDICAO", "COD_DEPOSITO", "COD_ENDERECO", 
-    "COD_ITEM", "DESC_ITEM", "LOTE", "VOLUME", "UOM", 
-    "DATA_VALIDADE", "TIPO_MOVIMENTO", "CHAVE_PALLET", "MOTIVO", "CREATED_AT", "CRIADO_POR_LOGIN"
-]
-
-def _split_fix(parts, n):
-    if len(parts) > n:
-        head = parts[:n-1]
-        tail = ";".join(parts[n-1:])
-        return head + [tail]
-    elif len(parts) < n:
-        return parts + [""] * (n - len(parts))
-    return parts
-
-def _read_csv_transacoes_strict(path, encodings=("utf-8-sig", "utf-8", "latin1", "cp1252")):
-    last_exc = None
-    for enc in encodings:
-        try:
-            with open(path, "r", encoding=enc, errors="replace") as f:
-                lines = [ln.rstrip("\r\n") for ln in f if ln.strip()]
-
-            log(f"Total de linhas lidas: {len(lines)}")
-
-            header_idx = None
-            for i, ln in enumerate(lines):
-                parts = ln.split(";")
-                if ("ID" in parts) and ("COD_ITEM" in parts) and ("TIPO_MOVIMENTO" in parts):
-                    header_idx = i
-                    break
-
-            if header_idx is None:
-                header_idx = 0
-                log("Header não encontrado, usando primeira linha")
-
-            header = _split_fix(lines[header_idx].split(";"), len(EXPECTED_COLS_TRANSACOES))
-
-            rows = []
-            for ln in lines[header_idx+1:]:
-                parts = _split_fix(ln.split(";"), len(EXPECTED_COLS_TRANSACOES))
-                rows.append(parts)
-
-            df_out = pd.DataFrame(rows, columns=EXPECTED_COLS_TRANSACOES, dtype=str)
-            df_out.columns = [c.strip().upper() for c in df_out.columns]
-
-            for c in df_out.columns:
-                df_out[c] = (
-                    df_out[c].astype(str)
-                             .str.strip()
-                             .str.replace('"', '', regex=False)
-                             .str.replace("'",  '', regex=False)
-                )
-
-            log(f"CSV lido com sucesso usando encoding: {enc}")
-            return df_out
-
-        except Exception as e:
-            log(f"Falha com encoding {enc}: {e}")
-            last_exc = e
-            continue
-
-    raise last_exc if last_exc else RuntimeError("Falha ao ler CSV de transações com encodings testados.")
-
+# IDs das saídas já alertadas, persistidos (ingestao.analisadas) entre reinícios
+CONSUMIDOR_ANALISADAS = "auditoria_colmeia"
+# estoque_posicao já preparado e seus índices (inclusive a ocupação viva), mantidos entre os ciclos do schedule
+_estoque_residente = {"assinatura": None, "df": None, "indices": None}
+# o estoque_posicao é lido daqui como tabela tipada; o CSV continua sendo
+# publicado junto porque é o que os consumidores externos (Power BI) leem
+EXPORTAR_CSV_ESTOQUE_POSICAO = True
 
 def encontrar_arquivo_mais_recente(base_dir, padrao):
     try:
-        arquivos = glob.glob(os.path.join(base_dir, padrao))
-        if arquivos:
-            arquivo_mais_recente = max(arquivos, key=os.path.getmtime)
+        arquivo_mais_recente = mais_recente(base_dir, padrao)
+        if arquivo_mais_recente:
             log(f"Arquivo encontrado: {os.path.basename(arquivo_mais_recente)}")
             return arquivo_mais_recente
         return None
@@ -149,7 +100,7 @@ def encontrar_arquivo_transacoes(base_dir):
 def encontrar_arquivo_estoque_posicao(base_dir):
     log(f"Procurando arquivo estoque_posicao em: {base_dir}")
     
-    padroes = ['estoque_posicao_*.csv', 'estoque_posicao_*.xlsx']
+    padroes = [f'estoque_posicao_*{ext}' for ext in EXTENSOES_TABELA] + ['estoque_posicao_*.csv', 'estoque_posicao_*.xlsx']
     
     for padrao in padroes:
         arquivo = encontrar_arquivo_mais_recente(base_dir, padrao)
@@ -160,67 +111,128 @@ def encontrar_arquivo_estoque_posicao(base_dir):
     return None
 
 def ler_estoque_posicao(caminho_estoque):
+    return ler_publicado(caminho_estoque, _ler_estoque_posicao_arquivo)
+
+def _ler_estoque_posicao_arquivo(caminho_estoque):
     log(f"Lendo estoque_posicao de: {caminho_estoque}")
     
     try:
-        if caminho_estoque.lower().endswith('.csv'):
+        if eh_tabela(caminho_estoque):
+            df = ler_tabela(caminho_estoque)
+        elif caminho_estoque.lower().endswith('.csv'):
             df = pd.read_csv(caminho_estoque, sep=';', encoding='utf-8-sig', low_memory=False)
         else:
             df = pd.read_excel(caminho_estoque)
         
         log(f"Estoque_posicao lido - Shape: {df.shape}")
-        
-        letras_validas = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H',
-                           'I13','I14', 'J', 'K', 'Q', 'R17', 'S', 'T', 'U', 'V']
-        mascara_enderecos_validos = df['COD_ENDERECO'].str.upper().str[0].isin(letras_validas)
-        df = df[mascara_enderecos_validos].copy()
-        
-        log(f"Estoque_posicao após filtro de endereços - Shape: {df.shape}")
-        
-        colunas_data = ['DATA_VALIDADE', 'DATA_PRIMEIRO_PALLET']
-        for col in colunas_data:
-            if col in df.columns:
-                df[col] = pd.to_datetime(df[col], errors='coerce')
-        
-        return df
+        return _preparar_estoque_posicao(df)
     except Exception as e:
         log(f"Erro ao ler estoque_posicao: {e}")
         return None
 
-def ler_transacoes(caminho_transacoes):
-    log(f"Lendo transações com método robusto de: {caminho_transacoes}")
-
-    try:
-        if caminho_transacoes.lower().endswith('.csv'):
-            transacoes_df = _read_csv_transacoes_strict(caminho_transacoes)
-        else:
-            transacoes_df = pd.read_excel(caminho_transacoes)
-            transacoes_df.columns = [col.strip().upper() for col in transacoes_df.columns]
+def _preparar_estoque_posicao(df):
+    letras_validas = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H',
+                       'I13','I14', 'J', 'K', 'Q', 'R17', 'S', 'T', 'U', 'V']
+    mascara_enderecos_validos = df['COD_ENDERECO'].str.upper().str[0].isin(letras_validas)
+    df = df[mascara_enderecos_validos].copy()
+    
+    log(f"Estoque_posicao após filtro de endereços - Shape: {df.shape}")
+    
+    colunas_data = ['DATA_VALIDADE', 'DATA_PRIMEIRO_PALLET']
+    for col in colunas_data:
+        if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = converter_datas(df[col], FORMATOS_DATA_AMPLOS, chave=('estoque_posicao', col))
+    
+    return df
 
-        log(f"Transações lidas - Shape: {transacoes_df.shape}")
+def _assinatura_arquivo(path):
+    st = os.stat(path)
+    return (os.path.abspath(path), st.st_size, st.st_mtime_ns)
 
-        if 'VOLUME' in transacoes_df.columns:
-            transacoes_df['VOLUME'] = (
-                transacoes_df['VOLUME'].astype(str)
-                .str.replace(",", ".", regex=False)
-                .str.replace(r"[^0-9\.\-]", "", regex=True)
-            )
-            transacoes_df['VOLUME'] = pd.to_numeric(transacoes_df['VOLUME'], errors="coerce")
+def _guardar_estoque_residente(path, df):
+    try:
+        assinatura = _assinatura_arquivo(path)
+    except OSError:
+        return
+    _estoque_residente.update(assinatura=assinatura, df=df, indices=None)
+
+def obter_estoque_posicao(caminho_estoque):
+    """(estoque_posicao, índices) do processo; só volta ao disco quando o
+    arquivo publicado mudou (caminho, tamanho ou mtime). O frame é
+    compartilhado entre os ciclos: quem usa não deve alterá-lo."""
+    try:
+        assinatura = _assinatura_arquivo(caminho_estoque)
+    except OSError as e:
+        log(f"[RESIDENTE] estoque_posicao indisponível: {e}")
+        return None, None
 
-        for col in ('DATA_VALIDADE', 'CREATED_AT'):
-            if col in transacoes_df.columns:
-                transacoes_df[col] = pd.to_datetime(transacoes_df[col], dayfirst=True, errors="coerce")
+    if _estoque_residente["assinatura"] == assinatura:
+        log(f"[RESIDENTE] estoque_posicao em memória ({len(_estoque_residente['df'])} linhas)")
+    else:
+        df = ler_estoque_posicao(caminho_estoque)
+        if df is None:
+            return None, None
+        _estoque_residente.update(assinatura=assinatura, df=df, indices=None)
+
+    if _estoque_residente["indices"] is None:
+        posicoes = preparar_posicoes(_estoque_residente["df"])
+        _estoque_residente["indices"] = {
+            "posicao": posicoes,
+            "oportunidades": indexar_oportunidades(posicoes),
+            # sem registro no manifesto, o mtime do próprio estoque_posicao
+            "ocupacao": ocupacao_inicial(
+                posicoes,
+                instante_snapshot_publicado(caminho_estoque) or datetime.fromtimestamp(_mtime_or_0(caminho_estoque)),
+            ),
+        }
+    return _estoque_residente["df"], _estoque_residente["indices"]
+
+def atualizar_ocupacao_viva(indices):
+    """Aplica à ocupação viva as ENTRADA/SAIDA do armazém posteriores ao
+    snapshot; cada ciclo lê só os lotes carregados depois do anterior."""
+    estado = (indices or {}).get("ocupacao")
+    if estado is None:
+        return
+    try:
+        lote = ultimo_lote()
+        movimentos = consultar_transacoes(desde=estado["desde"], apos_lote=estado["lote"])
+        aplicados = aplicar_movimentos(estado, movimentos)
+    except Exception as e:
+        log(f"[OCUPACAO] Falha ao aplicar movimentos do armazém: {e}")
+        return
+    estado["lote"] = lote
+    log(f"[OCUPACAO] {aplicados} movimento(s) aplicados; snapshot de {estado['desde']:%d/%m/%Y %H:%M:%S}")
 
-        return transacoes_df
+def ler_transacoes(caminho_transacoes, colunas=None, motor=None):
+    log(f"Lendo transações com método robusto de: {caminho_transacoes}")
 
+    try:
+        return ler_relatorio(caminho_transacoes, HISTORICO_TRANSACOES, colunas=colunas, motor=motor)
     except Exception as e:
         log(f"Erro ao ler transações: {e}")
         return None
 
+def ler_transacoes_do_armazem(caminho_transacoes, horas_retroativas=1):
+    """Carrega o download no armazém local (upsert por ID, só se o arquivo mudou)
+    e devolve apenas as transações a partir do início da janela analisada."""
+    sincronizar_transacoes(caminho_transacoes)
+    agora = datetime.now()
+    desde = max(agora - timedelta(hours=horas_retroativas), agora.replace(hour=0, minute=0, second=0, microsecond=0))
+    df = consultar_transacoes(desde=desde)
+    log(f"[ARMAZEM] Transações desde {desde:%d/%m/%Y %H:%M:%S}: {len(df)}")
+    return df
 
 def filtrar_transacoes_recentes(transacoes_df, horas_retroativas=1):
+    """Aceita um DataFrame ou um iterável de blocos (ver ler_transacoes_em_blocos).
+
+    Com blocos, só as linhas recentes de cada bloco ficam em memória."""
     log(f"Filtrando transações das últimas {horas_retroativas} hora(s) do dia atual")
-    
+
+    if not isinstance(transacoes_df, pd.DataFrame):
+        transacoes_recentes = filtrar_blocos_recentes(transacoes_df, horas_retroativas)
+        log(f"Transações das últimas {horas_retroativas} hora(s) do dia atual: {len(transacoes_recentes)}")
+        return transacoes_recentes
+
     try:
         if 'CREATED_AT' not in transacoes_df.columns:
             log("Coluna CREATED_AT não encontrada - usando todas as transações")
@@ -241,13 +253,9 @@ def filtrar_transacoes_recentes(transacoes_df, horas_retroativas=1):
         log(f"Agora: {agora}")
         log(f"Data limite: {data_limite}")
         log(f"Data hoje (início do dia): {data_hoje}")
-        
-        mascara_recentes = (
-            (transacoes_df['CREATED_AT'] >= data_limite) & 
-            (transacoes_df['CREATED_AT'] <= agora) &
-            (transacoes_df['CREATED_AT'] >= data_hoje)
-        )
-        
+
+        mascara_recentes = mascara_transacoes_recentes(transacoes_df['CREATED_AT'], agora, horas_retroativas)
+
         transacoes_recentes = transacoes_df[mascara_recentes].copy()
         
         log(f"Transações das últimas {horas_retroativas} hora(s) do dia atual: {len(transacoes_recentes)}")
@@ -276,111 +284,88 @@ def filtrar_enderecos_validos(transacoes_df):
     
     return transacoes_filtradas
 
-def analisar_risco_colmeia(transacoes_df, estoque_posicao):
+def analisar_risco_colmeia(transacoes_df, estoque_posicao, indices=None):
     log("=== INICIANDO ANÁLISE DE RISCO DE COLMEIA ===")
     
     alertas = []
-    global transacoes_analisadas
     
     transacoes_df = filtrar_enderecos_validos(transacoes_df)
-    saidas = transacoes_df[transacoes_df['TIPO_MOVIMENTO'].str.upper() == 'SAIDA']
+    saidas = transacoes_df[transacoes_df['TIPO_MOVIMENTO'] == 'SAIDA']
     log(f"Total de saídas encontradas: {len(saidas)}")
     
     if len(saidas) == 0:
         log("Nenhuma saída encontrada para análise")
         return alertas
     
-    saidas_novas = saidas[~saidas['ID'].astype(str).isin(transacoes_analisadas)]
-    log(f"Novas saídas para análise: {len(saidas_novas)}")
+    saidas_novas = saidas[~ja_analisadas(CONSUMIDOR_ANALISADAS, saidas['ID'])]
+    log(f"Novas saídas para análise: {len(saidas_novas)} "
+        f"(IDs já registrados: {contar_analisadas(CONSUMIDOR_ANALISADAS)})")
     
     if len(saidas_novas) == 0:
         log("Todas as saídas já foram analisadas anteriormente")
         return alertas
     
-    estoque_dict = {}
-    for _, row in estoque_posicao.iterrows():
-        chave = f"{row['COD_ENDERECO']}|{row['COD_ITEM']}|{row['DATA_VALIDADE'].strftime('%Y%m%d')}"
-        estoque_dict[chave] = {
-            'OCUPACAO': row['OCUPACAO'],
-            'CAPACIDADE': row['CAPACIDADE'],
-            'LIVRE': row['LIVRE'],
-            'FLAG_CHEIO': row.get('FLAG_CHEIO', 0)
-        }
+    if indices is None:
+        posicoes = preparar_posicoes(estoque_posicao)
+        indices = {"posicao": posicoes, "oportunidades": indexar_oportunidades(posicoes)}
+    ocupacao_antes = None
+    if indices.get("ocupacao") is not None:
+        ocupacao_antes = ocupacao_antes_das_saidas(indices["ocupacao"], saidas_novas)
+    achados, detalhes = cruzar_saidas_cheias(
+        saidas_novas, indices["posicao"], oportunidades=indices["oportunidades"], ocupacao_antes=ocupacao_antes
+    )
+    alternativas = detalhes_por_par(detalhes)
+    linhas = saidas_novas.iloc[achados['_SAIDA'].to_numpy()].to_dict('records')
     
-    for idx, transacao in saidas_novas.iterrows():
+    alertados = set()
+    for transacao, achado in zip(linhas, achados.to_dict('records')):
         try:
             transacao_id = str(transacao.get('ID', 'N/A'))
-            if transacao_id in transacoes_analisadas:
+            if transacao_id in alertados:
                 continue
-                
+            
             sku = transacao['COD_ITEM']
-            data_validade = transacao['DATA_VALIDADE']
-            volume = transacao['VOLUME']
             endereco_origem = transacao['COD_ENDERECO']
-            login = transacao.get('CRIADO_POR_LOGIN','N/A')
-            
-            if pd.isna(data_validade):
-                continue
-            
-            chave_origem = f"{endereco_origem}|{sku}|{data_validade.strftime('%Y%m%d')}"
-            info_origem = estoque_dict.get(chave_origem)
-            
-            if not info_origem:
-                continue
-            
-            estava_cheio_antes = info_origem['FLAG_CHEIO'] == 1
-            
-            if not estava_cheio_antes:
-                continue
-            
-            chave_sku_data = f"{sku}|{data_validade.strftime('%Y%m%d')}"
-            outros_enderecos = estoque_posicao[
-                (estoque_posicao['CHAVE_SKU_DATA'] == chave_sku_data) &
-                (estoque_posicao['COD_ENDERECO'] != endereco_origem)
-            ]
-            
-            if len(outros_enderecos) == 0:
-                continue
-            
-            enderecos_com_capacidade = outros_enderecos[outros_enderecos['LIVRE'] > 0]
-            
-            if len(enderecos_com_capacidade) > 0:
-                alerta = {
-                    'ID_TRANSACAO': transacao_id,
-                    'DATA_TRANSACAO': transacao.get('CREATED_AT', 'N/A'),
-                    'SKU': sku,
-                    'DESC_ITEM': transacao.get('DESC_ITEM', 'N/A'),
-                    'LOTE': transacao.get('LOTE', 'N/A'),
-                    'DATA_VALIDADE': data_validade,
-                    'VOLUME_MOVIMENTADO': volume,
-                    'ENDERECO_ORIGEM': endereco_origem,
-                    'TIPO_MOVIMENTO': transacao['TIPO_MOVIMENTO'],
-                    'MOTIVO': transacao.get('MOTIVO', 'N/A'),
-                    'CRIADO_POR_LOGIN':login,
-                    'ESTAVA_CHEIO': True,
-                    'OCUPACAO_ORIGEM': info_origem['OCUPACAO'],
-                    'CAPACIDADE_ORIGEM': info_origem['CAPACIDADE'],
-                    'OPORTUNIDADES_ENCONTRADAS': len(enderecos_com_capacidade),
-                    'DETALHES_OPORTUNIDADES': []
-                }
-                
-                for _, oportunidade in enderecos_com_capacidade.head(3).iterrows():
-                    alerta['DETALHES_OPORTUNIDADES'].append({
+            alerta = {
+                'ID_TRANSACAO': transacao_id,
+                'DATA_TRANSACAO': transacao.get('CREATED_AT', 'N/A'),
+                'SKU': sku,
+                'DESC_ITEM': transacao.get('DESC_ITEM', 'N/A'),
+                'LOTE': transacao.get('LOTE', 'N/A'),
+                'DATA_VALIDADE': transacao['DATA_VALIDADE'],
+                'VOLUME_MOVIMENTADO': transacao['VOLUME'],
+                'ENDERECO_ORIGEM': endereco_origem,
+                'TIPO_MOVIMENTO': transacao['TIPO_MOVIMENTO'],
+                'MOTIVO': transacao.get('MOTIVO', 'N/A'),
+                'CRIADO_POR_LOGIN': transacao.get('CRIADO_POR_LOGIN', 'N/A'),
+                'ESTAVA_CHEIO': True,
+                'OCUPACAO_ORIGEM': achado['OCUPACAO_ORIGEM'],
+                'CAPACIDADE_ORIGEM': achado['CAPACIDADE_ORIGEM'],
+                'OPORTUNIDADES_ENCONTRADAS': achado['OPORTUNIDADES_ENCONTRADAS'],
+                'DETALHES_OPORTUNIDADES': [
+                    {
                         'ENDERECO_ALTERNATIVO': oportunidade['COD_ENDERECO'],
                         'BLOCO': oportunidade['BLOCO'],
                         'OCUPACAO_ATUAL': oportunidade['OCUPACAO'],
                         'CAPACIDADE': oportunidade['CAPACIDADE'],
                         'LIVRE': oportunidade['LIVRE']
-                    })
-                
-                alertas.append(alerta)
-                transacoes_analisadas.add(transacao_id)
-                log(f"Alerta de colmeia encontrado: {endereco_origem} -> SKU: {sku}")
-                
+                    }
+                    for oportunidade in alternativas[achado['_PAR']]
+                ]
+            }
+            
+            alertas.append(alerta)
+            alertados.add(transacao_id)
+            log(f"Alerta de colmeia encontrado: {endereco_origem} -> SKU: {sku}")
+            
         except Exception as e:
             log(f"Erro ao processar transação: {e}")
             continue
     
+    if alertas:
+        registrar_analisadas(
+            CONSUMIDOR_ANALISADAS, [a['ID_TRANSACAO'] for a in alertas], [a['DATA_TRANSACAO'] for a in alertas]
+        )
     log(f"Total de alertas de colmeia encontrados: {len(alertas)}")
     return alertas
 
@@ -438,7 +423,53 @@ def _excel_daily_path(base_dir: str) -> str:
     day = datetime.now().strftime("%Y%m%d")
     return os.path.join(base_dir, f"alertas_colmeia_{day}.xlsx")
 
+def _importar_excel_do_dia(xlsx_path, dia):
+    """Leva para o armazém a planilha do dia gerada antes dele existir (uma vez)."""
+    if not os.path.exists(xlsx_path) or contar_alertas(dia) > 0:
+        return
+    try:
+        antigos = pd.read_excel(xlsx_path, sheet_name='Todos_Alertas')
+    except Exception as e:
+        log(f"[EXCEL] Falha ao ler existentes: {e} — vou recriar do zero.")
+        return
+    if 'ALERT_KEY' not in antigos.columns:
+        antigos['ALERT_KEY'] = ''
+    novos, total = acumular_alertas(antigos, dia)
+    log(f"[ALERTAS] {novos} alertas importados de {os.path.basename(xlsx_path)}")
+
+def exportar_excel_alertas(base_dir, dia=None):
+    """Gera a planilha do dia a partir do armazém de alertas (Todos_Alertas + resumos)."""
+    dia = dia or datetime.now().strftime("%Y%m%d")
+    xlsx_path = os.path.join(base_dir, f"alertas_colmeia_{dia}.xlsx")
+    combinado = ler_alertas(dia)
+    if combinado.empty:
+        log(f"[EXCEL] Nenhum alerta acumulado em {dia}")
+        return None
+
+    resumo_sku = combinado.groupby(['SKU', 'DESCRICAO_ITEM'], dropna=False).agg(
+        VOLUME_TOTAL=('VOLUME_RETIRADO', 'sum'),
+        QTD_ALERTAS=('ALERT_KEY', 'count'),
+        ENDERECOS_AFETADOS=('ENDERECO_RETIRADA', 'nunique')
+    ).reset_index()
+
+    resumo_end = combinado.groupby(['ENDERECO_RETIRADA'], dropna=False).agg(
+        VOLUME_TOTAL=('VOLUME_RETIRADO', 'sum'),
+        QTD_ALERTAS=('ALERT_KEY', 'count'),
+        SKUS_DIFERENTES=('SKU', 'nunique')
+    ).reset_index()
+
+    abas = {
+        'Todos_Alertas': combinado,
+        'Resumo_SKU': resumo_sku,
+        'Resumo_Endereco': resumo_end,
+    }
+    publicar(xlsx_path, lambda tmp: gravar_xlsx_streaming(tmp, abas), abas)
+    log(f"[EXCEL] Atualizado (acumulado): {xlsx_path}  | Total no dia: {len(combinado)}")
+    return xlsx_path
+
 def gerar_excel_alertas_acumulado(relatorio, base_dir):
+    """Acumula os alertas no armazém do dia e só regrava a planilha se entrou
+    alerta novo (ou se ela ainda não existe)."""
     if not relatorio or relatorio.get('total_alertas', 0) == 0:
         log("Nenhum alerta para acumular no Excel")
         return None
@@ -452,43 +483,17 @@ def gerar_excel_alertas_acumulado(relatorio, base_dir):
             except Exception:
                 pass
 
+        dia = datetime.now().strftime("%Y%m%d")
         xlsx_path = _excel_daily_path(base_dir)
+        _importar_excel_do_dia(xlsx_path, dia)
 
-        if os.path.exists(xlsx_path):
-            try:
-                antigos = pd.read_excel(xlsx_path, sheet_name='Todos_Alertas')
-            except Exception as e:
-                log(f"[EXCEL] Falha ao ler existentes: {e} — vou recriar do zero.")
-                antigos = pd.DataFrame(columns=list(novos.columns))
-
-            if 'ALERT_KEY' not in antigos.columns:
-                antigos['ALERT_KEY'] = ''
+        inseridos, total = acumular_alertas(novos, dia)
+        log(f"[ALERTAS] {inseridos} novos de {len(novos)} | Total no dia: {total}")
+        if inseridos == 0 and os.path.exists(xlsx_path):
+            log(f"[EXCEL] Sem alertas novos - planilha mantida: {xlsx_path}")
+            return xlsx_path
 
-            combinado = pd.concat([antigos, novos], ignore_index=True)
-            combinado = combinado.drop_duplicates(subset=['ALERT_KEY'], keep='first')
-
-        else:
-            combinado = novos
-
-        resumo_sku = combinado.groupby(['SKU', 'DESCRICAO_ITEM'], dropna=False).agg(
-            VOLUME_TOTAL=('VOLUME_RETIRADO', 'sum'),
-            QTD_ALERTAS=('ALERT_KEY', 'count'),
-            ENDERECOS_AFETADOS=('ENDERECO_RETIRADA', 'nunique')
-        ).reset_index()
-
-        resumo_end = combinado.groupby(['ENDERECO_RETIRADA'], dropna=False).agg(
-            VOLUME_TOTAL=('VOLUME_RETIRADO', 'sum'),
-            QTD_ALERTAS=('ALERT_KEY', 'count'),
-            SKUS_DIFERENTES=('SKU', 'nunique')
-        ).reset_index()
-
-        with pd.ExcelWriter(xlsx_path, engine='openpyxl', mode='w') as writer:
-            combinado.to_excel(writer, sheet_name='Todos_Alertas', index=False)
-            resumo_sku.to_excel(writer, sheet_name='Resumo_SKU', index=False)
-            resumo_end.to_excel(writer, sheet_name='Resumo_Endereco', index=False)
-
-        log(f"[EXCEL] Atualizado (acumulado): {xlsx_path}  | Total no dia: {len(combinado)}")
-        return xlsx_path
+        return exportar_excel_alertas(base_dir, dia)
 
     except Exception as e:
         log(f"[EXCEL][ERRO] {e}")
@@ -504,7 +509,7 @@ def executar_auditoria_transacoes():
             log("Pasta do OneDrive não encontrada!")
             return
 
-        caminho_estoque = build_estoque_posicao_if_needed(base_dir, max_age_minutes=30)
+        caminho_estoque = build_estoque_posicao_if_needed(base_dir)
         if not caminho_estoque:
             log("[TRANS] Não foi possível gerar/encontrar estoque_posicao — abortando este ciclo.")
             return
@@ -514,16 +519,29 @@ def executar_auditoria_transacoes():
             log("Arquivo de transações não encontrado!")
             return
         
-        estoque_posicao = ler_estoque_posicao(caminho_estoque)
-        transacoes_df = ler_transacoes(caminho_transacoes)
-        
-        if estoque_posicao is None or transacoes_df is None:
+        estoque_posicao, indices = obter_estoque_posicao(caminho_estoque)
+        if estoque_posicao is None:
             log("Falha ao ler arquivos!")
             return
-        
-        transacoes_df = filtrar_enderecos_validos(transacoes_df)
-        transacoes_recentes = filtrar_transacoes_recentes(transacoes_df, horas_retroativas=1)
-        alertas = analisar_risco_colmeia(transacoes_recentes, estoque_posicao)
+
+        try:
+            transacoes_recentes = filtrar_transacoes_recentes(
+                ler_transacoes_do_armazem(caminho_transacoes, horas_retroativas=1), horas_retroativas=1
+            )
+        except Exception as e:
+            log(f"[ARMAZEM] Falha no armazém de transações ({e}) - lendo o arquivo inteiro")
+            try:
+                transacoes_recentes = filtrar_transacoes_recentes(
+                    ler_transacoes_em_blocos(caminho_transacoes), horas_retroativas=1
+                )
+            except Exception as e:
+                log(f"Erro ao ler transações: {e}")
+                log("Falha ao ler arquivos!")
+                return
+
+        atualizar_ocupacao_viva(indices)
+        transacoes_recentes = filtrar_enderecos_validos(transacoes_recentes)
+        alertas = analisar_risco_colmeia(transacoes_recentes, estoque_posicao, indices)
         
         if alertas:
             relatorio = {
@@ -617,43 +635,54 @@ def enviar_email_alertas(relatorio, excel_path):
     except Exception as e:
         log(f"Falha ao enviar e-mail de alertas: {e}")
 
-def _canon(s: str) -> str:
-    s = unicodedata.normalize("NFKD", str(s)).encode("ascii","ignore").decode("ascii")
-    s = re.sub(r"\s+", " ", s.replace("-", " ").replace("_", " ")).strip().upper()
-    return s
-
 def _filtrar_tipo(df: pd.DataFrame, col_nome_candidatos=('TIPO_ENDERECO','TIPO ENDERECO','TIPO','TIPO_POSICAO'),
                   alvo=("DINAMICO","MEZANINO","PUSH BACK","PUSHBACK")) -> pd.DataFrame:
     try:
-        col_tipo = _pick_col(df, list(col_nome_candidatos))
+        col_tipo = pick_col(df, list(col_nome_candidatos))
         if col_tipo != 'TIPO_ENDERECO':
             df = df.rename(columns={col_tipo: 'TIPO_ENDERECO'})
-        df['_TIPO_CANON'] = df['TIPO_ENDERECO'].map(_canon)
         antes = len(df)
-        df = df[df['_TIPO_CANON'].isin(set(alvo))].copy()
-        df.drop(columns=['_TIPO_CANON'], inplace=True, errors='ignore')
+        df = df[mascara_rotulos(df['TIPO_ENDERECO'], alvo)].copy()
         log(f"[TIPO] Filtro TIPO_ENDERECO aplicado: {antes} -> {len(df)}")
     except Exception as e:
         log(f"[TIPO][AVISO] Não foi possível aplicar filtro de tipo: {e}")
     return df
 
-def _salvar_estoque_posicao(base_dir: str, estoque_posicao: pd.DataFrame) -> str:
+def _salvar_estoque_posicao(base_dir: str, estoque_posicao: pd.DataFrame,
+                            salvar_csv: bool = EXPORTAR_CSV_ESTOQUE_POSICAO, dependencias=None,
+                            instante_snapshot=None) -> str:
     ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-    path = os.path.join(base_dir, f"estoque_posicao_{ts}.csv")
-    df = estoque_posicao.copy()
-    for col in ("DATA_VALIDADE","DATA_PRIMEIRO_PALLET"):
-        if col in df.columns:
-            df[col] = pd.to_datetime(df[col], errors="coerce").dt.strftime("%Y-%m-%d")
+    path = os.path.join(base_dir, f"estoque_posicao_{ts}{EXTENSAO_TABELA}")
+    df = estoque_posicao.reset_index(drop=True)
+    extras = {"instante_snapshot": instante_snapshot.isoformat(sep=" ")} if instante_snapshot else None
     try:
-        df.to_csv(path, sep=";", index=False, encoding="utf-8-sig")
+        path = publicar(
+            path, lambda tmp: gravar_tabela(tmp, df, formato=EXTENSAO_TABELA), df, chave="estoque_posicao",
+            dependencias=dependencias, extras=extras,
+        )
         log(f"[EXPORT] estoque_posicao salvo em: {path} ({len(df)} linhas)")
-        limpar_estoques_posicao_antigos(base_dir, keep_last=1)
-
-        return path
     except Exception as e:
         log(f"[EXPORT][ERRO] Falha ao salvar estoque_posicao: {e}")
         return ""
 
+    if salvar_csv:
+        csv = df.copy()
+        for col in ("DATA_VALIDADE","DATA_PRIMEIRO_PALLET"):
+            if col in csv.columns:
+                csv[col] = pd.to_datetime(csv[col], errors="coerce").dt.strftime("%Y-%m-%d")
+        try:
+            csv_path = publicar(
+                os.path.join(base_dir, f"estoque_posicao_{ts}.csv"),
+                lambda tmp: csv.to_csv(tmp, sep=";", index=False, encoding="utf-8-sig"), csv,
+                chave="estoque_posicao_csv",
+            )
+            log(f"[EXPORT] estoque_posicao exportado em CSV: {csv_path}")
+        except Exception as e:
+            log(f"[EXPORT][ERRO] Falha ao exportar CSV: {e}")
+
+    limpar_estoques_posicao_antigos(base_dir, keep_last=1)
+    return path
+
 
 def _mtime_or_0(p):
     try:
@@ -661,11 +690,15 @@ def _mtime_or_0(p):
     except Exception:
         return 0
 
-def build_estoque_posicao_if_needed(base_dir: str, max_age_minutes: int = 30) -> str:
+def build_estoque_posicao_if_needed(base_dir: str, max_age_minutes=None) -> str:
+    """Caminho do estoque_posicao atual, reconstruindo quando o conteúdo de
+    estoque_detalhado ou cap_endereco mudou desde o último build (hash
+    registrado no manifesto). `max_age_minutes` força um rebuild periódico
+    mesmo sem mudança nas fontes."""
     atual = encontrar_arquivo_estoque_posicao(base_dir)
     atual_mtime = _mtime_or_0(atual) if atual else 0
 
-    arquivos = os.listdir(base_dir)
+    arquivos = [a.nome for a in listar_arquivos(base_dir)]
     estoque_files = [f for f in arquivos if 'estoque_detalhado' in f.lower() and f.lower().endswith(('.csv','.xlsx','.xls'))]
     enderecos_files = [f for f in arquivos if 'cap_endereco' in f.lower() and f.lower().endswith(('.csv','.xlsx','.xls'))]
 
@@ -675,24 +708,48 @@ def build_estoque_posicao_if_needed(base_dir: str, max_age_minutes: int = 30) ->
 
     estoque_path  = os.path.join(base_dir, estoque_files[0])
     enderecos_path= os.path.join(base_dir, enderecos_files[0])
-    src_mtime = max(_mtime_or_0(estoque_path), _mtime_or_0(enderecos_path))
+    fontes = {"estoque_detalhado": estoque_path, "cap_endereco": enderecos_path}
+
+    entrada = ler_manifesto(base_dir).get("estoque_posicao")
+    if not atual or not entrada or entrada.get("arquivo") != os.path.basename(atual):
+        entrada = None
+    anteriores = (entrada or {}).get("dependencias")
+    try:
+        dependencias = impressao_fontes(fontes, anteriores)
+    except OSError as e:
+        log(f"[BOOT][ERRO] Falha ao ler as fontes: {e}")
+        return atual or ""
 
     need_build = False
     if not atual:
         need_build = True
         log("[BOOT] Não existe estoque_posicao — será criado agora.")
+    elif anteriores is None:
+        src_mtime = max(_mtime_or_0(estoque_path), _mtime_or_0(enderecos_path))
+        if src_mtime > atual_mtime:
+            need_build = True
+            log("[BOOT] estoque_posicao sem registro das fontes e fontes mais novas — será recriado.")
     else:
-        age_min = (time.time() - atual_mtime) / 60.0
-        if age_min > max_age_minutes and src_mtime > atual_mtime:
+        alteradas = fontes_alteradas(dependencias, anteriores)
+        idade_min = (time.time() - entrada.get("verificado_em", atual_mtime)) / 60.0
+        if alteradas:
+            need_build = True
+            log(f"[BOOT] Conteúdo mudou em {alteradas} — estoque_posicao será recriado.")
+        elif max_age_minutes is not None and idade_min > max_age_minutes:
             need_build = True
-            log(f"[BOOT] estoque_posicao está velho ({age_min:.1f} min) e fontes são mais novas — será recriado.")
+            log(f"[BOOT] estoque_posicao verificado há {idade_min:.1f} min (limite {max_age_minutes}) — será recriado.")
 
     if not need_build:
+        if anteriores is not None and dependencias != anteriores:
+            registrar_dependencias(base_dir, "estoque_posicao", dependencias)
         return atual
 
     try:
         est_df = ler_estoque(estoque_path)
         end_df = ler_enderecos(enderecos_path)
+        instante = instante_do_snapshot(
+            est_df, datetime.fromtimestamp(dependencias["estoque_detalhado"]["mtime_ns"] / 1e9)
+        )
 
         est_df = _filtrar_tipo(est_df, alvo=("DINAMICO","PUSH BACK","PUSHBACK"))   
         end_df = _filtrar_tipo(end_df,  alvo=("DINAMICO","MEZANINO","PUSH BACK","PUSHBACK"))  
@@ -708,156 +765,37 @@ def build_estoque_posicao_if_needed(base_dir: str, max_age_minutes: int = 30) ->
             return atual or ""
 
         est_pos = criar_estoque_posicao(est_df, end_df)
-        path = _salvar_estoque_posicao(base_dir, est_pos)
+        path = _salvar_estoque_posicao(base_dir, est_pos, dependencias=dependencias, instante_snapshot=instante)
+        if path:
+            _guardar_estoque_residente(path, _preparar_estoque_posicao(est_pos))
         return path or (atual or "")
     except Exception as e:
         log(f"[BOOT][ERRO] Falha ao construir estoque_posicao: {e}")
         log(traceback.format_exc())
         return atual or ""
 
-def _pick_col(df, candidatos):
-    cols = {c.strip().lower(): c for c in df.columns}
-    
-    for cand in candidatos:
-        k = cand.strip().lower()
-        if k in cols:
-            return cols[k]
-    
-    norm_cands = {cand.strip().lower().replace(" ", "_") for cand in candidatos}
-    for c in df.columns:
-        if c.strip().lower().replace(" ", "_") in norm_cands:
-            return c
-    
-    raise ValueError(f"Coluna não encontrada. Candidatos: {candidatos}")
-
-def _read_csv_strict_build_df(path, encodings=("utf-8-sig","utf-8","latin1","cp1252")):
-    EXPECTED_COLS = [
-    "LOCAL_EXPEDICAO","COD_DEPOSITO","COD_ENDERECO","CHAVE_PALLET","VOLUME",
-    "COD_ITEM","DESC_ITEM","LOTE","UOM","DOCUMENTO",
-    "DATA_VALIDADE","DATA_ULTIMA_TRANSACAO","OCUPACAO",
-    "CAPACIDADE","DESCRICAO","QTDE_POR_PALLET","PALLET_COMPLETO","BLOCO","TIPO_ENDERECO",
-    "STATUS_PALLET","SHELF_ITEM","DATA_FABRICACAO","SHELF_ESTOQUE","DIAS_ESTOQUE","DIAS_VALIDADE","DATA_RELATORIO"
-]
-
-    last_exc = None
-    for enc in encodings:
-        try:
-            with open(path, "r", encoding=enc, errors="replace") as f:
-                lines = [ln.rstrip("\r\n") for ln in f if ln.strip()]
-            header_idx = None
-            for i, ln in enumerate(lines):
-                parts = ln.split(";")
-                if ("LOCAL_EXPEDICAO" in parts) and ("COD_ENDERECO" in parts):
-                    header_idx = i
-                    break
-            if header_idx is None:
-                header_idx = 0 
-
-            header = _split_fix(lines[header_idx].split(";"), len(EXPECTED_COLS))
-            use_cols = EXPECTED_COLS
-
-            rows = []
-            for ln in lines[header_idx+1:]:
-                parts = _split_fix(ln.split(";"), len(EXPECTED_COLS))
-                rows.append(parts)
-
-            df_out = pd.DataFrame(rows, columns=use_cols, dtype=str)
-            df_out.columns = [c.strip() for c in df_out.columns]
-            for c in df_out.columns:
-                df_out[c] = df_out[c].astype(str).str.strip().str.replace('"','').str.replace("'","")
-            return df_out
-        except Exception as e:
-            last_exc = e
-            continue
-    raise last_exc if last_exc else RuntimeError("Falha ao ler CSV com encodings testados.")
-
-def ler_csv_corretamente(csv_path):
-    df = _read_csv_strict_build_df(csv_path)
-    df.columns = [c.upper() for c in df.columns]
-
-    for col in ("DATA_VALIDADE","DATA_ULTIMA_TRANSACAO","DATA_FABRICACAO","DATA_RELATORIO"):
-        if col in df.columns:
-            try:
-                df[col] = pd.to_datetime(df[col], dayfirst=True, errors="coerce")
-            except Exception:
-                pass
-
-    for col in ("OCUPACAO","CAPACIDADE","QTDE_POR_PALLET","VOLUME","DIAS_ESTOQUE","DIAS_VALIDADE"):
-        if col in df.columns:
-            df[col] = (
-                df[col]
-                .astype(str)
-                .str.replace(",", ".", regex=False)
-                .str.replace(r"[^0-9\.\-]", "", regex=True)
-            )
-            df[col] = pd.to_numeric(df[col], errors="coerce")
-
-    return df
-
 def ler_estoque(estoque_path):
-    if estoque_path.lower().endswith('.csv'):
-        df = ler_csv_corretamente(estoque_path)
-    else:
-        df = pd.read_excel(estoque_path)
-
-    df.columns = [col.strip().upper() for col in df.columns]
-    
-    col_map = {
-        'BLOCO': ['BLOCO', 'BLOCO_ENDERECO', 'LOCAL'],
-        'COD_ENDERECO': ['COD_ENDERECO', 'ENDERECO', 'POSICAO'],
-        'COD_ITEM': ['COD_ITEM', 'SKU', 'ITEM', 'PRODUTO'],
-        'DATA_VALIDADE': ['DATA_VALIDADE', 'VALIDADE', 'DT_VALIDADE'],
-        'CHAVE_PALLET': ['CHAVE_PALLET', 'PALLET', 'LOTE'],
-        'DATA_ULTIMA_TRANSACAO': ['DATA_ULTIMA_TRANSACAO', 'DT_ULTIMA_TRANSACAO', 'ULTIMA_TRANSACAO']
-    }
-    
-    for new_col, old_cols in col_map.items():
-        try:
-            old_col = _pick_col(df, old_cols)
-            if old_col != new_col:
-                df.rename(columns={old_col: new_col}, inplace=True)
-        except ValueError:
-            pass
-    
-    return df
+    return ler_relatorio(estoque_path, ESTOQUE_DETALHADO)
 
 def ler_enderecos(enderecos_path):
-    if enderecos_path.lower().endswith('.csv'):
-        df = ler_csv_corretamente(enderecos_path)
-    else:
-        df = pd.read_excel(enderecos_path)
-    
-    df.columns = [col.strip().upper() for col in df.columns]
-    
-    col_map = {
-        'BLOCO': ['BLOCO', 'BLOCO_ENDERECO', 'LOCAL'],
-        'COD_ENDERECO': ['COD_ENDERECO', 'ENDERECO', 'POSICAO'],
-        'CAPACIDADE': ['CAPACIDADE', 'CAP', 'QTD_MAXIMA']
-    }
-    
-    for new_col, old_cols in col_map.items():
-        try:
-            old_col = _pick_col(df, old_cols)
-            if old_col != new_col:
-                df.rename(columns={old_col: new_col}, inplace=True)
-        except ValueError:
-            pass
-    
-    return df
+    return ler_relatorio(enderecos_path, CAP_ENDERECO)
 
 def criar_estoque_posicao(estoque_df, enderecos_df):
     estoque_df['DATA_VALIDADE'] = pd.to_datetime(estoque_df['DATA_VALIDADE'], dayfirst=True, errors='coerce')
     
     grupo_cols = ['BLOCO', 'COD_ENDERECO', 'COD_ITEM', 'DATA_VALIDADE']
-    estoque_agrupado = estoque_df.groupby(grupo_cols).agg(
+    estoque_agrupado = estoque_df.groupby(grupo_cols, observed=True).agg(
         OCUP_PALLETS=('CHAVE_PALLET', 'nunique')
     ).reset_index()
     
     estoque_agrupado.rename(columns={'OCUP_PALLETS': 'OCUPACAO'}, inplace=True)
     
+    estoque_agrupado, capacidades = alinhar_categorias(
+        estoque_agrupado, enderecos_df[['BLOCO', 'COD_ENDERECO', 'CAPACIDADE']], colunas=['BLOCO']
+    )
     estoque_posicao = pd.merge(
         estoque_agrupado,
-        enderecos_df[['BLOCO', 'COD_ENDERECO', 'CAPACIDADE']],
+        capacidades,
         on=['BLOCO', 'COD_ENDERECO'],
         how='left'
     )
@@ -874,16 +812,16 @@ def criar_estoque_posicao(estoque_df, enderecos_df):
 
 def limpar_estoques_posicao_antigos(base_dir:str, keep_last: int=1):
     try:
-        padroes=["estoque_posicao_*.csv","estoque_posicao_*.xlsx"]
+        padroes=[f"estoque_posicao_*{ext}" for ext in EXTENSOES_TABELA] + ["estoque_posicao_*.csv","estoque_posicao_*.xlsx"]
         for padrao in padroes:
-            arquivos = glob.glob(os.path.join(base_dir, padrao))
-            arquivos.sort(key=lambda p: os.path.getmtime(p), reverse=True)
+            arquivos = [a.caminho for a in buscar(base_dir, padrao)]
             for f in arquivos[keep_last:]:
                 try:
                     os.remove(f)
                     log(f"Removido antigo: {os.path.basename(f)}")
                 except Exception as e:
                     log(f"[ERRO]{f}:{e}")
+        invalidar(base_dir)
     except Exception as e:
         log(f"[CLEAN][ERRO] Falha na limpeza de estoque_posicao: {e}")
 
@@ -961,7 +899,7 @@ def executar_auditoria_indicadores():
             log("Pasta do OneDrive não encontrada!")
             return
         
-        arquivos = os.listdir(fonte_dir)
+        arquivos = [a.nome for a in listar_arquivos(fonte_dir)]
         estoque_files = [f for f in arquivos if 'estoque_detalhado' in f.lower() and f.lower().endswith(('.csv','.xlsx','.xls'))]
         enderecos_files = [f for f in arquivos if 'cap_endereco' in f.lower() and f.lower().endswith(('.csv','.xlsx','.xls'))]
         
@@ -25,12 +25,21 @@ import logging, logging.handlers
 import json
 import sys
 
+from ingestao import (
+    COLUNAS_AUDITORIA, HISTORICO_TRANSACOES, RASTREABILIDADE, chaves_alteradas, chaves_auditadas,
+    consultar_transacoes, contar_auditoria, gravar_atomico, gravar_auditoria, gravar_marca,
+    gravar_xlsx_streaming, ler_auditoria, ler_marca, ler_relatorio, listar_arquivos, pick_col, publicar,
+    sincronizar_transacoes,
+)
+
 URL = "https://prod12cwlsistemas.mdb.com.br/sgr/#!/home"
 ITEM_FILIAL = "M431 - Divisao Vitarella - Logistico"
 ITEM_DEPOSITO = "LA01"
 TIMEOUT = 15
 LOGIN_MENU_MAX_RETRIES = 3
 LOGIN_MENU_RETRY_DELAY = 600  
+# janela do Histórico Transações baixado; a auditoria considera o mesmo período
+DIAS_HISTORICO = 30
 
 stop_event = threading.Event()
 bg_thread = None
@@ -107,9 +116,12 @@ def save_status(extra=None):
         "fase": extra.get("fase") if extra else "",
         "ultimo_erro": _state["last_error"],
     }
-    try:
-        with open(STATUS_PATH, "w", encoding="utf-8") as f:
+    def escrever(tmp):
+        with open(tmp, "w", encoding="utf-8") as f:
             json.dump(dados, f, ensure_ascii=False, indent=2, default=str)
+
+    try:
+        gravar_atomico(STATUS_PATH, escrever)
     except Exception as e:
         log(f"[STATUS] Falha ao salvar: {e}", "warning")
 
@@ -214,6 +226,10 @@ def apply_command(cmd: str):
     else:
         log(f"Comando desconhecido: {cmd}", "warning")
 
+def _escrever_fila_vazia(tmp):
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write('{"queue":[]}')
+
 def watch_commands():
     last_mtime = None
     while True:
@@ -227,8 +243,7 @@ def watch_commands():
                     queue = data.get("queue", [])
                     for cmd in queue:
                         apply_command(cmd)
-                    with open(COMMANDS_PATH, "w", encoding="utf-8") as f:
-                        f.write('{"queue":[]}')
+                    gravar_atomico(COMMANDS_PATH, _escrever_fila_vazia)
         except Exception as e:
             log(f"[COMANDOS] Erro lendo commands.json: {e}", "warning")
         time.sleep(5)
@@ -255,8 +270,7 @@ COMMANDS_PATH = os.path.join(fonte_dir, "commands.json")
 
 if not os.path.exists(COMMANDS_PATH):
     try:
-        with open(COMMANDS_PATH, "w", encoding="utf-8") as f:
-            f.write('{"queue":[]}')
+        gravar_atomico(COMMANDS_PATH, _escrever_fila_vazia)
     except:
         pass
 
@@ -493,7 +507,7 @@ def interacoes_sgr(driver):
         raise Exception("Tela de filtros (Histórico) não carregou")
     if not selecionar_unidade_embarcadora(driver):
         raise Exception("Falha ao selecionar unidade (Histórico)")
-    preencher_datas_e_executar(driver, dias_passado=30)
+    preencher_datas_e_executar(driver, dias_passado=DIAS_HISTORICO)
 
     # Estoque
     if not abrir_menu_relatorio(driver, actions, "Estoque Detalhado"):
@@ -621,7 +635,7 @@ def baixar_relatorios_mais_recentes(driver, destino_dir=None, timeout_status=600
         if not selecionar_unidade_embarcadora(driver):
             return False
         if nome_relatorio != "Estoque Detalhado":
-            dias_passado = 30 if nome_relatorio == "Histórico Transações" else 2
+            dias_passado = DIAS_HISTORICO if nome_relatorio == "Histórico Transações" else 2
             preencher_datas_e_executar(driver, dias_passado=dias_passado)
         else:
             executar_relatorio_estoque(driver)
@@ -711,54 +725,12 @@ def baixar_relatorios_mais_recentes(driver, destino_dir=None, timeout_status=600
 
     return True, criticos_por_relatorio, relatorio_estourado
 
-def ler_csv_corretamente(csv_path):
-    log(f"Processando arquivo: {os.path.basename(csv_path)}")
-    with open(csv_path, 'r', encoding='latin1') as f:
-        lines = [line.strip().split(';') for line in f.readlines() if line.strip()]
-    if not lines:
-        raise ValueError("Arquivo CSV vazio ou inválido")
-    header = lines[0]
-    data = []
-    problemas = 0
-    for i, line in enumerate(lines[1:]):
-        if len(line) == len(header):
-            data.append(line)
-        else:
-            problemas += 1
-            corrected = line[:len(header)]
-            if len(corrected) == len(header):
-                data.append(corrected)
-            else:
-                log(f"[AVISO] Linha {i+2} ignorada - número inválido de colunas: {len(line)} (esperado: {len(header)})")
-    if problemas > 0:
-        log(f"[AVISO] Foram corrigidas {problemas} linhas com problemas de formatação")
-    df = pd.DataFrame(data, columns=header)
-    log("[DEBUG] Estrutura do DataFrame carregado:")
-    log(f"Total de linhas: {len(df)}")
-    log(f"Colunas: {list(df.columns)}")
-    log("[DEBUG] Primeiras linhas dos dados:")
-    for i, row in df.head(3).iterrows():
-        log(f"Linha {i}: {row.to_dict()}")
-    return df
-
-def _pick_col(df, candidatos):
-    cols = {c.strip().lower(): c for c in df.columns}
-    for cand in candidatos:
-        k = cand.strip().lower()
-        if k in cols:
-            return cols[k]
-    norm_cands = {cand.strip().lower().replace(" ", "_") for cand in candidatos}
-    for c in df.columns:
-        if c.strip().lower().replace(" ", "_") in norm_cands:
-            return c
-    return None
-
 def _preparar_ultimos_movimentos(df_hist):
-    col_chave   = _pick_col(df_hist, ["CHAVE_PALLET", "CHAVE_PALLETE"])
-    col_created = _pick_col(df_hist, ["CREATED_AT"])
-    col_tipo    = _pick_col(df_hist, ["TIPO_MOVIMENTO"])
-    col_motivo  = _pick_col(df_hist, ["MOTIVO"])
-    col_end     = _pick_col(df_hist, ["COD_ENDERECO", "ENDERECO"])
+    col_chave   = pick_col(df_hist, ["CHAVE_PALLET", "CHAVE_PALLETE"], obrigatoria=False)
+    col_created = pick_col(df_hist, ["CREATED_AT"], obrigatoria=False)
+    col_tipo    = pick_col(df_hist, ["TIPO_MOVIMENTO"], obrigatoria=False)
+    col_motivo  = pick_col(df_hist, ["MOTIVO"], obrigatoria=False)
+    col_end     = pick_col(df_hist, ["COD_ENDERECO", "ENDERECO"], obrigatoria=False)
 
     if col_chave is None or col_created is None:
         raise ValueError("Não encontrei colunas de chave ou CREATED_AT no histórico após leitura.")
@@ -825,18 +797,47 @@ def filtrar_chaves_mes(df, coluna_chave):
     chaves = df[coluna_chave].astype(str).str.strip()
     mascara = chaves.str.startswith('M431')
     return df[mascara].copy()
-def _load_table(path):
+
+MARCA_ARMAZEM = "auditoria_24_7"
+
+def _load_table(path, esquema):
     log(f"Carregando arquivo: {os.path.basename(path)}")
-    if path.lower().endswith(".csv"):
-        return ler_csv_corretamente(path)
-    df = pd.read_excel(path)
+    df = ler_relatorio(path, esquema)
     log(f"Total de linhas: {len(df)}")
     log(f"Colunas: {list(df.columns)}")
     return df
 
+_exportar_auditoria_pendente = True
+
+def _importar_auditoria_excel(auditoria_path):
+    """Leva a auditoria_24_7.xlsx anterior ao armazém para o estado (uma vez)."""
+    if contar_auditoria() > 0 or not os.path.exists(auditoria_path):
+        return
+    df = pd.read_excel(auditoria_path)
+    for c in COLUNAS_AUDITORIA:
+        if c not in df.columns:
+            df[c] = pd.NA
+    df = df[df['chave_pallete'].notna()]
+    inseridas, _ = gravar_auditoria(df)
+    log(f"[AUDITORIA] {inseridas} chaves importadas de {os.path.basename(auditoria_path)}")
+
+def exportar_auditoria_excel(auditoria_path):
+    """Regrava a auditoria_24_7.xlsx a partir do estado no armazém."""
+    try:
+        df_final = ler_auditoria()
+        publicar(auditoria_path, lambda tmp: gravar_xlsx_streaming(tmp, {'Sheet1': df_final}), df_final)
+        size = os.path.getsize(auditoria_path)
+        mtime = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(os.path.getmtime(auditoria_path)))
+        log(f"[AUDITORIA] Gravado: {auditoria_path} | linhas={len(df_final)} | size={size} | mtime={mtime}")
+        return True
+    except Exception as e:
+        log(f"[ERRO] Falha ao exportar {auditoria_path}: {e} (nova tentativa no próximo ciclo)")
+        return False
+
 def analisar_rastreabilidade_incremental(fonte_dir):
+    global _exportar_auditoria_pendente
     log("Localizando arquivos na pasta para análise...")
-    arquivos = os.listdir(fonte_dir)
+    arquivos = {a.nome: a for a in listar_arquivos(fonte_dir)}
     rastreabilidade_files = [f for f in arquivos if 'rastreabilidade' in f.lower() and f.lower().endswith(('.csv','.xlsx','.xls'))]
     historico_files = [f for f in arquivos if 'historico_transacoes' in f.lower() and f.lower().endswith(('.csv','.xlsx','.xls'))]
     
@@ -854,13 +855,11 @@ def analisar_rastreabilidade_incremental(fonte_dir):
         log(f"[ERRO] Sem permissão de escrita na pasta: {e}")
         return None
     
-    rastreabilidade_path = os.path.join(fonte_dir, max(rastreabilidade_files, key=lambda x: os.path.getmtime(os.path.join(fonte_dir, x))))
-    historico_path = os.path.join(fonte_dir, max(historico_files, key=lambda x: os.path.getmtime(os.path.join(fonte_dir, x))))
+    rastreabilidade_path = max((arquivos[f] for f in rastreabilidade_files), key=lambda a: a.mtime).caminho
+    historico_path = max((arquivos[f] for f in historico_files), key=lambda a: a.mtime).caminho
     
     log("Carregando arquivo de rastreabilidade...")
-    df_rastreabilidade = _load_table(rastreabilidade_path)
-    log("Carregando arquivo de histórico de transações...")
-    df_historico = _load_table(historico_path)
+    df_rastreabilidade = _load_table(rastreabilidade_path, RASTREABILIDADE)
     
     coluna_rastreio = None
     for col in df_rastreabilidade.columns:
@@ -872,41 +871,60 @@ def analisar_rastreabilidade_incremental(fonte_dir):
         log("Coluna COD_RASTREABILIDADE não encontrada.")
         return None
     
-    coluna_pallet = _pick_col(df_historico, ["CHAVE_PALLET","CHAVE_PALLETE"])
-    if not coluna_pallet:
-        log("Coluna CHAVE_PALLET não encontrada no histórico.")
-        return None
-    
-    log("Aplicando filtro MES para rastreabilidade e histórico...")
+    log("Aplicando filtro MES para rastreabilidade...")
     df_rastreabilidade = filtrar_chaves_mes(df_rastreabilidade, coluna_rastreio)
-    df_historico = filtrar_chaves_mes(df_historico, coluna_pallet)
-    
-    log("Calculando última movimentação e flags...")
-    df_ultimos = _preparar_ultimos_movimentos(df_historico)
     
     auditoria_path = os.path.join(fonte_dir, "auditoria_24_7.xlsx")
     
-    if os.path.exists(auditoria_path):
-        try:
-            df_auditoria_existente = pd.read_excel(auditoria_path)
-            ja_auditadas = set(df_auditoria_existente['chave_pallete'].astype(str).str.strip().tolist())
-        except Exception as e:
-            log(f"[AVISO] Erro ao ler auditoria existente: {e}. Criando nova.")
-            df_auditoria_existente = pd.DataFrame(columns=['chave_pallete','status','created_at_ultimo','TIPO_MOVIMENTO_ULTIMO','MOTIVO_ULTIMO','tem_remessa_saida'])
-            ja_auditadas = set()
-    else:
-        df_auditoria_existente = pd.DataFrame(columns=['chave_pallete','status','created_at_ultimo','TIPO_MOVIMENTO_ULTIMO','MOTIVO_ULTIMO','tem_remessa_saida'])
-        ja_auditadas = set()
-    
+    try:
+        _importar_auditoria_excel(auditoria_path)
+    except Exception as e:
+        log(f"[AVISO] Erro ao importar auditoria existente: {e}. Seguindo com o estado do armazém.")
+
     codigos_rastreabilidade = [
         str(codigo).strip()
         for codigo in df_rastreabilidade[coluna_rastreio].unique()
         if pd.notna(codigo) and str(codigo).strip()
     ]
+    ja_auditadas = chaves_auditadas(codigos_rastreabilidade)
+
+    log("Carregando histórico de transações (armazém local)...")
+    lote_atual = None
+    chaves_recalcular = None
+    try:
+        lote_atual = sincronizar_transacoes(historico_path)
+        alteradas = chaves_alteradas(ler_marca(MARCA_ARMAZEM))
+        chaves_recalcular = {c for c in codigos_rastreabilidade if c in alteradas or c not in ja_auditadas}
+        # o armazém guarda mais dias que o arquivo; o histórico da auditoria
+        # continua sendo o da janela baixada
+        inicio_janela = datetime.date.today() - datetime.timedelta(days=DIAS_HISTORICO)
+        df_historico = consultar_transacoes(desde=inicio_janela, chaves=chaves_recalcular)
+        log(f"[ARMAZEM] Chaves com movimentação nova ou ainda não auditadas: {len(chaves_recalcular)} "
+            f"| linhas de histórico: {len(df_historico)}")
+    except Exception as e:
+        log(f"[ARMAZEM][AVISO] Armazém indisponível ({e}). Lendo o histórico inteiro.", "warning")
+        lote_atual = None
+        chaves_recalcular = None
+        df_historico = _load_table(historico_path, HISTORICO_TRANSACOES)
+    
+    coluna_pallet = pick_col(df_historico, ["CHAVE_PALLET","CHAVE_PALLETE"], obrigatoria=False)
+    if not coluna_pallet:
+        log("Coluna CHAVE_PALLET não encontrada no histórico.")
+        return None
+    
+    log("Aplicando filtro MES para histórico...")
+    df_historico = filtrar_chaves_mes(df_historico, coluna_pallet)
+    
+    log("Calculando última movimentação e flags...")
+    df_ultimos = _preparar_ultimos_movimentos(df_historico)
 
     log(f"Total de chaves rastreabilidade (arquivo atual): {len(codigos_rastreabilidade)}")
 
-    mapa_ultimos = df_ultimos.set_index("chave_pallete").to_dict(orient="index")
+    if chaves_recalcular is not None:
+        codigos_rastreabilidade = [c for c in codigos_rastreabilidade if c in chaves_recalcular]
+        log(f"Chaves recalculadas neste ciclo: {len(codigos_rastreabilidade)}")
+
+    mapa_ultimos = df_ultimos.set_index("chave_pallete").to_dict(orient="index") if not df_ultimos.empty else {}
 
     registros_atual = []
     for codigo in codigos_rastreabilidade:
@@ -937,86 +955,26 @@ def analisar_rastreabilidade_incremental(fonte_dir):
                 'tem_remessa_saida': bool(info.get("ultimo_remessa_saida", False)),
             })
 
-    df_calc = pd.DataFrame(registros_atual)
-
-    chaves_existentes = set(df_auditoria_existente['chave_pallete'].astype(str).str.strip()) if not df_auditoria_existente.empty else set()
-    df_novos = df_calc[~df_calc['chave_pallete'].astype(str).str.strip().isin(chaves_existentes)].copy()
-
-    if not df_auditoria_existente.empty:
-        for c in ['status','created_at_ultimo','TIPO_MOVIMENTO_ULTIMO','MOTIVO_ULTIMO','tem_remessa_saida']:
-            if c not in df_auditoria_existente.columns:
-                df_auditoria_existente[c] = pd.NA
-
-        merged = df_auditoria_existente.merge(
-            df_calc, on='chave_pallete', how='outer', suffixes=('_old','')
-        )
-
-        use_new = (
-            merged['status'].notna() &
-            (
-                merged['status_old'].isna() |
-                (merged['created_at_ultimo'].fillna(pd.Timestamp.min) >
-                 merged['created_at_ultimo_old'].fillna(pd.Timestamp.min)) |
-                (merged['status'] != merged['status_old'])
-            )
-        )
-
-        def choose(col):
-            return merged[col].where(use_new, merged[f'{col}_old'])
-
-        df_final = pd.DataFrame({
-            'chave_pallete': merged['chave_pallete'],
-            'status': choose('status'),
-            'created_at_ultimo': choose('created_at_ultimo'),
-            'TIPO_MOVIMENTO_ULTIMO': choose('TIPO_MOVIMENTO_ULTIMO'),
-            'MOTIVO_ULTIMO': choose('MOTIVO_ULTIMO'),
-            'tem_remessa_saida': choose('tem_remessa_saida')
-        })
-    else:
-        df_final = df_calc.copy()
+    df_calc = pd.DataFrame(registros_atual, columns=['chave_pallete','status','created_at_ultimo','TIPO_MOVIMENTO_ULTIMO','MOTIVO_ULTIMO','tem_remessa_saida'])
 
-    log(f"[DEBUG] DataFrame final tem {len(df_final)} linhas")
-    log(f"[DEBUG] Primeiras 5 chaves: {df_final['chave_pallete'].head(5).tolist()}")
-    
-    chaves_df = set(df_final['chave_pallete'].astype(str).str.strip())
-    if 'M431108450603990020M' in chaves_df:
-        log(f"[DEBUG] Chave M431108450603990020M encontrada no DataFrame")
-    else:
-        log(f"[DEBUG] Chave M431108450603990020M NÃO encontrada no DataFrame")
-        chaves_novos = set(df_novos['chave_pallete'].astype(str).str.strip())
-        if 'M431108450603990020M' in chaves_novos:
-            log(f"[DEBUG] Mas está em df_novos!")
-        else:
-            log(f"[DEBUG] Também não está em df_novos!")
+    df_novos = df_calc[~df_calc['chave_pallete'].isin(ja_auditadas)].copy()
 
     try:
-        df_final.to_excel(auditoria_path, index=False)
-        size = os.path.getsize(auditoria_path)
-        mtime = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(os.path.getmtime(auditoria_path)))
-        log(f"[AUDITORIA] Gravado: {auditoria_path} | linhas={len(df_final)} | size={size} | mtime={mtime}")
-        
-        if os.path.exists(auditoria_path):
-            try:
-                df_verificacao = pd.read_excel(auditoria_path)
-                log(f"[VERIFICAÇÃO] Arquivo salvo com {len(df_verificacao)} linhas")
-                
-                chaves_salvas = set(df_verificacao['chave_pallete'].astype(str).str.strip())
-                if 'M431108450603990020M' in chaves_salvas:
-                    log(f"[VERIFICAÇÃO] Chave M431108450603990020M encontrada no arquivo salvo")
-                else:
-                    log(f"[VERIFICAÇÃO] Chave M431108450603990020M NÃO encontrada no arquivo salvo")
-            except Exception as e:
-                log(f"[ERRO] Falha ao verificar arquivo salvo: {e}")
-        else:
-            log(f"[ERRO CRÍTICO] Arquivo de auditoria não foi criado: {auditoria_path}")
-            
+        inseridas, atualizadas = gravar_auditoria(df_calc)
+        log(f"[AUDITORIA] Estado atualizado: {inseridas} novas, {atualizadas} alteradas")
     except Exception as e:
         log(f"[ERRO CRÍTICO] Falha ao salvar auditoria: {e}")
         import traceback
         log(traceback.format_exc())
         return None
 
-    total = len(df_final)
+    if inseridas or atualizadas or _exportar_auditoria_pendente or not os.path.exists(auditoria_path):
+        _exportar_auditoria_pendente = not exportar_auditoria_excel(auditoria_path)
+
+    if lote_atual is not None:
+        gravar_marca(MARCA_ARMAZEM, lote_atual)
+
+    total = contar_auditoria()
     novos = len(df_novos)
     nao_encontrados = (df_novos['status'] == 'NÃO ENCONTRADO MOVIMENTAÇÃO').sum()
     devolucao_estoque = (df_novos['status'] == 'DEVOLUÇÃO ESTOQUE').sum()
@@ -1067,7 +1025,7 @@ def analisar_rastreabilidade_incremental(fonte_dir):
     else:
         log("[EMAIL] Nada novo/ problemático nesta execução. E-mail não enviado.")
 
-    return df_final
+    return ler_auditoria()
 
 def login_sgr():
     try:
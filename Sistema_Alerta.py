@@ -5,14 +5,22 @@ import yagmail
 from datetime import datetime, timedelta
 import logging
 import time
-import csv
-import unicodedata, re
-import glob
 import schedule
 from threading import Thread
 import traceback
 import sys
 
+from ingestao import (
+    CAP_ENDERECO, ESTOQUE_DETALHADO, EXTENSOES_TABELA, FORMATOS_DATA_AMPLOS, HISTORICO_TRANSACOES,
+    alinhar_categorias, converter_datas, eh_tabela, ler_publicado,
+    ler_relatorio, ler_tabela, listar_arquivos, mais_recente, publicar,
+    cruzar_saidas_cheias, detalhes_por_par, preparar_posicoes,
+    contar_analisadas, ja_analisadas, registrar_analisadas,
+    aplicar_movimentos, coletar_movimentos, instante_snapshot_publicado, ocupacao_antes_das_saidas,
+    ocupacao_inicial,
+    filtrar_blocos_recentes, ler_transacoes_em_blocos, mascara_transacoes_recentes,
+)
+
 def setup_logging():
     """Configura logging unificado"""
     log_dir = os.path.join(os.getcwd(), "logs")
@@ -47,79 +55,14 @@ def _find_onedrive_subfolder(subfolder_name: str):
 def encontrar_pasta_onedrive_empresa():
     return _find_onedrive_subfolder("Gestão de Estoque - Gestão_Auditoria")
 
-transacoes_analisadas = set()
-
-
-EXPECTED_COLS = [
-    "LOCAL_EXPEDICAO","COD_DEPOSITO","COD_ENDERECO","CHAVE_PALLET","VOLUME",
-    "COD_ITEM","DESC_ITEM","LOTE","UOM","DOCUMENTO",
-    "DATA_VALIDADE","DATA_ULTIMA_TRANSACAO","OCUPACAO",
-    "CAPACIDADE","DESCRICAO","QTDE_POR_PALLET","PALLET_COMPLETO","BLOCO","TIPO_ENDERECO",
-    "STATUS_PALLET","SHELF_ITEM","DATA_FABRICACAO","SHELF_ESTOQUE","DIAS_ESTOQUE","DIAS_VALIDADE","DATA_RELATORIO"
-]
-EXPECTED_COLS_TRANSACOES = [
-    "ID", "COD_CENTRO", "LOCAL_EXPEDICAO", "COD_DEPOSITO", "COD_ENDERECO", 
-    "COD_ITEM", "DESC_ITEM", "LOTE", "VOLUME", "UOM", 
-    "DATA_VALIDADE", "TIPO_MOVIMENTO", "CHAVE_PALLET", "MOTIVO", "CREATED_AT", "CRIADO_POR_LOGIN"
-]
-
-def _split_fix(parts, n):
-    if len(parts) > n:
-        head = parts[:n-1]
-        tail = ";".join(parts[n-1:])
-        return head + [tail]
-    elif len(parts) < n:
-        return parts + [""] * (n - len(parts))
-    return parts
-
-def _read_csv_transacoes_strict(path, encodings=("utf-8-sig", "utf-8", "latin1", "cp1252")):
-    last_exc = None
-    for enc in encodings:
-        try:
-            with open(path, "r", encoding=enc, errors="replace") as f:
-                lines = [ln.rstrip("\r\n") for ln in f if ln.strip()]
-            
-            log(f"Total de linhas lidas: {len(lines)}")
-            
-            header_idx = None
-            for i, ln in enumerate(lines):
-                parts = ln.split(";")
-                if ("ID" in parts) and ("COD_ITEM" in parts) and ("TIPO_MOVIMENTO" in parts):
-                    header_idx = i
-                    break
-            
-            if header_idx is None:
-                header_idx = 0
-                log("Header não encontrado, usando primeira linha")
+# IDs das saídas já alertadas, persistidos (ingestao.analisadas) entre reinícios
+CONSUMIDOR_ANALISADAS = "sistema_alerta"
 
-            header = _split_fix(lines[header_idx].split(";"), len(EXPECTED_COLS_TRANSACOES))
-            
-            rows = []
-            for ln in lines[header_idx+1:]:
-                parts = _split_fix(ln.split(";"), len(EXPECTED_COLS_TRANSACOES))
-                rows.append(parts)
-
-            df_out = pd.DataFrame(rows, columns=EXPECTED_COLS_TRANSACOES, dtype=str)
-            df_out.columns = [c.strip() for c in df_out.columns]
-            
-            for c in df_out.columns:
-                df_out[c] = df_out[c].ast(str).str.strip().str.replace('"', '').str.replace("'", "")
-            
-            log(f"CSV lido com sucesso usando encoding: {enc}")
-            return df_out
-            
-        except Exception as e:
-            log(f"Falha com encoding {enc}: {e}")
-            last_exc = e
-            continue
-    
-    raise last_exc if last_exc else RuntimeError("Falha ao ler CSV de transações com encodings testados.")
 
 def encontrar_arquivo_mais_recente(base_dir, padrao):
     try:
-        arquivos = glob.glob(os.path.join(base_dir, padrao))
-        if arquivos:
-            arquivo_mais_recente = max(arquivos, key=os.path.getmtime)
+        arquivo_mais_recente = mais_recente(base_dir, padrao)
+        if arquivo_mais_recente:
             log(f"Arquivo encontrado: {os.path.basename(arquivo_mais_recente)}")
             return arquivo_mais_recente
         return None
@@ -145,7 +88,7 @@ def encontrar_arquivo_transacoes(base_dir):
 def encontrar_arquivo_estoque_posicao(base_dir):
     log(f"Procurando arquivo estoque_posicao em: {base_dir}")
     
-    padroes = ['estoque_posicao_*.csv', 'estoque_posicao_*.xlsx']
+    padroes = [f'estoque_posicao_*{ext}' for ext in EXTENSOES_TABELA] + ['estoque_posicao_*.csv', 'estoque_posicao_*.xlsx']
     
     for padrao in padroes:
         arquivo = encontrar_arquivo_mais_recente(base_dir, padrao)
@@ -156,10 +99,15 @@ def encontrar_arquivo_estoque_posicao(base_dir):
     return None
 
 def ler_estoque_posicao(caminho_estoque):
+    return ler_publicado(caminho_estoque, _ler_estoque_posicao_arquivo)
+
+def _ler_estoque_posicao_arquivo(caminho_estoque):
     log(f"Lendo estoque_posicao de: {caminho_estoque}")
     
     try:
-        if caminho_estoque.lower().endswith('.csv'):
+        if eh_tabela(caminho_estoque):
+            df = ler_tabela(caminho_estoque)
+        elif caminho_estoque.lower().endswith('.csv'):
             df = pd.read_csv(caminho_estoque, sep=';', encoding='utf-8-sig', low_memory=False)
         else:
             df = pd.read_excel(caminho_estoque)
@@ -174,48 +122,34 @@ def ler_estoque_posicao(caminho_estoque):
         
         colunas_data = ['DATA_VALIDADE', 'DATA_PRIMEIRO_PALLET']
         for col in colunas_data:
-            if col in df.columns:
-                df[col] = pd.to_datetime(df[col], errors='coerce')
+            if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col]):
+                df[col] = converter_datas(df[col], FORMATOS_DATA_AMPLOS, chave=('estoque_posicao', col))
         
         return df
     except Exception as e:
         log(f"Erro ao ler estoque_posicao: {e}")
         return None
 
-def ler_transacoes(caminho_transacoes):
+def ler_transacoes(caminho_transacoes, colunas=None, motor=None):
     log(f"Lendo transações com método robusto de: {caminho_transacoes}")
-    
+
     try:
-        if caminho_transacoes.lower().endswith('.csv'):
-            transacoes_df = _read_csv_transacoes_strict(caminho_transacoes)
-        else:
-            transacoes_df = pd.read_excel(caminho_transacoes)
-            transacoes_df.columns = [col.strip().upper() for col in transacoes_df.columns]
-        
-        log(f"Transações lidas - Shape: {transacoes_df.shape}")
-        
-        if 'VOLUME' in transacoes_df.columns:
-            transacoes_df['VOLUME'] = (
-                transacoes_df['VOLUME']
-                .astype(str)
-                .str.replace(",", ".", regex=False)
-                .str.replace(r"[^0-9\.\-]", "", regex=True)
-            )
-            transacoes_df['VOLUME'] = pd.to_numeric(transacoes_df['VOLUME'], errors="coerce")
-        
-        colunas_data = ['DATA_VALIDADE', 'CREATED_AT']
-        for col in colunas_data:
-            if col in transacoes_df.columns:
-                transacoes_df[col] = pd.to_datetime(transacoes_df['CREATED_AT'], dayfirst=True, errors="coerce")
-        
-        return transacoes_df
+        return ler_relatorio(caminho_transacoes, HISTORICO_TRANSACOES, colunas=colunas, motor=motor)
     except Exception as e:
         log(f"Erro ao ler transações: {e}")
         return None
 
 def filtrar_transacoes_recentes(transacoes_df, horas_retroativas=1):
+    """Aceita um DataFrame ou um iterável de blocos (ver ler_transacoes_em_blocos).
+
+    Com blocos, só as linhas recentes de cada bloco ficam em memória."""
     log(f"Filtrando transações das últimas {horas_retroativas} hora(s) do dia atual")
-    
+
+    if not isinstance(transacoes_df, pd.DataFrame):
+        transacoes_recentes = filtrar_blocos_recentes(transacoes_df, horas_retroativas)
+        log(f"Transações das últimas {horas_retroativas} hora(s) do dia atual: {len(transacoes_recentes)}")
+        return transacoes_recentes
+
     try:
         if 'CREATED_AT' not in transacoes_df.columns:
             log("Coluna CREATED_AT não encontrada - usando todas as transações")
@@ -237,11 +171,7 @@ def filtrar_transacoes_recentes(transacoes_df, horas_retroativas=1):
         log(f"Data limite: {data_limite}")
         log(f"Data hoje (início do dia): {data_hoje}")
         
-        mascara_recentes = (
-            (transacoes_df['CREATED_AT'] >= data_limite) & 
-            (transacoes_df['CREATED_AT'] <= agora) &
-            (transacoes_df['CREATED_AT'] >= data_hoje)
-        )
+        mascara_recentes = mascara_transacoes_recentes(transacoes_df['CREATED_AT'], agora, horas_retroativas)
         
         transacoes_recentes = transacoes_df[mascara_recentes].copy()
         
@@ -270,109 +200,90 @@ def filtrar_enderecos_validos(transacoes_df):
     
     return transacoes_filtradas
 
-def analisar_risco_colmeia(transacoes_df, estoque_posicao):
+def analisar_risco_colmeia(transacoes_df, estoque_posicao, instante_snapshot=None, movimentos=None):
+    """Com `instante_snapshot` (momento do estoque_posicao) e `movimentos`
+    (ENTRADA/SAIDA posteriores a ele, ver coletar_movimentos), a origem
+    cheia é julgada pela ocupação viva antes de cada saída; sem eles, pelo
+    FLAG_CHEIO do snapshot."""
     log("=== INICIANDO ANÁLISE DE RISCO DE COLMEIA ===")
     
     alertas = []
-    global transacoes_analisadas
     
     transacoes_df = filtrar_enderecos_validos(transacoes_df)
-    saidas = transacoes_df[transacoes_df['TIPO_MOVIMENTO'].str.upper() == 'SAIDA']
+    saidas = transacoes_df[transacoes_df['TIPO_MOVIMENTO'] == 'SAIDA']
     log(f"Total de saídas encontradas: {len(saidas)}")
     
     if len(saidas) == 0:
         log("Nenhuma saída encontrada para análise")
         return alertas
     
-    saidas_novas = saidas[~saidas['ID'].astype(str).isin(transacoes_analisadas)]
-    log(f"Novas saídas para análise: {len(saidas_novas)}")
+    saidas_novas = saidas[~ja_analisadas(CONSUMIDOR_ANALISADAS, saidas['ID'])]
+    log(f"Novas saídas para análise: {len(saidas_novas)} "
+        f"(IDs já registrados: {contar_analisadas(CONSUMIDOR_ANALISADAS)})")
     
     if len(saidas_novas) == 0:
         log("Todas as saídas já foram analisadas anteriormente")
         return alertas
     
-    estoque_dict = {}
-    for _, row in estoque_posicao.iterrows():
-        chave = f"{row['COD_ENDERECO']}|{row['COD_ITEM']}|{row['DATA_VALIDADE'].strftime('%Y%m%d')}"
-        estoque_dict[chave] = {
-            'OCUPACAO': row['OCUPACAO'],
-            'CAPACIDADE': row['CAPACIDADE'],
-            'LIVRE': row['LIVRE'],
-            'FLAG_CHEIO': row.get('FLAG_CHEIO', 0)
-        }
-    
-    for idx, transacao in saidas_novas.iterrows():
+    posicoes = preparar_posicoes(estoque_posicao)
+    ocupacao_antes = None
+    if instante_snapshot is not None:
+        estado = ocupacao_inicial(posicoes, instante_snapshot)
+        aplicados = aplicar_movimentos(estado, pd.concat(movimentos, ignore_index=True)) if movimentos else 0
+        log(f"[OCUPACAO] {aplicados} movimento(s) aplicados; snapshot de {estado['desde']:%d/%m/%Y %H:%M:%S}")
+        ocupacao_antes = ocupacao_antes_das_saidas(estado, saidas_novas)
+    achados, detalhes = cruzar_saidas_cheias(saidas_novas, posicoes, ocupacao_antes=ocupacao_antes)
+    alternativas = detalhes_por_par(detalhes)
+    linhas = saidas_novas.iloc[achados['_SAIDA'].to_numpy()].to_dict('records')
+    
+    alertados = set()
+    for transacao, achado in zip(linhas, achados.to_dict('records')):
         try:
             transacao_id = str(transacao.get('ID', 'N/A'))
-            if transacao_id in transacoes_analisadas:
+            if transacao_id in alertados:
                 continue
-                
+            
             sku = transacao['COD_ITEM']
-            data_validade = transacao['DATA_VALIDADE']
-            volume = transacao['VOLUME']
             endereco_origem = transacao['COD_ENDERECO']
-            
-            if pd.isna(data_validade):
-                continue
-            
-            chave_origem = f"{endereco_origem}|{sku}|{data_validade.strftime('%Y%m%d')}"
-            info_origem = estoque_dict.get(chave_origem)
-            
-            if not info_origem:
-                continue
-            
-            estava_cheio_antes = info_origem['FLAG_CHEIO'] == 1
-            
-            if not estava_cheio_antes:
-                continue
-            
-            chave_sku_data = f"{sku}|{data_validade.strftime('%Y%m%d')}"
-            outros_enderecos = estoque_posicao[
-                (estoque_posicao['CHAVE_SKU_DATA'] == chave_sku_data) &
-                (estoque_posicao['COD_ENDERECO'] != endereco_origem)
-            ]
-            
-            if len(outros_enderecos) == 0:
-                continue
-            
-            enderecos_com_capacidade = outros_enderecos[outros_enderecos['LIVRE'] > 0]
-            
-            if len(enderecos_com_capacidade) > 0:
-                alerta = {
-                    'ID_TRANSACAO': transacao_id,
-                    'DATA_TRANSACAO': transacao.get('CREATED_AT', 'N/A'),
-                    'SKU': sku,
-                    'DESC_ITEM': transacao.get('DESC_ITEM', 'N/A'),
-                    'LOTE': transacao.get('LOTE', 'N/A'),
-                    'DATA_VALIDADE': data_validade,
-                    'VOLUME_MOVIMENTADO': volume,
-                    'ENDERECO_ORIGEM': endereco_origem,
-                    'TIPO_MOVIMENTO': transacao['TIPO_MOVIMENTO'],
-                    'MOTIVO': transacao.get('MOTIVO', 'N/A'),
-                    'ESTAVA_CHEIO': True,
-                    'OCUPACAO_ORIGEM': info_origem['OCUPACAO'],
-                    'CAPACIDADE_ORIGEM': info_origem['CAPACIDADE'],
-                    'OPORTUNIDADES_ENCONTRADAS': len(enderecos_com_capacidade),
-                    'DETALHES_OPORTUNIDADES': []
-                }
-                
-                for _, oportunidade in enderecos_com_capacidade.head(3).iterrows():
-                    alerta['DETALHES_OPORTUNIDADES'].append({
+            alerta = {
+                'ID_TRANSACAO': transacao_id,
+                'DATA_TRANSACAO': transacao.get('CREATED_AT', 'N/A'),
+                'SKU': sku,
+                'DESC_ITEM': transacao.get('DESC_ITEM', 'N/A'),
+                'LOTE': transacao.get('LOTE', 'N/A'),
+                'DATA_VALIDADE': transacao['DATA_VALIDADE'],
+                'VOLUME_MOVIMENTADO': transacao['VOLUME'],
+                'ENDERECO_ORIGEM': endereco_origem,
+                'TIPO_MOVIMENTO': transacao['TIPO_MOVIMENTO'],
+                'MOTIVO': transacao.get('MOTIVO', 'N/A'),
+                'ESTAVA_CHEIO': True,
+                'OCUPACAO_ORIGEM': achado['OCUPACAO_ORIGEM'],
+                'CAPACIDADE_ORIGEM': achado['CAPACIDADE_ORIGEM'],
+                'OPORTUNIDADES_ENCONTRADAS': achado['OPORTUNIDADES_ENCONTRADAS'],
+                'DETALHES_OPORTUNIDADES': [
+                    {
                         'ENDERECO_ALTERNATIVO': oportunidade['COD_ENDERECO'],
                         'BLOCO': oportunidade['BLOCO'],
                         'OCUPACAO_ATUAL': oportunidade['OCUPACAO'],
                         'CAPACIDADE': oportunidade['CAPACIDADE'],
                         'LIVRE': oportunidade['LIVRE']
-                    })
-                
-                alertas.append(alerta)
-                transacoes_analisadas.add(transacao_id)
-                log(f"Alerta de colmeia encontrado: {endereco_origem} -> SKU: {sku}")
-                
+                    }
+                    for oportunidade in alternativas[achado['_PAR']]
+                ]
+            }
+            
+            alertas.append(alerta)
+            alertados.add(transacao_id)
+            log(f"Alerta de colmeia encontrado: {endereco_origem} -> SKU: {sku}")
+            
         except Exception as e:
             log(f"Erro ao processar transação: {e}")
             continue
     
+    if alertas:
+        registrar_analisadas(
+            CONSUMIDOR_ANALISADAS, [a['ID_TRANSACAO'] for a in alertas], [a['DATA_TRANSACAO'] for a in alertas]
+        )
     log(f"Total de alertas de colmeia encontrados: {len(alertas)}")
     return alertas
 
@@ -418,9 +329,11 @@ def gerar_excel_alertas(relatorio, base_dir):
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         excel_path = os.path.join(base_dir, f"alertas_colmeia_{timestamp}.xlsx")
         
-        with pd.ExcelWriter(excel_path, engine='openpyxl') as writer:
-            df_excel.to_excel(writer, sheet_name='Todos_Alertas', index=False)
-        
+        def escrever(tmp):
+            with open(tmp, 'wb') as f, pd.ExcelWriter(f, engine='openpyxl') as writer:
+                df_excel.to_excel(writer, sheet_name='Todos_Alertas', index=False)
+
+        excel_path = publicar(excel_path, escrever, df_excel, chave='alertas_colmeia_execucao')
         log(f"Arquivo Excel gerado: {excel_path}")
         return excel_path
         
@@ -445,15 +358,27 @@ def executar_auditoria_transacoes():
             return
         
         estoque_posicao = ler_estoque_posicao(caminho_estoque)
-        transacoes_df = ler_transacoes(caminho_transacoes)
-        
-        if estoque_posicao is None or transacoes_df is None:
+        if estoque_posicao is None:
             log("Falha ao ler arquivos!")
             return
-        
-        transacoes_df = filtrar_enderecos_validos(transacoes_df)
-        transacoes_recentes = filtrar_transacoes_recentes(transacoes_df, horas_retroativas=1)
-        alertas = analisar_risco_colmeia(transacoes_recentes, estoque_posicao)
+
+        # ocupação viva: movimentos posteriores ao snapshot, na mesma leitura
+        instante_snapshot = instante_snapshot_publicado(caminho_estoque)
+        if instante_snapshot is None:
+            log("[OCUPACAO] estoque_posicao sem instante_snapshot no manifesto - origem cheia pelo FLAG_CHEIO")
+        movimentos = []
+        try:
+            blocos = ler_transacoes_em_blocos(caminho_transacoes)
+            if instante_snapshot is not None:
+                blocos = coletar_movimentos(blocos, instante_snapshot, movimentos)
+            transacoes_recentes = filtrar_transacoes_recentes(blocos, horas_retroativas=1)
+        except Exception as e:
+            log(f"Erro ao ler transações: {e}")
+            log("Falha ao ler arquivos!")
+            return
+
+        transacoes_recentes = filtrar_enderecos_validos(transacoes_recentes)
+        alertas = analisar_risco_colmeia(transacoes_recentes, estoque_posicao, instante_snapshot, movimentos)
         
         if alertas:
             relatorio = {
@@ -510,147 +435,28 @@ def enviar_email_alertas(relatorio, excel_path):
 
 
 
-def _canon(s: str) -> str:
-    s = unicodedata.normalize("NFKD", str(s)).encode("ascii","ignore").decode("ascii")
-    s = s.replace("-", " ").replace("_", " ")
-    s = re.sub(r"\s+", " ", s).strip().upper()
-    return s
-
-def _pick_col(df, candidatos):
-    cols = {c.strip().lower(): c for c in df.columns}
-    
-    for cand in candidatos:
-        k = cand.strip().lower()
-        if k in cols:
-            return cols[k]
-    
-    norm_cands = {cand.strip().lower().replace(" ", "_") for cand in candidatos}
-    for c in df.columns:
-        if c.strip().lower().replace(" ", "_") in norm_cands:
-            return c
-    
-    raise ValueError(f"Coluna não encontrada. Candidatos: {candidatos}")
-
-def _read_csv_strict_build_df(path, encodings=("utf-8-sig","utf-8","latin1","cp1252")):
-    last_exc = None
-    for enc in encodings:
-        try:
-            with open(path, "r", encoding=enc, errors="replace") as f:
-                lines = [ln.rstrip("\r\n") for ln in f if ln.strip()]
-            header_idx = None
-            for i, ln in enumerate(lines):
-                parts = ln.split(";")
-                if ("LOCAL_EXPEDICAO" in parts) and ("COD_ENDERECO" in parts):
-                    header_idx = i
-                    break
-            if header_idx is None:
-                header_idx = 0 
-
-            header = _split_fix(lines[header_idx].split(";"), len(EXPECTED_COLS))
-            use_cols = EXPECTED_COLS
-
-            rows = []
-            for ln in lines[header_idx+1:]:
-                parts = _split_fix(ln.split(";"), len(EXPECTED_COLS))
-                rows.append(parts)
-
-            df_out = pd.DataFrame(rows, columns=use_cols, dtype=str)
-            df_out.columns = [c.strip() for c in df_out.columns]
-            for c in df_out.columns:
-                df_out[c] = df_out[c].astype(str).str.strip().str.replace('"','').str.replace("'","")
-            return df_out
-        except Exception as e:
-            last_exc = e
-            continue
-    raise last_exc if last_exc else RuntimeError("Falha ao ler CSV com encodings testados.")
-
-def ler_csv_corretamente(csv_path):
-    df = _read_csv_strict_build_df(csv_path)
-    df.columns = [c.upper() for c in df.columns]
-
-    for col in ("DATA_VALIDADE","DATA_ULTIMA_TRANSACAO","DATA_FABRICACAO","DATA_RELATORIO"):
-        if col in df.columns:
-            try:
-                df[col] = pd.to_datetime(df[col], dayfirst=True, errors="coerce")
-            except Exception:
-                pass
-
-    for col in ("OCUPACAO","CAPACIDADE","QTDE_POR_PALLET","VOLUME","DIAS_ESTOQUE","DIAS_VALIDADE"):
-        if col in df.columns:
-            df[col] = (
-                df[col]
-                .astype(str)
-                .str.replace(",", ".", regex=False)
-                .str.replace(r"[^0-9\.\-]", "", regex=True)
-            )
-            df[col] = pd.to_numeric(df[col], errors="coerce")
-
-    return df
-
 def ler_estoque(estoque_path):
-    if estoque_path.lower().endswith('.csv'):
-        df = ler_csv_corretamente(estoque_path)
-    else:
-        df = pd.read_excel(estoque_path)
-
-    df.columns = [col.strip().upper() for col in df.columns]
-    
-    col_map = {
-        'BLOCO': ['BLOCO', 'BLOCO_ENDERECO', 'LOCAL'],
-        'COD_ENDERECO': ['COD_ENDERECO', 'ENDERECO', 'POSICAO'],
-        'COD_ITEM': ['COD_ITEM', 'SKU', 'ITEM', 'PRODUTO'],
-        'DATA_VALIDADE': ['DATA_VALIDADE', 'VALIDADE', 'DT_VALIDADE'],
-        'CHAVE_PALLET': ['CHAVE_PALLET', 'PALLET', 'LOTE'],
-        'DATA_ULTIMA_TRANSACAO': ['DATA_ULTIMA_TRANSACAO', 'DT_ULTIMA_TRANSACAO', 'ULTIMA_TRANSACAO']
-    }
-    
-    for new_col, old_cols in col_map.items():
-        try:
-            old_col = _pick_col(df, old_cols)
-            if old_col != new_col:
-                df.rename(columns={old_col: new_col}, inplace=True)
-        except ValueError:
-            pass
-    
-    return df
+    return ler_relatorio(estoque_path, ESTOQUE_DETALHADO)
 
 def ler_enderecos(enderecos_path):
-    if enderecos_path.lower().endswith('.csv'):
-        df = ler_csv_corretamente(enderecos_path)
-    else:
-        df = pd.read_excel(enderecos_path)
-    
-    df.columns = [col.strip().upper() for col in df.columns]
-    
-    col_map = {
-        'BLOCO': ['BLOCO', 'BLOCO_ENDERECO', 'LOCAL'],
-        'COD_ENDERECO': ['COD_ENDERECO', 'ENDERECO', 'POSICAO'],
-        'CAPACIDADE': ['CAPACIDADE', 'CAP', 'QTD_MAXIMA']
-    }
-    
-    for new_col, old_cols in col_map.items():
-        try:
-            old_col = _pick_col(df, old_cols)
-            if old_col != new_col:
-                df.rename(columns={old_col: new_col}, inplace=True)
-        except ValueError:
-            pass
-    
-    return df
+    return ler_relatorio(enderecos_path, CAP_ENDERECO)
 
 def criar_estoque_posicao(estoque_df, enderecos_df):
     estoque_df['DATA_VALIDADE'] = pd.to_datetime(estoque_df['DATA_VALIDADE'], dayfirst=True, errors='coerce')
     
     grupo_cols = ['BLOCO', 'COD_ENDERECO', 'COD_ITEM', 'DATA_VALIDADE']
-    estoque_agrupado = estoque_df.groupby(grupo_cols).agg(
+    estoque_agrupado = estoque_df.groupby(grupo_cols, observed=True).agg(
         OCUP_PALLETS=('CHAVE_PALLET', 'nunique')
     ).reset_index()
     
     estoque_agrupado.rename(columns={'OCUP_PALLETS': 'OCUPACAO'}, inplace=True)
     
+    estoque_agrupado, capacidades = alinhar_categorias(
+        estoque_agrupado, enderecos_df[['BLOCO', 'COD_ENDERECO', 'CAPACIDADE']], colunas=['BLOCO']
+    )
     estoque_posicao = pd.merge(
         estoque_agrupado,
-        enderecos_df[['BLOCO', 'COD_ENDERECO', 'CAPACIDADE']],
+        capacidades,
         on=['BLOCO', 'COD_ENDERECO'],
         how='left'
     )
@@ -695,7 +501,7 @@ def executar_auditoria_indicadores():
             log("Pasta do OneDrive não encontrada!")
             return
         
-        arquivos = os.listdir(fonte_dir)
+        arquivos = [a.nome for a in listar_arquivos(fonte_dir)]
         estoque_files = [f for f in arquivos if 'estoque_detalhado' in f.lower() and f.lower().endswith(('.csv','.xlsx','.xls'))]
         enderecos_files = [f for f in arquivos if 'cap_endereco' in f.lower() and f.lower().endswith(('.csv','.xlsx','.xls'))]
         
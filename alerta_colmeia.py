@@ -5,9 +5,12 @@ import yagmail
 from datetime import datetime
 import logging
 import time
-import csv
-import unicodedata, re
-import glob
+
+from ingestao import (
+    CAP_ENDERECO, ESTOQUE_DETALHADO, EXTENSAO_TABELA, EXTENSOES_TABELA, FORMATOS_DATA_AMPLOS,
+    alinhar_categorias, buscar, converter_datas, gravar_tabela, instante_do_snapshot, invalidar, ler_relatorio,
+    listar_arquivos, mascara_rotulos, pick_col, publicar,
+)
 
 def setup_logging():
     logging.basicConfig(
@@ -36,9 +39,10 @@ def _dump(df, name, index=False):
         log(f"[DEBUG] Exportado: {path} ({len(df)} linhas)")
     except Exception as e:
         log(f"[WARN] Falha ao exportar {name}: {e}")
-def limpar_relatorios_antigos(base_dir: str, padrao: str = "estoque_posicao_*.csv"):
+def limpar_relatorios_antigos(base_dir: str, padrao: str = "estoque_posicao_*.csv", manter=()):
     try:
-        arquivos_antigos = glob.glob(os.path.join(base_dir, padrao))
+        manter = {os.path.abspath(p) for p in manter if p}
+        arquivos_antigos = [a.caminho for a in buscar(base_dir, padrao) if os.path.abspath(a.caminho) not in manter]
         
         for arquivo in arquivos_antigos:
             try:
@@ -46,23 +50,18 @@ def limpar_relatorios_antigos(base_dir: str, padrao: str = "estoque_posicao_*.cs
                 log(f"[LIMPEZA] Arquivo antigo removido: {os.path.basename(arquivo)}")
             except Exception as e:
                 log(f"[LIMPEZA][ERRO] Falha ao remover {arquivo}: {e}")
+        if arquivos_antigos:
+            invalidar(base_dir)
         
         return len(arquivos_antigos)
     except Exception as e:
         log(f"[LIMPEZA][ERRO] Falha na limpeza de arquivos antigos: {e}")
         return 0
 def salvar_estoque_posicao_no_diretorio(base_dir: str, estoque_posicao: pd.DataFrame,
-                                         salvar_xlsx: bool = False) -> str:
-    
-    limpar_relatorios_antigos(base_dir, "estoque_posicao_*.csv")
-    if salvar_xlsx:
-        limpar_relatorios_antigos(base_dir, "estoque_posicao_*.xlsx")
+                                         salvar_csv: bool = True, salvar_xlsx: bool = False,
+                                         instante_snapshot=None) -> str:
     
-    df = estoque_posicao.copy()
-
-    for col in ("DATA_VALIDADE", "DATA_PRIMEIRO_PALLET"):
-        if col in df.columns:
-            df[col] = pd.to_datetime(df[col], errors="coerce").dt.strftime("%Y-%m-%d")
+    df = estoque_posicao
 
     col_prio = [
         "BLOCO","COD_ENDERECO","COD_ITEM","DATA_VALIDADE",
@@ -75,27 +74,58 @@ def salvar_estoque_posicao_no_diretorio(base_dir: str, estoque_posicao: pd.DataF
         "OCP_OCUPACAO_OTIMA_GLOBAL"
     ]
     cols_final = [c for c in col_prio if c in df.columns] + [c for c in df.columns if c not in col_prio]
-    df = df[cols_final]
+    df = df[cols_final].reset_index(drop=True)
 
     ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-    csv_path = os.path.join(base_dir, f"estoque_posicao_{ts}.csv")
+    tabela_path = os.path.join(base_dir, f"estoque_posicao_{ts}{EXTENSAO_TABELA}")
 
     try:
-        df.to_csv(csv_path, sep=";", index=False, encoding="utf-8-sig")
-        log(f"[EXPORT] estoque_posicao salvo em CSV: {csv_path}  (linhas: {len(df)})")
+        extras = {"instante_snapshot": instante_snapshot.isoformat(sep=" ")} if instante_snapshot else None
+        tabela_path = publicar(
+            tabela_path, lambda tmp: gravar_tabela(tmp, df, formato=EXTENSAO_TABELA), df,
+            chave="estoque_posicao", extras=extras,
+        )
+        log(f"[EXPORT] estoque_posicao salvo em: {tabela_path}  (linhas: {len(df)})")
+        for ext in EXTENSOES_TABELA:
+            limpar_relatorios_antigos(base_dir, f"estoque_posicao_*{ext}", manter=[tabela_path])
     except Exception as e:
-        log(f"[EXPORT][ERRO] Falha ao salvar CSV: {e}")
-        csv_path = ""
+        log(f"[EXPORT][ERRO] Falha ao salvar estoque_posicao: {e}")
+        tabela_path = ""
+
+    if not (salvar_csv or salvar_xlsx):
+        return tabela_path
+
+    planilha = df.copy()
+    for col in ("DATA_VALIDADE", "DATA_PRIMEIRO_PALLET"):
+        if col in planilha.columns:
+            planilha[col] = pd.to_datetime(planilha[col], errors="coerce").dt.strftime("%Y-%m-%d")
+
+    if salvar_csv:
+        try:
+            csv_path = os.path.join(base_dir, f"estoque_posicao_{ts}.csv")
+            csv_path = publicar(
+                csv_path, lambda tmp: planilha.to_csv(tmp, sep=";", index=False, encoding="utf-8-sig"), planilha,
+                chave="estoque_posicao_csv",
+            )
+            log(f"[EXPORT] estoque_posicao salvo em CSV: {csv_path}")
+            limpar_relatorios_antigos(base_dir, "estoque_posicao_*.csv", manter=[csv_path])
+        except Exception as e:
+            log(f"[EXPORT][ERRO] Falha ao salvar CSV: {e}")
 
     if salvar_xlsx:
+        def escrever_xlsx(tmp):
+            with open(tmp, "wb") as f:
+                planilha.to_excel(f, index=False, engine="openpyxl")
+
         try:
             xlsx_path = os.path.join(base_dir, f"estoque_posicao_{ts}.xlsx")
-            df.to_excel(xlsx_path, index=False)
+            xlsx_path = publicar(xlsx_path, escrever_xlsx, planilha, chave="estoque_posicao_xlsx")
             log(f"[EXPORT] estoque_posicao salvo em XLSX: {xlsx_path}")
+            limpar_relatorios_antigos(base_dir, "estoque_posicao_*.xlsx", manter=[xlsx_path])
         except Exception as e:
             log(f"[EXPORT][ERRO] Falha ao salvar XLSX: {e}")
 
-    return csv_path
+    return tabela_path
 
 
 def encontrar_pasta_onedrive_empresa():
@@ -114,100 +144,6 @@ def encontrar_pasta_onedrive_empresa():
     log("Pasta do OneDrive não encontrada!")
     return None
 
-EXPECTED_COLS = [
-    "LOCAL_EXPEDICAO","COD_DEPOSITO","COD_ENDERECO","CHAVE_PALLET","VOLUME",
-    "COD_ITEM","DESC_ITEM","LOTE","UOM","DOCUMENTO",
-    "DATA_VALIDADE","DATA_ULTIMA_TRANSACAO","OCUPACAO",
-    "CAPACIDADE","DESCRICAO","QTDE_POR_PALLET","PALLET_COMPLETO","BLOCO","TIPO_ENDERECO",
-    "STATUS_PALLET","SHELF_ITEM","DATA_FABRICACAO","SHELF_ESTOQUE","DIAS_ESTOQUE","DIAS_VALIDADE","DATA_RELATORIO"
-]
-
-def _split_fix(parts, n):
-    if len(parts) > n:
-        head = parts[:n-1]
-        tail = ";".join(parts[n-1:])
-        return head + [tail]
-    elif len(parts) < n:
-        return parts + [""] * (n - len(parts))
-    return parts
-
-def _read_csv_strict_build_df(path, encodings=("utf-8-sig","utf-8","latin1","cp1252")) -> pd.DataFrame:
-    last_exc = None
-    for enc in encodings:
-        try:
-            with open(path, "r", encoding=enc, errors="replace") as f:
-                lines = [ln.rstrip("\r\n") for ln in f if ln.strip()]
-            header_idx = None
-            for i, ln in enumerate(lines):
-                parts = ln.split(";")
-                if ("LOCAL_EXPEDICAO" in parts) and ("COD_ENDERECO" in parts):
-                    header_idx = i
-                    break
-            if header_idx is None:
-                header_idx = 0 
-
-            header = _split_fix(lines[header_idx].split(";"), len(EXPECTED_COLS))
-            use_cols = EXPECTED_COLS
-
-            rows = []
-            for ln in lines[header_idx+1:]:
-                parts = _split_fix(ln.split(";"), len(EXPECTED_COLS))
-                rows.append(parts)
-
-            df_out = pd.DataFrame(rows, columns=use_cols, dtype=str)
-            df_out.columns = [c.strip() for c in df_out.columns]
-            for c in df_out.columns:
-                df_out[c] = df_out[c].astype(str).str.strip().str.replace('"','').str.replace("'","")
-            return df_out
-        except Exception as e:
-            last_exc = e
-            continue
-    raise last_exc if last_exc else RuntimeError("Falha ao ler CSV com encodings testados.")
-
-def _pick_col(df, candidatos):
-    log(f"Procurando coluna entre candidatos: {candidatos}")
-    cols = {c.strip().lower(): c for c in df.columns}
-    
-    for cand in candidatos:
-        k = cand.strip().lower()
-        if k in cols:
-            log(f"Coluna encontrada: {cols[k]}")
-            return cols[k]
-    
-    norm_cands = {cand.strip().lower().replace(" ", "_") for cand in candidatos}
-    for c in df.columns:
-        if c.strip().lower().replace(" ", "_") in norm_cands:
-            log(f"Coluna encontrada (após normalização): {c}")
-            return c
-    
-    raise ValueError(f"Coluna não encontrada. Candidatos: {candidatos}")
-
-def ler_csv_corretamente(csv_path):
-    log(f"Processando arquivo (estrito): {os.path.basename(csv_path)}")
-    df = _read_csv_strict_build_df(csv_path)
-
-    df.columns = [c.upper() for c in df.columns]
-
-    for col in ("DATA_VALIDADE","DATA_ULTIMA_TRANSACAO","DATA_FABRICACAO","DATA_RELATORIO"):
-        if col in df.columns:
-            try:
-                df[col] = pd.to_datetime(df[col], dayfirst=True, errors="coerce")
-            except Exception:
-                pass
-
-    for col in ("OCUPACAO","CAPACIDADE","QTDE_POR_PALLET","VOLUME","DIAS_ESTOQUE","DIAS_VALIDADE"):
-        if col in df.columns:
-            df[col] = (
-                df[col]
-                .astype(str)
-                .str.replace(",", ".", regex=False)
-                .str.replace(r"[^0-9\.\-]", "", regex=True)
-            )
-            df[col] = pd.to_numeric(df[col], errors="coerce")
-
-    log(f"CSV lido (estrito) — Linhas: {len(df)}, Colunas: {list(df.columns)}")
-    return df
-
 def verificar_qualidade_dados(df, nome_arquivo):
     log(f"Verificando qualidade dos dados de {nome_arquivo}...")
     
@@ -234,7 +170,7 @@ def calcular_posicao_real_por_palete(estoque_df):
     log("Calculando Posicao_Real_Por_Palete...")
     
     try:
-        coluna_data_transacao = _pick_col(estoque_df, ['DATA_ULTIMA_TRANSACAO', 'DT_ULTIMA_TRANSACAO', 'ULTIMA_TRANSACAO', 'DATA_TRANSACAO'])
+        coluna_data_transacao = pick_col(estoque_df, ['DATA_ULTIMA_TRANSACAO', 'DT_ULTIMA_TRANSACAO', 'ULTIMA_TRANSACAO', 'DATA_TRANSACAO'])
         log(f"Coluna de data de transação encontrada: {coluna_data_transacao}")
     except ValueError:
         log("ERRO: Coluna de data da última transação não encontrada!")
@@ -242,41 +178,11 @@ def calcular_posicao_real_por_palete(estoque_df):
     
     log("Convertendo coluna de data para datetime preservando hora exata...")
     
-    formatos = [
-        '%d/%m/%Y %H:%M:%S',    # 20/08/2025 19:38:59
-        '%d/%m/%Y %H:%M',       # 20/08/2025 19:38
-        '%d/%m/%Y',             # 20/08/2025
-        '%Y-%m-%d %H:%M:%S',    # 2025-08-20 19:38:59
-        '%Y-%m-%d %H:%M',       # 2025-08-20 19:38
-        '%Y-%m-%d',             # 2025-08-20
-        '%m/%d/%Y %H:%M:%S',    # 08/20/2025 19:38:59 (formato US)
-        '%m/%d/%Y %H:%M',       # 08/20/2025 19:38 (formato US)
-        '%m/%d/%Y'              # 08/20/2025 (formato US)
-    ]
-    
-    data_convertida = None
-    for formato in formatos:
-        try:
-            data_convertida = pd.to_datetime(
-                estoque_df[coluna_data_transacao], 
-                format=formato,
-                errors='raise'
-            )
-            log(f"Formato identificado: {formato}")
-            break
-        except:
-            continue
-    
-    if data_convertida is None:
-        log("Inferindo formato automaticamente...")
-        data_convertida = pd.to_datetime(
-            estoque_df[coluna_data_transacao], 
-            infer_datetime_format=True,
-            dayfirst=True,  
-            errors='coerce'
-        )
-    
-    estoque_df[coluna_data_transacao] = data_convertida
+    estoque_df[coluna_data_transacao] = converter_datas(
+        estoque_df[coluna_data_transacao],
+        FORMATOS_DATA_AMPLOS,
+        chave=(ESTOQUE_DETALHADO.nome, coluna_data_transacao),
+    )
     
     nulos = estoque_df[coluna_data_transacao].isnull().sum()
     if nulos > 0:
@@ -345,56 +251,19 @@ def calcular_data_primeiro_palete(estoque_df):
     )
     log("Data_Primeiro_Palete calculada com sucesso")
     return estoque_df
-def _canon(s: str) -> str:
-    s = unicodedata.normalize("NFKD", str(s)).encode("ascii","ignore").decode("ascii")
-    s = s.replace("-", " ").replace("_", " ")
-    s = re.sub(r"\s+", " ", s).strip().upper()
-    return s
 def ler_estoque(estoque_path):
     log(f"Lendo arquivo de estoque: {estoque_path}")
-
-    if estoque_path.lower().endswith('.csv'):
-        df = ler_csv_corretamente(estoque_path)  
-    else:
-        log("Lendo arquivo Excel de estoque...")
-        df = pd.read_excel(estoque_path)
-
-    df.columns = [col.strip().upper() for col in df.columns]
+    df = ler_relatorio(estoque_path, ESTOQUE_DETALHADO)
     log(f"Colunas do estoque: {list(df.columns)}")
-    
-    col_map = {
-        'BLOCO': ['BLOCO', 'BLOCO_ENDERECO', 'LOCAL'],
-        'COD_ENDERECO': ['COD_ENDERECO', 'ENDERECO', 'POSICAO'],
-        'COD_ITEM': ['COD_ITEM', 'SKU', 'ITEM', 'PRODUTO'],
-        'DATA_VALIDADE': ['DATA_VALIDADE', 'VALIDADE', 'DT_VALIDADE'],
-        'CHAVE_PALLET': ['CHAVE_PALLET', 'PALLET', 'LOTE'],
-        'DATA_ULTIMA_TRANSACAO': ['DATA_ULTIMA_TRANSACAO', 'DT_ULTIMA_TRANSACAO', 'ULTIMA_TRANSACAO']
-    }
-    try:
-        col_tipo = _pick_col(df, ['TIPO_ENDERECO','TIPO ENDERECO','TIPO','TIPO_POSICAO'])
-        if col_tipo != 'TIPO_ENDERECO':
-            df.rename(columns={col_tipo: 'TIPO_ENDERECO'}, inplace=True)
-    except ValueError:
-        log("AVISO: coluna TIPO_ENDERECO não encontrada no estoque; não será aplicado filtro de tipo.")
-        col_tipo = None
 
-    if col_tipo:
+    if 'TIPO_ENDERECO' in df.columns:
         ALVOS = {"DINAMICO", "PUSH BACK", "PUSHBACK"}  
-        df['TIPO_ENDERECO_CANON'] = df['TIPO_ENDERECO'].map(_canon)
         antes = len(df)
-        df = df[df['TIPO_ENDERECO_CANON'].isin(ALVOS)].copy()
-        df.drop(columns=['TIPO_ENDERECO_CANON'], inplace=True)
+        df = df[mascara_rotulos(df['TIPO_ENDERECO'], ALVOS)].copy()
         log(f"Filtro de TIPO_ENDERECO aplicado (DINAMICO/PUSH BACK): {antes} -> {len(df)} linhas")
+    else:
+        log("AVISO: coluna TIPO_ENDERECO não encontrada no estoque; não será aplicado filtro de tipo.")
 
-    for new_col, old_cols in col_map.items():
-        try:
-            old_col = _pick_col(df, old_cols)
-            if old_col != new_col:
-                df.rename(columns={old_col: new_col}, inplace=True)
-                log(f"Coluna renomeada: {old_col} -> {new_col}")
-        except ValueError as e:
-            log(f"AVISO: {e}")
-    
     colunas_necessarias = ['BLOCO', 'COD_ENDERECO', 'COD_ITEM', 'DATA_VALIDADE', 'CHAVE_PALLET']
     colunas_faltantes = [col for col in colunas_necessarias if col not in df.columns]
     
@@ -407,31 +276,9 @@ def ler_estoque(estoque_path):
 
 def ler_enderecos(enderecos_path):
     log(f"Lendo arquivo de endereços: {enderecos_path}")
-    
-    if enderecos_path.lower().endswith('.csv'):
-        df = ler_csv_corretamente(enderecos_path)
-    else:
-        log("Lendo arquivo Excel de endereços...")
-        df = pd.read_excel(enderecos_path)
-    
-    df.columns = [col.strip().upper() for col in df.columns]
+    df = ler_relatorio(enderecos_path, CAP_ENDERECO)
     log(f"Colunas dos endereços: {list(df.columns)}")
     
-    col_map = {
-        'BLOCO': ['BLOCO', 'BLOCO_ENDERECO', 'LOCAL'],
-        'COD_ENDERECO': ['COD_ENDERECO', 'ENDERECO', 'POSICAO'],
-        'CAPACIDADE': ['CAPACIDADE', 'CAP', 'QTD_MAXIMA']
-    }
-    
-    for new_col, old_cols in col_map.items():
-        try:
-            old_col = _pick_col(df, old_cols)
-            if old_col != new_col:
-                df.rename(columns={old_col: new_col}, inplace=True)
-                log(f"Coluna renomeada: {old_col} -> {new_col}")
-        except ValueError as e:
-            log(f"AVISO: {e}")
-    
     colunas_necessarias = ['BLOCO', 'COD_ENDERECO', 'CAPACIDADE']
     colunas_faltantes = [col for col in colunas_necessarias if col not in df.columns]
     
@@ -452,7 +299,7 @@ def criar_estoque_posicao(estoque_df, enderecos_df):
     grupo_cols = ['BLOCO', 'COD_ENDERECO', 'COD_ITEM', 'DATA_VALIDADE']
     
     log("Agrupando dados de estoque...")
-    estoque_agrupado = estoque_df.groupby(grupo_cols).agg(
+    estoque_agrupado = estoque_df.groupby(grupo_cols, observed=True).agg(
         OCUP_PALLETS=('CHAVE_PALLET', 'nunique')
     ).reset_index()
     
@@ -460,9 +307,12 @@ def criar_estoque_posicao(estoque_df, enderecos_df):
     log(f"Estoque agrupado - {len(estoque_agrupado)} linhas")
     
     log("Mesclando com dados de capacidade...")
+    estoque_agrupado, capacidades = alinhar_categorias(
+        estoque_agrupado, enderecos_df[['BLOCO', 'COD_ENDERECO', 'CAPACIDADE']], colunas=['BLOCO']
+    )
     estoque_posicao = pd.merge(
         estoque_agrupado,
-        enderecos_df[['BLOCO', 'COD_ENDERECO', 'CAPACIDADE']],
+        capacidades,
         on=['BLOCO', 'COD_ENDERECO'],
         how='left'
     )
@@ -539,7 +389,7 @@ def habilitar_flags(estoque_posicao: pd.DataFrame) -> pd.DataFrame:
 
     estoque_posicao["HABILITA_ORIGEM_FRONT"] = (estoque_posicao["ISFRONT_RUASKU"] == 1).astype(int)
 
-    blocos_fg = estoque_posicao["BLOCO"].astype(str).str.upper().isin({"F", "G"})
+    blocos_fg = estoque_posicao["BLOCO"].isin({"F", "G"})
     cond_fg   = blocos_fg & (estoque_posicao["ISFRONT_RUASKU"] == 1) & (estoque_posicao["TOLERANCIA_5_DIAS"] == 1)
     cond_out  = (~blocos_fg) & (estoque_posicao["ISFRONT_RUASKU"] == 1)
     estoque_posicao["HABILITA_DESTINO_FRONT"] = (cond_fg | cond_out).astype(int)
@@ -549,12 +399,9 @@ def habilitar_flags(estoque_posicao: pd.DataFrame) -> pd.DataFrame:
         h_dest = int(estoque_posicao["HABILITA_DESTINO_FRONT"].sum())
         log(f"[FLAGS] Linhas: {total} | Origem=1: {h_orig} | Destino=1: {h_dest}")
 
-        fg = int(estoque_posicao["BLOCO"].astype(str).str.upper().isin({"F","G"}).sum())
+        fg = int(blocos_fg.sum())
 
-        cnt_tol_fg = int((
-            (estoque_posicao["TOLERANCIA_5_DIAS"] == 1)
-            & (estoque_posicao["BLOCO"].astype(str).str.upper().isin({"F","G"}))
-        ).sum())
+        cnt_tol_fg = int(((estoque_posicao["TOLERANCIA_5_DIAS"] == 1) & blocos_fg).sum())
 
         log(f"[FLAGS] Linhas em blocos F/G: {fg} | Tolerância=1 nesses blocos: {cnt_tol_fg}")
     except Exception:
@@ -718,13 +565,11 @@ def enviar_relatorio_email(assunto, corpo):
 def filtrar_enderecos_por_tipo(enderecos_df: pd.DataFrame) -> pd.DataFrame:
     alvo = {"DINAMICO", "MEZANINO", "PUSH BACK", "PUSHBACK"}
     try:
-        col_tipo = _pick_col(enderecos_df, ['TIPO_ENDERECO','TIPO ENDERECO','TIPO','TIPO_POSICAO'])
+        col_tipo = pick_col(enderecos_df, ['TIPO_ENDERECO','TIPO ENDERECO','TIPO','TIPO_POSICAO'])
         if col_tipo != 'TIPO_ENDERECO':
             enderecos_df = enderecos_df.rename(columns={col_tipo: 'TIPO_ENDERECO'})
-        enderecos_df['_TIPO_CANON'] = enderecos_df['TIPO_ENDERECO'].map(_canon)
         antes = len(enderecos_df)
-        enderecos_df = enderecos_df[enderecos_df['_TIPO_CANON'].isin(alvo)].copy()
-        enderecos_df.drop(columns=['_TIPO_CANON'], inplace=True)
+        enderecos_df = enderecos_df[mascara_rotulos(enderecos_df['TIPO_ENDERECO'], alvo)].copy()
         log(f"[ENDERECOS] Filtro TIPO_ENDERECO (DINAMICO/MEZANINO/PUSH BACK): {antes} -> {len(enderecos_df)} linhas")
         vc = enderecos_df['TIPO_ENDERECO'].astype(str).str.upper().value_counts().head(10)
         log(f"[ENDERECOS] Top tipos após filtro:\n{vc.to_string()}")
@@ -744,7 +589,7 @@ def main():
             log("Pasta do OneDrive não encontrada! Encerrando processo.")
             return
         
-        arquivos = os.listdir(fonte_dir)
+        arquivos = [a.nome for a in listar_arquivos(fonte_dir)]
         log(f"Arquivos encontrados na pasta: {arquivos}")
         
         estoque_files = [f for f in arquivos if 'estoque_detalhado' in f.lower() and f.lower().endswith(('.csv','.xlsx','.xls'))]
@@ -764,7 +609,11 @@ def main():
         estoque_path = os.path.join(fonte_dir, estoque_files[0])
         enderecos_path = os.path.join(fonte_dir, enderecos_files[0])
         
+        # mtime antes da leitura; o momento do snapshot (gravado junto do
+        # estoque_posicao) sai do DATA_RELATORIO, limitado por ele
+        mtime_estoque = datetime.fromtimestamp(os.path.getmtime(estoque_path))
         estoque_df = ler_estoque(estoque_path)
+        instante_snapshot = instante_do_snapshot(estoque_df, mtime_estoque)
         enderecos_df = ler_enderecos(enderecos_path)
         enderecos_df = filtrar_enderecos_por_tipo(enderecos_df)
         estoque_df = verificar_qualidade_dados(estoque_df, "estoque")
@@ -781,7 +630,9 @@ def main():
         estoque_posicao = calcular_ocupacao_otima_global(estoque_posicao)
 
         indicadores = calcular_indicadores(estoque_posicao, enderecos_df)
-        salvar_estoque_posicao_no_diretorio(fonte_dir, estoque_posicao, salvar_xlsx=True)  
+        salvar_estoque_posicao_no_diretorio(
+            fonte_dir, estoque_posicao, salvar_xlsx=True, instante_snapshot=instante_snapshot
+        )
 
         
         hora_atual = datetime.now().hour
@@ -3,7 +3,15 @@ import numpy as np
 from datetime import datetime, timedelta
 import logging
 import os
-import glob
+
+from ingestao import (
+    EXTENSOES_TABELA, FORMATOS_DATA_AMPLOS, HISTORICO_TRANSACOES,
+    converter_datas, eh_tabela, ler_publicado, ler_relatorio, ler_tabela,
+    mais_recente, publicar, cruzar_saidas_cheias, detalhes_por_par, preparar_posicoes,
+    aplicar_movimentos, coletar_movimentos, instante_snapshot_publicado, ocupacao_antes_das_saidas,
+    ocupacao_inicial,
+    filtrar_blocos_recentes, ler_transacoes_em_blocos, mascara_transacoes_recentes,
+)
 
 def setup_auditoria_logging():
     logging.basicConfig(
@@ -21,69 +29,10 @@ logger_auditoria = setup_auditoria_logging()
 def log_auditoria(mensagem):
     logger_auditoria.info(mensagem)
 
-EXPECTED_COLS_TRANSACOES = [
-    "ID", "COD_CENTRO", "LOCAL_EXPEDICAO", "COD_DEPOSITO", "COD_ENDERECO", 
-    "COD_ITEM", "DESC_ITEM", "LOTE", "VOLUME", "UOM", 
-    "DATA_VALIDADE", "TIPO_MOVIMENTO", "CHAVE_PALLET", "MOTIVO", "CREATED_AT", "CRIADO_POR_LOGIN"
-]
-
-def _split_fix(parts, n):
-    if len(parts) > n:
-        head = parts[:n-1]
-        tail = ";".join(parts[n-1:])
-        return head + [tail]
-    elif len(parts) < n:
-        return parts + [""] * (n - len(parts))
-    return parts
-
-def _read_csv_transacoes_strict(path, encodings=("utf-8-sig", "utf-8", "latin1", "cp1252")):
-    last_exc = None
-    for enc in encodings:
-        try:
-            with open(path, "r", encoding=enc, errors="replace") as f:
-                lines = [ln.rstrip("\r\n") for ln in f if ln.strip()]
-            
-            log_auditoria(f"Total de linhas lidas: {len(lines)}")
-            
-            header_idx = None
-            for i, ln in enumerate(lines):
-                parts = ln.split(";")
-                if ("ID" in parts) and ("COD_ITEM" in parts) and ("TIPO_MOVIMENTO" in parts):
-                    header_idx = i
-                    break
-            
-            if header_idx is None:
-                header_idx = 0
-                log_auditoria("Header não encontrado, usando primeira linha")
-
-            header = _split_fix(lines[header_idx].split(";"), len(EXPECTED_COLS_TRANSACOES))
-            
-            rows = []
-            for ln in lines[header_idx+1:]:
-                parts = _split_fix(ln.split(";"), len(EXPECTED_COLS_TRANSACOES))
-                rows.append(parts)
-
-            df_out = pd.DataFrame(rows, columns=EXPECTED_COLS_TRANSACOES, dtype=str)
-            df_out.columns = [c.strip() for c in df_out.columns]
-            
-            for c in df_out.columns:
-                df_out[c] = df_out[c].astype(str).str.strip().str.replace('"', '').str.replace("'", "")
-            
-            log_auditoria(f"CSV lido com sucesso usando encoding: {enc}")
-            return df_out
-            
-        except Exception as e:
-            log_auditoria(f"Falha com encoding {enc}: {e}")
-            last_exc = e
-            continue
-    
-    raise last_exc if last_exc else RuntimeError("Falha ao ler CSV de transações com encodings testados.")
-
 def encontrar_arquivo_mais_recente(base_dir, padrao):
     try:
-        arquivos = glob.glob(os.path.join(base_dir, padrao))
-        if arquivos:
-            arquivo_mais_recente = max(arquivos, key=os.path.getmtime)
+        arquivo_mais_recente = mais_recente(base_dir, padrao)
+        if arquivo_mais_recente:
             log_auditoria(f"Arquivo encontrado: {os.path.basename(arquivo_mais_recente)}")
             return arquivo_mais_recente
         return None
@@ -109,7 +58,7 @@ def encontrar_arquivo_transacoes(base_dir):
 def encontrar_arquivo_estoque_posicao(base_dir):
     log_auditoria(f"Procurando arquivo estoque_posicao em: {base_dir}")
     
-    padroes = ['estoque_posicao_*.csv', 'estoque_posicao_*.xlsx']
+    padroes = [f'estoque_posicao_*{ext}' for ext in EXTENSOES_TABELA] + ['estoque_posicao_*.csv', 'estoque_posicao_*.xlsx']
     
     for padrao in padroes:
         arquivo = encontrar_arquivo_mais_recente(base_dir, padrao)
@@ -120,10 +69,15 @@ def encontrar_arquivo_estoque_posicao(base_dir):
     return None
 
 def ler_estoque_posicao(caminho_estoque):
+    return ler_publicado(caminho_estoque, _ler_estoque_posicao_arquivo)
+
+def _ler_estoque_posicao_arquivo(caminho_estoque):
     log_auditoria(f"Lendo estoque_posicao de: {caminho_estoque}")
     
     try:
-        if caminho_estoque.lower().endswith('.csv'):
+        if eh_tabela(caminho_estoque):
+            df = ler_tabela(caminho_estoque)
+        elif caminho_estoque.lower().endswith('.csv'):
             df = pd.read_csv(caminho_estoque, sep=';', encoding='utf-8-sig', low_memory=False)
         else:
             df = pd.read_excel(caminho_estoque)
@@ -140,49 +94,34 @@ def ler_estoque_posicao(caminho_estoque):
         
         colunas_data = ['DATA_VALIDADE', 'DATA_PRIMEIRO_PALLET']
         for col in colunas_data:
-            if col in df.columns:
-                df[col] = pd.to_datetime(df[col], errors='coerce')
+            if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col]):
+                df[col] = converter_datas(df[col], FORMATOS_DATA_AMPLOS, chave=('estoque_posicao', col))
         
         return df
     except Exception as e:
         log_auditoria(f"Erro ao ler estoque_posicao: {e}")
         return None
 
-def ler_transacoes(caminho_transacoes):
+def ler_transacoes(caminho_transacoes, colunas=None, motor=None):
     log_auditoria(f"Lendo transações com método robusto de: {caminho_transacoes}")
-    
+
     try:
-        if caminho_transacoes.lower().endswith('.csv'):
-            transacoes_df = _read_csv_transacoes_strict(caminho_transacoes)
-        else:
-            transacoes_df = pd.read_excel(caminho_transacoes)
-            transacoes_df.columns = [col.strip().upper() for col in transacoes_df.columns]
-        
-        log_auditoria(f"Transações lidas - Shape: {transacoes_df.shape}")
-        log_auditoria(f"Colunas: {list(transacoes_df.columns)}")
-        
-        if 'VOLUME' in transacoes_df.columns:
-            transacoes_df['VOLUME'] = (
-                transacoes_df['VOLUME']
-                .astype(str)
-                .str.replace(",", ".", regex=False)
-                .str.replace(r"[^0-9\.\-]", "", regex=True)
-            )
-            transacoes_df['VOLUME'] = pd.to_numeric(transacoes_df['VOLUME'], errors="coerce")
-        
-        colunas_data = ['DATA_VALIDADE', 'CREATED_AT']
-        for col in colunas_data:
-            if col in transacoes_df.columns:
-                transacoes_df[col] = pd.to_datetime(transacoes_df[col], dayfirst=True, errors="coerce")
-        
-        return transacoes_df
+        return ler_relatorio(caminho_transacoes, HISTORICO_TRANSACOES, colunas=colunas, motor=motor)
     except Exception as e:
         log_auditoria(f"Erro ao ler transações: {e}")
         return None
 
 def filtrar_transacoes_recentes(transacoes_df, horas_retroativas=1):
+    """Aceita um DataFrame ou um iterável de blocos (ver ler_transacoes_em_blocos).
+
+    Com blocos, só as linhas recentes de cada bloco ficam em memória."""
     log_auditoria(f"Filtrando transações das últimas {horas_retroativas} hora(s) do dia atual")
-    
+
+    if not isinstance(transacoes_df, pd.DataFrame):
+        transacoes_recentes = filtrar_blocos_recentes(transacoes_df, horas_retroativas)
+        log_auditoria(f"Transações das últimas {horas_retroativas} hora(s) do dia atual: {len(transacoes_recentes)}")
+        return transacoes_recentes
+
     try:
         if 'CREATED_AT' not in transacoes_df.columns:
             log_auditoria("Coluna CREATED_AT não encontrada - usando todas as transações")
@@ -205,11 +144,7 @@ def filtrar_transacoes_recentes(transacoes_df, horas_retroativas=1):
         log_auditoria(f"Data limite: {data_limite}")
         log_auditoria(f"Data hoje (início do dia): {data_hoje}")
         
-        mascara_recentes = (
-            (transacoes_df['CREATED_AT'] >= data_limite) & 
-            (transacoes_df['CREATED_AT'] <= agora) &
-            (transacoes_df['CREATED_AT'] >= data_hoje)  
-        )
+        mascara_recentes = mascara_transacoes_recentes(transacoes_df['CREATED_AT'], agora, horas_retroativas)
         
         transacoes_recentes = transacoes_df[mascara_recentes].copy()
         
@@ -269,98 +204,69 @@ def filtrar_enderecos_validos(transacoes_df):
     
     return transacoes_filtradas
 
-def analisar_risco_colmeia(transacoes_df, estoque_posicao):
+def analisar_risco_colmeia(transacoes_df, estoque_posicao, instante_snapshot=None, movimentos=None):
+    """Com `instante_snapshot` (momento do estoque_posicao) e `movimentos`
+    (ENTRADA/SAIDA posteriores a ele, ver coletar_movimentos), a origem
+    cheia é julgada pela ocupação viva antes de cada saída; sem eles, pelo
+    FLAG_CHEIO do snapshot."""
     log_auditoria("=== INICIANDO ANÁLISE DE RISCO DE COLMEIA (VERSÃO OTIMIZADA) ===")
     
     alertas = []
     
     transacoes_df = filtrar_enderecos_validos(transacoes_df)
     
-    saidas = transacoes_df[transacoes_df['TIPO_MOVIMENTO'].str.upper() == 'SAIDA']
+    saidas = transacoes_df[transacoes_df['TIPO_MOVIMENTO'] == 'SAIDA']
     log_auditoria(f"Total de saídas encontradas: {len(saidas)}")
     
     if len(saidas) == 0:
         log_auditoria("Nenhuma saída encontrada para análise")
         return alertas
     
-    estoque_dict = {}
-    for _, row in estoque_posicao.iterrows():
-        chave = f"{row['COD_ENDERECO']}|{row['COD_ITEM']}|{row['DATA_VALIDADE'].strftime('%Y%m%d')}"
-        estoque_dict[chave] = {
-            'OCUPACAO': row['OCUPACAO'],
-            'CAPACIDADE': row['CAPACIDADE'],
-            'LIVRE': row['LIVRE'],
-            'FLAG_CHEIO': row.get('FLAG_CHEIO', 0)
-        }
-    
-    for idx, transacao in saidas.iterrows():
+    posicoes = preparar_posicoes(estoque_posicao)
+    ocupacao_antes = None
+    if instante_snapshot is not None:
+        estado = ocupacao_inicial(posicoes, instante_snapshot)
+        aplicados = aplicar_movimentos(estado, pd.concat(movimentos, ignore_index=True)) if movimentos else 0
+        log_auditoria(f"[OCUPACAO] {aplicados} movimento(s) aplicados; snapshot de {estado['desde']:%d/%m/%Y %H:%M:%S}")
+        ocupacao_antes = ocupacao_antes_das_saidas(estado, saidas)
+    achados, detalhes = cruzar_saidas_cheias(saidas, posicoes, ocupacao_antes=ocupacao_antes)
+    alternativas = detalhes_por_par(detalhes)
+    linhas = saidas.iloc[achados['_SAIDA'].to_numpy()].to_dict('records')
+    
+    for transacao, achado in zip(linhas, achados.to_dict('records')):
         try:
             sku = transacao['COD_ITEM']
-            data_validade = transacao['DATA_VALIDADE']
-            volume = transacao['VOLUME']
             endereco_origem = transacao['COD_ENDERECO']
-            
-            if pd.isna(data_validade):
-                continue
-            
-            chave_origem = f"{endereco_origem}|{sku}|{data_validade.strftime('%Y%m%d')}"
-            
-            info_origem = estoque_dict.get(chave_origem)
-            if not info_origem:
-                continue  
-            
-            estava_cheio_antes = info_origem['FLAG_CHEIO'] == 1
-            
-            if not estava_cheio_antes:
-                continue
-            
-            log_auditoria(f"Saída de endereço que estava CHEIO: {endereco_origem}, SKU: {sku}")
-            
-            chave_sku_data = f"{sku}|{data_validade.strftime('%Y%m%d')}"
-            
-            outros_enderecos = estoque_posicao[
-                (estoque_posicao['CHAVE_SKU_DATA'] == chave_sku_data) &
-                (estoque_posicao['COD_ENDERECO'] != endereco_origem)
-            ]
-            
-            if len(outros_enderecos) == 0:
-                continue  
-            
-            enderecos_com_capacidade = outros_enderecos[
-                outros_enderecos['LIVRE'] > 0
-            ]
-            
-            if len(enderecos_com_capacidade) > 0:
-                alerta = {
-                    'ID_TRANSACAO': transacao.get('ID', 'N/A'),
-                    'DATA_TRANSACAO': transacao.get('CREATED_AT', 'N/A'),
-                    'SKU': sku,
-                    'DESC_ITEM': transacao.get('DESC_ITEM', 'N/A'),
-                    'LOTE': transacao.get('LOTE', 'N/A'),
-                    'DATA_VALIDADE': data_validade,
-                    'VOLUME_MOVIMENTADO': volume,
-                    'ENDERECO_ORIGEM': endereco_origem,
-                    'TIPO_MOVIMENTO': transacao['TIPO_MOVIMENTO'],
-                    'MOTIVO': transacao.get('MOTIVO', 'N/A'),
-                    'ESTAVA_CHEIO': True,
-                    'OCUPACAO_ORIGEM': info_origem['OCUPACAO'],
-                    'CAPACIDADE_ORIGEM': info_origem['CAPACIDADE'],
-                    'OPORTUNIDADES_ENCONTRADAS': len(enderecos_com_capacidade),
-                    'DETALHES_OPORTUNIDADES': []
-                }
-                
-                for _, oportunidade in enderecos_com_capacidade.head(3).iterrows():
-                    alerta['DETALHES_OPORTUNIDADES'].append({
+            alerta = {
+                'ID_TRANSACAO': transacao.get('ID', 'N/A'),
+                'DATA_TRANSACAO': transacao.get('CREATED_AT', 'N/A'),
+                'SKU': sku,
+                'DESC_ITEM': transacao.get('DESC_ITEM', 'N/A'),
+                'LOTE': transacao.get('LOTE', 'N/A'),
+                'DATA_VALIDADE': transacao['DATA_VALIDADE'],
+                'VOLUME_MOVIMENTADO': transacao['VOLUME'],
+                'ENDERECO_ORIGEM': endereco_origem,
+                'TIPO_MOVIMENTO': transacao['TIPO_MOVIMENTO'],
+                'MOTIVO': transacao.get('MOTIVO', 'N/A'),
+                'ESTAVA_CHEIO': True,
+                'OCUPACAO_ORIGEM': achado['OCUPACAO_ORIGEM'],
+                'CAPACIDADE_ORIGEM': achado['CAPACIDADE_ORIGEM'],
+                'OPORTUNIDADES_ENCONTRADAS': achado['OPORTUNIDADES_ENCONTRADAS'],
+                'DETALHES_OPORTUNIDADES': [
+                    {
                         'ENDERECO_ALTERNATIVO': oportunidade['COD_ENDERECO'],
                         'BLOCO': oportunidade['BLOCO'],
                         'OCUPACAO_ATUAL': oportunidade['OCUPACAO'],
                         'CAPACIDADE': oportunidade['CAPACIDADE'],
                         'LIVRE': oportunidade['LIVRE'],
                         'TAXA_OCUPACAO': f"{oportunidade['OCUPACAO']/oportunidade['CAPACIDADE']*100:.1f}%"
-                    })
-                
-                alertas.append(alerta)
-                log_auditoria(f"Alerta de colmeia encontrado: {endereco_origem} -> SKU: {sku}")
+                    }
+                    for oportunidade in alternativas[achado['_PAR']]
+                ]
+            }
+            
+            alertas.append(alerta)
+            log_auditoria(f"Alerta de colmeia encontrado: {endereco_origem} -> SKU: {sku}")
                 
         except Exception as e:
             log_auditoria(f"Erro ao processar transação {transacao.get('ID', 'N/A')}: {e}")
@@ -481,6 +387,8 @@ def exibir_relatorio_final(relatorio):
 def executar_auditoria_colmeia(base_dir, estoque_posicao=None):
     log_auditoria("=== EXECUTANDO AUDITORIA DE RISCO DE COLMEIA ===")
     
+    # ocupação viva só com o estoque_posicao publicado (instante no manifesto)
+    instante_snapshot = None
     if estoque_posicao is None:
         caminho_estoque = encontrar_arquivo_estoque_posicao(base_dir)
         if not caminho_estoque:
@@ -489,25 +397,32 @@ def executar_auditoria_colmeia(base_dir, estoque_posicao=None):
         estoque_posicao = ler_estoque_posicao(caminho_estoque)
         if estoque_posicao is None:
             return None
+        instante_snapshot = instante_snapshot_publicado(caminho_estoque)
+    if instante_snapshot is None:
+        log_auditoria("[OCUPACAO] sem instante_snapshot do estoque_posicao - origem cheia pelo FLAG_CHEIO")
     
     caminho_transacoes = encontrar_arquivo_transacoes(base_dir)
     if not caminho_transacoes:
         log_auditoria("Arquivo de transações não encontrado!")
         return None
     
-    transacoes_df = ler_transacoes(caminho_transacoes)
-    if transacoes_df is None:
+    movimentos = []
+    try:
+        blocos = ler_transacoes_em_blocos(caminho_transacoes)
+        if instante_snapshot is not None:
+            blocos = coletar_movimentos(blocos, instante_snapshot, movimentos)
+        transacoes_recentes = filtrar_transacoes_recentes(blocos, horas_retroativas=1)
+    except Exception as e:
+        log_auditoria(f"Erro ao ler transações: {e}")
         return None
+
+    transacoes_recentes = filtrar_enderecos_validos(transacoes_recentes)
     
-    transacoes_df = filtrar_enderecos_validos(transacoes_df)
-    
-    transacoes_recentes = filtrar_transacoes_recentes(transacoes_df, horas_retroativas=1)
-    
-    alertas = analisar_risco_colmeia(transacoes_recentes, estoque_posicao)
+    alertas = analisar_risco_colmeia(transacoes_recentes, estoque_posicao, instante_snapshot, movimentos)
     relatorio = gerar_relatorio_alertas(alertas)
     
     if relatorio and relatorio['total_alertas'] > 0:
-        excel_path = gerar_excel_alertas(relatorio, base_dir, transacoes_df)
+        excel_path = gerar_excel_alertas(relatorio, base_dir, transacoes_recentes)
         if excel_path:
             log_auditoria(f"Relatório Excel salvo em: {excel_path}")
     
@@ -569,24 +484,28 @@ def gerar_excel_alertas(relatorio, base_dir, transacoes_df):
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         excel_path = os.path.join(base_dir, f"alertas_colmeia_{timestamp}.xlsx")
         
-        with pd.ExcelWriter(excel_path, engine='openpyxl') as writer:
-            df_excel.to_excel(writer, sheet_name='Todos_Alertas', index=False)
-            
-            resumo_sku = df_excel.groupby(['SKU', 'DESCRICAO_ITEM']).agg({
-                'VOLUME_RETIRADO': 'sum',
-                'OPORTUNIDADES_ENCONTRADAS': 'count',
-                'ENDERECO_RETIRADA': 'nunique'
-            }).reset_index()
-            resumo_sku.columns = ['SKU', 'DESCRICAO', 'VOLUME_TOTAL', 'QTD_ALERTAS', 'ENDERECOS_AFETADOS']
-            resumo_sku.to_excel(writer, sheet_name='Resumo_SKU', index=False)
-            
-            resumo_endereco = df_excel.groupby('ENDERECO_RETIRADA').agg({
-                'VOLUME_RETIRADO': 'sum',
-                'OPORTUNIDADES_ENCONTRADAS': 'count',
-                'SKU': 'nunique'
-            }).reset_index()
-            resumo_endereco.columns = ['ENDERECO', 'VOLUME_TOTAL', 'QTD_ALERTAS', 'SKUS_DIFERENTES']
-            resumo_endereco.to_excel(writer, sheet_name='Resumo_Endereco', index=False)
+        resumo_sku = df_excel.groupby(['SKU', 'DESCRICAO_ITEM']).agg({
+            'VOLUME_RETIRADO': 'sum',
+            'OPORTUNIDADES_ENCONTRADAS': 'count',
+            'ENDERECO_RETIRADA': 'nunique'
+        }).reset_index()
+        resumo_sku.columns = ['SKU', 'DESCRICAO', 'VOLUME_TOTAL', 'QTD_ALERTAS', 'ENDERECOS_AFETADOS']
+
+        resumo_endereco = df_excel.groupby('ENDERECO_RETIRADA').agg({
+            'VOLUME_RETIRADO': 'sum',
+            'OPORTUNIDADES_ENCONTRADAS': 'count',
+            'SKU': 'nunique'
+        }).reset_index()
+        resumo_endereco.columns = ['ENDERECO', 'VOLUME_TOTAL', 'QTD_ALERTAS', 'SKUS_DIFERENTES']
+
+        abas = {'Todos_Alertas': df_excel, 'Resumo_SKU': resumo_sku, 'Resumo_Endereco': resumo_endereco}
+
+        def escrever(tmp):
+            with open(tmp, 'wb') as f, pd.ExcelWriter(f, engine='openpyxl') as writer:
+                for aba, df in abas.items():
+                    df.to_excel(writer, sheet_name=aba, index=False)
+
+        excel_path = publicar(excel_path, escrever, abas, chave='alertas_oportunidade_execucao')
         
         log_auditoria(f"Arquivo Excel gerado: {excel_path}")
         log_auditoria(f"Total de alertas no Excel: {len(df_excel)}")
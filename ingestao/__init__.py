@@ -0,0 +1,205 @@
+"""Leitura tipada dos relatórios do SGR usados pelos scripts de auditoria.
+
+Cada relatório tem um Esquema (colunas, datas, números, aliases) e todos os
+scripts leem pelo mesmo caminho: ler_relatorio / ler_relatorio_em_blocos.
+O resultado tipado de cada arquivo fica em ingestao.cache (chave: caminho,
+tamanho, mtime e esquema). Os downloads do histórico de transações são
+acumulados por ID em ingestao.armazem (SQLite), junto com o estado da
+auditoria 24x7 por CHAVE_PALLETE; os alertas do dia, por
+ALERT_KEY, em ingestao.alertas, e os IDs de saídas já alertadas em
+ingestao.analisadas. Os artefatos gerados para a pasta do
+OneDrive saem por ingestao.publicacao (escrita atômica + manifesto); o
+estoque_posicao é publicado como tabela tipada (parquet/pickle). A busca
+de arquivos nas pastas usa o índice de ingestao.diretorio (os.scandir), e
+ingestao.colmeia cruza as saídas com o estoque_posicao (e com a ocupação
+viva, atualizada pelas transações desde o snapshot) para os alertas.
+"""
+from .alertas import (
+    DB_ALERTAS,
+    acumular_alertas,
+    contar_alertas,
+    gravar_xlsx_streaming,
+    ler_alertas,
+)
+from .analisadas import (
+    HORAS_RETENCAO_ANALISADAS,
+    contar_analisadas,
+    ja_analisadas,
+    registrar_analisadas,
+)
+from .armazem import (
+    COLUNAS_AUDITORIA,
+    DB_TRANSACOES,
+    chaves_alteradas,
+    chaves_auditadas,
+    contar_auditoria,
+    gravar_auditoria,
+    ler_auditoria,
+    consultar_transacoes,
+    gravar_marca,
+    ler_marca,
+    sincronizar_transacoes,
+    ultimo_lote,
+)
+from .caminhos import DIR_DADOS
+from .colmeia import (
+    DELTAS_MOVIMENTO,
+    MAX_DETALHES,
+    Oportunidades,
+    aplicar_movimentos,
+    coletar_movimentos,
+    cruzar_saidas_cheias,
+    decompor_enderecos,
+    detalhes_por_par,
+    distancias,
+    indexar_oportunidades,
+    instante_do_snapshot,
+    instante_snapshot_publicado,
+    ocupacao_antes_das_saidas,
+    ocupacao_inicial,
+    preparar_posicoes,
+)
+from .colunas import aplicar_aliases, canon, mascara_rotulos, pick_col
+from .conversores import (
+    alinhar_categorias,
+    converter_categoria,
+    converter_datas,
+    converter_numeros,
+    converter_texto,
+    tipar,
+)
+from .diretorio import INTERVALO_VARREDURA_S, Arquivo, buscar, invalidar, listar_arquivos, mais_recente
+from .esquemas import (
+    CAP_ENDERECO,
+    ESQUEMAS,
+    ESTOQUE_DETALHADO,
+    FORMATOS_DATA_AMPLOS,
+    FORMATOS_DATA_BR,
+    HISTORICO_TRANSACOES,
+    RASTREABILIDADE,
+    Esquema,
+)
+from .leitor import (
+    ENCODINGS_CSV,
+    MOTOR_CSV,
+    MOTOR_EXCEL,
+    TAMANHO_BLOCO,
+    concatenar_blocos,
+    filtrar_blocos_recentes,
+    iter_csv_estrito,
+    ler_csv_estrito,
+    ler_relatorio,
+    ler_relatorio_em_blocos,
+    ler_transacoes_em_blocos,
+    mascara_transacoes_recentes,
+)
+from .publicacao import (
+    EXTENSAO_TABELA,
+    EXTENSOES_TABELA,
+    MANIFESTO,
+    eh_tabela,
+    entrada_publicada,
+    fontes_alteradas,
+    gravar_atomico,
+    gravar_tabela,
+    hash_arquivo,
+    hash_conteudo,
+    impressao_fontes,
+    ler_manifesto,
+    ler_publicado,
+    ler_tabela,
+    publicar,
+    registrar_dependencias,
+)
+
+__all__ = [
+    "Esquema",
+    "ESQUEMAS",
+    "ESTOQUE_DETALHADO",
+    "HISTORICO_TRANSACOES",
+    "RASTREABILIDADE",
+    "CAP_ENDERECO",
+    "FORMATOS_DATA_BR",
+    "FORMATOS_DATA_AMPLOS",
+    "ENCODINGS_CSV",
+    "MOTOR_CSV",
+    "MOTOR_EXCEL",
+    "TAMANHO_BLOCO",
+    "iter_csv_estrito",
+    "ler_csv_estrito",
+    "ler_relatorio",
+    "ler_relatorio_em_blocos",
+    "ler_transacoes_em_blocos",
+    "mascara_transacoes_recentes",
+    "filtrar_blocos_recentes",
+    "tipar",
+    "converter_datas",
+    "converter_numeros",
+    "converter_categoria",
+    "converter_texto",
+    "alinhar_categorias",
+    "concatenar_blocos",
+    "canon",
+    "mascara_rotulos",
+    "pick_col",
+    "aplicar_aliases",
+    "DIR_DADOS",
+    "DB_TRANSACOES",
+    "sincronizar_transacoes",
+    "consultar_transacoes",
+    "chaves_alteradas",
+    "ultimo_lote",
+    "ler_marca",
+    "gravar_marca",
+    "COLUNAS_AUDITORIA",
+    "chaves_auditadas",
+    "contar_auditoria",
+    "gravar_auditoria",
+    "ler_auditoria",
+    "DB_ALERTAS",
+    "acumular_alertas",
+    "contar_alertas",
+    "ler_alertas",
+    "gravar_xlsx_streaming",
+    "HORAS_RETENCAO_ANALISADAS",
+    "ja_analisadas",
+    "registrar_analisadas",
+    "contar_analisadas",
+    "MANIFESTO",
+    "publicar",
+    "gravar_atomico",
+    "hash_conteudo",
+    "ler_manifesto",
+    "entrada_publicada",
+    "ler_publicado",
+    "EXTENSAO_TABELA",
+    "EXTENSOES_TABELA",
+    "gravar_tabela",
+    "ler_tabela",
+    "eh_tabela",
+    "hash_arquivo",
+    "impressao_fontes",
+    "fontes_alteradas",
+    "registrar_dependencias",
+    "Arquivo",
+    "INTERVALO_VARREDURA_S",
+    "listar_arquivos",
+    "buscar",
+    "mais_recente",
+    "invalidar",
+    "MAX_DETALHES",
+    "preparar_posicoes",
+    "indexar_oportunidades",
+    "Oportunidades",
+    "decompor_enderecos",
+    "distancias",
+    "cruzar_saidas_cheias",
+    "detalhes_por_par",
+    "DELTAS_MOVIMENTO",
+    "instante_do_snapshot",
+    "instante_snapshot_publicado",
+    "ocupacao_inicial",
+    "aplicar_movimentos",
+    "coletar_movimentos",
+    "ocupacao_antes_das_saidas",
+]
@@ -0,0 +1,89 @@
+import json
+import logging
+import os
+import sqlite3
+from contextlib import closing
+
+import pandas as pd
+from openpyxl import Workbook
+
+from .caminhos import DIR_DADOS
+
+logger = logging.getLogger(__name__)
+
+
+def log(mensagem):
+    logger.info(mensagem)
+
+
+DB_ALERTAS = os.path.join(DIR_DADOS, "alertas_colmeia.sqlite")
+DIAS_RETENCAO_ALERTAS = 30
+
+
+def _conectar(db_path):
+    con = sqlite3.connect(db_path, timeout=30)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=NORMAL")
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS alertas (
+            DIA TEXT NOT NULL, ALERT_KEY TEXT NOT NULL, DADOS TEXT NOT NULL,
+            PRIMARY KEY (DIA, ALERT_KEY)
+        )
+    """)
+    return con
+
+
+def _json_padrao(valor):
+    if hasattr(valor, "item"):
+        return valor.item()
+    return str(valor)
+
+
+def acumular_alertas(linhas, dia, db_path=None):
+    """Acrescenta as linhas de alerta (DataFrame com ALERT_KEY) ao dia.
+
+    Chave repetida no mesmo dia é ignorada, como o drop_duplicates
+    keep='first' da planilha acumulada. Dias mais antigos que
+    DIAS_RETENCAO_ALERTAS são apagados. Devolve (novos, total do dia)."""
+    linhas = linhas.copy()
+    linhas["ALERT_KEY"] = linhas["ALERT_KEY"].fillna("").astype(str)
+    registros = [
+        (dia, r["ALERT_KEY"], json.dumps(r, default=_json_padrao, ensure_ascii=False))
+        for r in linhas.to_dict("records")
+    ]
+    limite = (pd.Timestamp.now() - pd.Timedelta(days=DIAS_RETENCAO_ALERTAS)).strftime("%Y%m%d")
+
+    with closing(_conectar(db_path or DB_ALERTAS)) as con, con:
+        antes = con.total_changes
+        con.executemany("INSERT OR IGNORE INTO alertas (DIA, ALERT_KEY, DADOS) VALUES (?, ?, ?)", registros)
+        novos = con.total_changes - antes
+        con.execute("DELETE FROM alertas WHERE DIA < ?", (limite,))
+        total = con.execute("SELECT COUNT(*) FROM alertas WHERE DIA=?", (dia,)).fetchone()[0]
+    return novos, total
+
+
+def contar_alertas(dia, db_path=None):
+    with closing(_conectar(db_path or DB_ALERTAS)) as con:
+        return con.execute("SELECT COUNT(*) FROM alertas WHERE DIA=?", (dia,)).fetchone()[0]
+
+
+def ler_alertas(dia, db_path=None):
+    """Alertas do dia, na ordem em que foram acumulados."""
+    with closing(_conectar(db_path or DB_ALERTAS)) as con:
+        rows = con.execute("SELECT DADOS FROM alertas WHERE DIA=? ORDER BY rowid", (dia,)).fetchall()
+    return pd.DataFrame([json.loads(r[0]) for r in rows])
+
+
+def gravar_xlsx_streaming(path, abas):
+    """Grava {nome_aba: DataFrame} com o openpyxl em modo write-only.
+
+    As linhas vão direto para o arquivo, sem montar as células em memória;
+    NaN vira célula vazia."""
+    wb = Workbook(write_only=True)
+    for nome, df in abas.items():
+        ws = wb.create_sheet(title=nome)
+        ws.append([str(c) for c in df.columns])
+        valores = df.astype(object).where(df.notna(), None)
+        for linha in valores.itertuples(index=False, name=None):
+            ws.append(linha)
+    wb.save(path)
@@ -0,0 +1,145 @@
+import logging
+import sqlite3
+from contextlib import closing
+
+import numpy as np
+import pandas as pd
+
+from .alertas import DB_ALERTAS
+
+logger = logging.getLogger(__name__)
+
+
+def log(mensagem):
+    logger.info(mensagem)
+
+
+# IDs de transação já alertados, por consumidor (cada script tem o seu),
+# no mesmo SQLite dos alertas. Saem quando a transação fica mais antiga que
+# a retenção, que precisa cobrir a janela analisada (hoje: horas do dia atual).
+HORAS_RETENCAO_ANALISADAS = 24
+_FORMATO_ISO = "%Y-%m-%d %H:%M:%S"
+
+# filtro de Bloom em memória na frente do SQLite: "não está" sem consulta;
+# só os possíveis positivos vão ao banco. Tamanho fixo, refeito do banco
+# quando IDs são removidos.
+USAR_BLOOM = True
+BLOOM_BITS = 1 << 22
+BLOOM_HASHES = 4
+
+# (caminho do banco, consumidor) -> array de bits
+_blooms = {}
+
+
+def _conectar(db_path):
+    con = sqlite3.connect(db_path, timeout=30)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=NORMAL")
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS transacoes_analisadas (
+            CONSUMIDOR TEXT NOT NULL, ID TEXT NOT NULL,
+            CRIADO_EM TEXT, REGISTRADO_EM TEXT NOT NULL,
+            PRIMARY KEY (CONSUMIDOR, ID)
+        )
+    """)
+    return con
+
+
+def _textos(ids):
+    return pd.Series(ids, dtype=object).astype(str).to_numpy(dtype=object)
+
+
+def _bits(ids):
+    """Posições no filtro de cada ID (BLOOM_HASHES x len(ids)), por hashing
+    duplo sobre dois hashes vetorizados do pandas."""
+    h1 = pd.util.hash_array(ids)
+    h2 = pd.util.hash_array(ids, hash_key="colmeia-bloom-02") | np.uint64(1)
+    i = np.arange(BLOOM_HASHES, dtype=np.uint64)[:, None]
+    return ((h1 + i * h2) % np.uint64(BLOOM_BITS)).astype(np.int64)
+
+
+def _bloom(con, db_path, consumidor):
+    chave = (db_path, consumidor)
+    bits = _blooms.get(chave)
+    if bits is None:
+        ids = np.array(
+            [r[0] for r in con.execute("SELECT ID FROM transacoes_analisadas WHERE CONSUMIDOR=?", (consumidor,))],
+            dtype=object,
+        )
+        bits = np.zeros(BLOOM_BITS, dtype=bool)
+        if len(ids):
+            bits[_bits(ids).ravel()] = True
+        _blooms[chave] = bits
+    return bits
+
+
+def _no_banco(con, consumidor, ids):
+    con.execute("CREATE TEMP TABLE IF NOT EXISTS ids_consulta (ID TEXT PRIMARY KEY)")
+    con.execute("DELETE FROM ids_consulta")
+    con.executemany("INSERT OR IGNORE INTO ids_consulta VALUES (?)", ((i,) for i in ids))
+    return {r[0] for r in con.execute(
+        "SELECT ID FROM transacoes_analisadas WHERE CONSUMIDOR=? AND ID IN (SELECT ID FROM ids_consulta)",
+        (consumidor,),
+    )}
+
+
+def ja_analisadas(consumidor, ids, db_path=None, usar_bloom=USAR_BLOOM):
+    """Máscara booleana (alinhada com `ids`) dos IDs já registrados para o
+    consumidor. Com o filtro de Bloom, só os possíveis positivos são
+    conferidos no SQLite."""
+    db_path = db_path or DB_ALERTAS
+    ids = _textos(ids)
+    if len(ids) == 0:
+        return np.zeros(0, dtype=bool)
+    distintos = pd.unique(ids)
+    with closing(_conectar(db_path)) as con:
+        if usar_bloom:
+            distintos = distintos[_bloom(con, db_path, consumidor)[_bits(distintos)].all(axis=0)]
+        encontrados = _no_banco(con, consumidor, distintos) if len(distintos) else set()
+    return pd.Series(ids).isin(encontrados).to_numpy()
+
+
+def registrar_analisadas(consumidor, ids, criados_em=None, db_path=None):
+    """Registra os IDs (com o CREATED_AT da transação, se informado) e apaga
+    os do consumidor mais antigos que HORAS_RETENCAO_ANALISADAS. ID repetido
+    é ignorado. Devolve (novos, removidos)."""
+    db_path = db_path or DB_ALERTAS
+    ids = _textos(ids)
+    agora = pd.Timestamp.now()
+    if criados_em is None:
+        criados = [None] * len(ids)
+    else:
+        criados = pd.to_datetime(pd.Series(criados_em, dtype=object), errors="coerce").dt.strftime(_FORMATO_ISO)
+        criados = criados.astype(object).where(criados.notna(), None).tolist()
+    registrado = agora.strftime(_FORMATO_ISO)
+    limite = (agora - pd.Timedelta(hours=HORAS_RETENCAO_ANALISADAS)).strftime(_FORMATO_ISO)
+
+    with closing(_conectar(db_path)) as con, con:
+        antes = con.total_changes
+        con.executemany(
+            "INSERT OR IGNORE INTO transacoes_analisadas (CONSUMIDOR, ID, CRIADO_EM, REGISTRADO_EM) VALUES (?, ?, ?, ?)",
+            ((consumidor, i, c, registrado) for i, c in zip(ids, criados)),
+        )
+        novos = con.total_changes - antes
+        antes = con.total_changes
+        con.execute(
+            "DELETE FROM transacoes_analisadas WHERE CONSUMIDOR=? AND COALESCE(CRIADO_EM, REGISTRADO_EM) < ?",
+            (consumidor, limite),
+        )
+        removidos = con.total_changes - antes
+
+    chave = (db_path, consumidor)
+    if removidos:
+        # o filtro não remove; é refeito do banco na próxima consulta
+        _blooms.pop(chave, None)
+        log(f"[ANALISADAS] {consumidor}: {removidos} ID(s) fora da retenção removidos")
+    elif chave in _blooms and len(ids):
+        _blooms[chave][_bits(ids).ravel()] = True
+    return novos, removidos
+
+
+def contar_analisadas(consumidor, db_path=None):
+    with closing(_conectar(db_path or DB_ALERTAS)) as con:
+        return con.execute(
+            "SELECT COUNT(*) FROM transacoes_analisadas WHERE CONSUMIDOR=?", (consumidor,)
+        ).fetchone()[0]
@@ -0,0 +1,274 @@
+import logging
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+import pandas as pd
+
+from .caminhos import DIR_DADOS
+from .conversores import converter_categoria
+from .esquemas import HISTORICO_TRANSACOES
+from .leitor import ler_relatorio_em_blocos
+
+logger = logging.getLogger(__name__)
+
+
+def log(mensagem):
+    logger.info(mensagem)
+
+
+DB_TRANSACOES = os.path.join(DIR_DADOS, "historico_transacoes.sqlite")
+DIAS_RETENCAO = 45
+
+COLUNAS = list(HISTORICO_TRANSACOES.colunas)
+_DATAS = [c for c in COLUNAS if c in HISTORICO_TRANSACOES.datas]
+_NUMEROS = [c for c in COLUNAS if c in HISTORICO_TRANSACOES.numeros]
+_FORMATO_ISO = "%Y-%m-%d %H:%M:%S"
+
+
+def _conectar(db_path):
+    con = sqlite3.connect(db_path, timeout=30)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=NORMAL")
+    tipos = {c: ("REAL" if c in _NUMEROS else "TEXT") for c in COLUNAS}
+    colunas_sql = ", ".join(f"{c} {tipos[c]}" for c in COLUNAS if c != "ID")
+    con.executescript(f"""
+        CREATE TABLE IF NOT EXISTS transacoes (
+            ID TEXT PRIMARY KEY, {colunas_sql}, LOTE_CARGA INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS ix_transacoes_created ON transacoes (CREATED_AT);
+        CREATE INDEX IF NOT EXISTS ix_transacoes_chave ON transacoes (CHAVE_PALLET);
+        CREATE INDEX IF NOT EXISTS ix_transacoes_lote ON transacoes (LOTE_CARGA);
+        CREATE TABLE IF NOT EXISTS cargas (
+            LOTE_CARGA INTEGER PRIMARY KEY AUTOINCREMENT,
+            ARQUIVO TEXT, TAMANHO INTEGER, MTIME_NS INTEGER,
+            LINHAS INTEGER, ALTERADAS INTEGER, CARREGADO_EM TEXT
+        );
+        CREATE TABLE IF NOT EXISTS marcas (CONSUMIDOR TEXT PRIMARY KEY, LOTE_CARGA INTEGER);
+        CREATE TABLE IF NOT EXISTS auditoria (
+            CHAVE_PALLETE TEXT PRIMARY KEY, STATUS TEXT, CREATED_AT_ULTIMO TEXT,
+            TIPO_MOVIMENTO_ULTIMO TEXT, MOTIVO_ULTIMO TEXT, TEM_REMESSA_SAIDA INTEGER
+        );
+    """)
+    return con
+
+
+def _linhas_sql(bloco):
+    """Converte um bloco tipado em tuplas (ID primeiro) prontas para o SQLite."""
+    df = pd.DataFrame(index=bloco.index)
+    for c in COLUNAS:
+        if c not in bloco.columns:
+            df[c] = None
+        elif c in _DATAS:
+            df[c] = bloco[c].dt.strftime(_FORMATO_ISO)
+        else:
+            df[c] = bloco[c]
+    df["ID"] = df["ID"].astype(str).str.strip()
+    df = df[~df["ID"].isin(("", "nan", "None"))]
+    df = df.astype(object).where(df.notna(), None)
+    return list(df.itertuples(index=False, name=None))
+
+
+def sincronizar_transacoes(caminho, db_path=None):
+    """Faz o upsert (chave ID) de um download do histórico no armazém local.
+
+    O mesmo arquivo (caminho, tamanho, mtime) só é carregado uma vez. Cada
+    carga ganha um LOTE_CARGA; só linhas novas ou com algum campo diferente
+    recebem o lote novo, então `consultar_transacoes(apos_lote=...)` devolve
+    apenas o que mudou desde a marca do consumidor. Linhas com CREATED_AT
+    mais antigo que DIAS_RETENCAO são descartadas. Devolve o último lote."""
+    db_path = db_path or DB_TRANSACOES
+    st = os.stat(caminho)
+    arquivo = os.path.abspath(caminho)
+
+    with closing(_conectar(db_path)) as con:
+        ja = con.execute(
+            "SELECT LOTE_CARGA FROM cargas WHERE ARQUIVO=? AND TAMANHO=? AND MTIME_NS=?",
+            (arquivo, st.st_size, st.st_mtime_ns),
+        ).fetchone()
+        if ja:
+            log(f"[ARMAZEM] {os.path.basename(caminho)} já carregado (lote {ja[0]})")
+            return ultimo_lote(db_path)
+
+        inicio = time.time()
+        with con:
+            lote = con.execute(
+                "INSERT INTO cargas (ARQUIVO, TAMANHO, MTIME_NS, CARREGADO_EM) VALUES (?, ?, ?, ?)",
+                (arquivo, st.st_size, st.st_mtime_ns, time.strftime(_FORMATO_ISO)),
+            ).lastrowid
+
+            outras = [c for c in COLUNAS if c != "ID"]
+            sql = (
+                f"INSERT INTO transacoes ({', '.join(COLUNAS)}, LOTE_CARGA) "
+                f"VALUES ({', '.join('?' * len(COLUNAS))}, {lote}) "
+                f"ON CONFLICT(ID) DO UPDATE SET "
+                + ", ".join(f"{c}=excluded.{c}" for c in outras)
+                + ", LOTE_CARGA=excluded.LOTE_CARGA WHERE "
+                + " OR ".join(f"transacoes.{c} IS NOT excluded.{c}" for c in outras)
+            )
+            linhas = 0
+            alteradas = 0
+            for bloco in ler_relatorio_em_blocos(caminho, HISTORICO_TRANSACOES):
+                tuplas = _linhas_sql(bloco)
+                antes = con.total_changes
+                con.executemany(sql, tuplas)
+                alteradas += con.total_changes - antes
+                linhas += len(tuplas)
+
+            limite = (pd.Timestamp.now() - pd.Timedelta(days=DIAS_RETENCAO)).strftime(_FORMATO_ISO)
+            removidas = con.execute("DELETE FROM transacoes WHERE CREATED_AT < ?", (limite,)).rowcount
+            con.execute(
+                "UPDATE cargas SET LINHAS=?, ALTERADAS=? WHERE LOTE_CARGA=?",
+                (linhas, alteradas, lote),
+            )
+
+        log(f"[ARMAZEM] {os.path.basename(caminho)} carregado no lote {lote}: {linhas} linhas, "
+            f"{alteradas} novas/alteradas, {removidas} expiradas em {time.time() - inicio:.2f} segundos")
+        return lote
+
+
+def ultimo_lote(db_path=None):
+    with closing(_conectar(db_path or DB_TRANSACOES)) as con:
+        return con.execute("SELECT COALESCE(MAX(LOTE_CARGA), 0) FROM cargas").fetchone()[0]
+
+
+def ler_marca(consumidor, db_path=None):
+    """Último lote já processado pelo consumidor (0 se nunca rodou)."""
+    with closing(_conectar(db_path or DB_TRANSACOES)) as con:
+        row = con.execute("SELECT LOTE_CARGA FROM marcas WHERE CONSUMIDOR=?", (consumidor,)).fetchone()
+        return row[0] if row else 0
+
+
+def gravar_marca(consumidor, lote, db_path=None):
+    with closing(_conectar(db_path or DB_TRANSACOES)) as con, con:
+        con.execute(
+            "INSERT INTO marcas (CONSUMIDOR, LOTE_CARGA) VALUES (?, ?) "
+            "ON CONFLICT(CONSUMIDOR) DO UPDATE SET LOTE_CARGA=excluded.LOTE_CARGA",
+            (consumidor, int(lote)),
+        )
+
+
+def consultar_transacoes(desde=None, apos_lote=None, chaves=None, db_path=None):
+    """Transações do armazém como DataFrame tipado (mesmas colunas do esquema).
+
+    desde: só CREATED_AT >= desde; apos_lote: só linhas com LOTE_CARGA maior
+    (novas/alteradas depois da marca); chaves: só esses CHAVE_PALLET."""
+    filtros, params = [], []
+    if desde is not None:
+        filtros.append("CREATED_AT >= ?")
+        params.append(pd.Timestamp(desde).strftime(_FORMATO_ISO))
+    if apos_lote is not None:
+        filtros.append("LOTE_CARGA > ?")
+        params.append(int(apos_lote))
+
+    with closing(_conectar(db_path or DB_TRANSACOES)) as con:
+        if chaves is not None:
+            con.execute("CREATE TEMP TABLE IF NOT EXISTS chaves_consulta (CHAVE TEXT PRIMARY KEY)")
+            con.execute("DELETE FROM chaves_consulta")
+            con.executemany("INSERT OR IGNORE INTO chaves_consulta VALUES (?)", ((str(c),) for c in chaves))
+            filtros.append("CHAVE_PALLET IN (SELECT CHAVE FROM chaves_consulta)")
+
+        where = f" WHERE {' AND '.join(filtros)}" if filtros else ""
+        df = pd.read_sql_query(f"SELECT {', '.join(COLUNAS)} FROM transacoes{where}", con, params=params)
+
+    for c in _DATAS:
+        df[c] = pd.to_datetime(df[c], format=_FORMATO_ISO, errors="coerce").astype("datetime64[ns]")
+    for c in _NUMEROS:
+        df[c] = pd.to_numeric(df[c], errors="coerce")
+    for c in COLUNAS:
+        if c not in _DATAS and c not in _NUMEROS:
+            df[c] = df[c].fillna("")
+    for c in HISTORICO_TRANSACOES.categorias:
+        df[c] = converter_categoria(df[c])
+    return df
+
+
+def chaves_alteradas(apos_lote, db_path=None):
+    """CHAVE_PALLET distintas com linhas novas/alteradas depois de `apos_lote`."""
+    with closing(_conectar(db_path or DB_TRANSACOES)) as con:
+        rows = con.execute(
+            "SELECT DISTINCT CHAVE_PALLET FROM transacoes WHERE LOTE_CARGA > ?", (int(apos_lote),)
+        ).fetchall()
+    return {r[0] for r in rows if r[0]}
+
+
+COLUNAS_AUDITORIA = [
+    "chave_pallete", "status", "created_at_ultimo",
+    "TIPO_MOVIMENTO_ULTIMO", "MOTIVO_ULTIMO", "tem_remessa_saida",
+]
+
+
+def _linhas_auditoria(df):
+    df = df[COLUNAS_AUDITORIA].copy()
+    df["chave_pallete"] = df["chave_pallete"].astype(str).str.strip()
+    df["created_at_ultimo"] = pd.to_datetime(df["created_at_ultimo"], errors="coerce").dt.strftime(_FORMATO_ISO)
+    df["tem_remessa_saida"] = df["tem_remessa_saida"].map(
+        lambda v: None if pd.isna(v) else int(str(v).strip().upper() in ("TRUE", "1", "1.0"))
+    )
+    df = df.astype(object).where(df.notna(), None)
+    return list(df.itertuples(index=False, name=None))
+
+
+def contar_auditoria(db_path=None):
+    with closing(_conectar(db_path or DB_TRANSACOES)) as con:
+        return con.execute("SELECT COUNT(*) FROM auditoria").fetchone()[0]
+
+
+def _auditadas(con, chaves):
+    if chaves is None:
+        return {r[0] for r in con.execute("SELECT CHAVE_PALLETE FROM auditoria")}
+    con.execute("CREATE TEMP TABLE IF NOT EXISTS chaves_auditoria (CHAVE TEXT PRIMARY KEY)")
+    con.execute("DELETE FROM chaves_auditoria")
+    con.executemany("INSERT OR IGNORE INTO chaves_auditoria VALUES (?)", ((str(c),) for c in chaves))
+    return {r[0] for r in con.execute(
+        "SELECT CHAVE_PALLETE FROM auditoria WHERE CHAVE_PALLETE IN (SELECT CHAVE FROM chaves_auditoria)"
+    )}
+
+
+def chaves_auditadas(chaves=None, db_path=None):
+    """CHAVE_PALLETE já presentes no estado da auditoria 24x7 (só entre
+    `chaves`, se informado, sem varrer a tabela inteira)."""
+    with closing(_conectar(db_path or DB_TRANSACOES)) as con:
+        return _auditadas(con, chaves)
+
+
+def gravar_auditoria(df, db_path=None):
+    """Upsert (chave CHAVE_PALLETE) do resultado da auditoria 24x7.
+
+    A linha nova substitui a gravada se a gravada não tem status, se o
+    created_at_ultimo novo é mais recente ou se o status mudou. Devolve
+    (inseridas, atualizadas)."""
+    tuplas = _linhas_auditoria(df)
+    sql = (
+        "INSERT INTO auditoria (CHAVE_PALLETE, STATUS, CREATED_AT_ULTIMO, TIPO_MOVIMENTO_ULTIMO, "
+        "MOTIVO_ULTIMO, TEM_REMESSA_SAIDA) VALUES (?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT(CHAVE_PALLETE) DO UPDATE SET STATUS=excluded.STATUS, "
+        "CREATED_AT_ULTIMO=excluded.CREATED_AT_ULTIMO, TIPO_MOVIMENTO_ULTIMO=excluded.TIPO_MOVIMENTO_ULTIMO, "
+        "MOTIVO_ULTIMO=excluded.MOTIVO_ULTIMO, TEM_REMESSA_SAIDA=excluded.TEM_REMESSA_SAIDA "
+        "WHERE excluded.STATUS IS NOT NULL AND (auditoria.STATUS IS NULL "
+        "OR excluded.CREATED_AT_ULTIMO > COALESCE(auditoria.CREATED_AT_ULTIMO, '') "
+        "OR excluded.STATUS IS NOT auditoria.STATUS)"
+    )
+    with closing(_conectar(db_path or DB_TRANSACOES)) as con, con:
+        ja = _auditadas(con, {t[0] for t in tuplas})
+        antes = con.total_changes
+        con.executemany(sql, tuplas)
+        alteradas = con.total_changes - antes
+    inseridas = len({t[0] for t in tuplas} - ja)
+    return inseridas, alteradas - inseridas
+
+
+def ler_auditoria(db_path=None):
+    """Estado completo da auditoria 24x7 (colunas da planilha), por chave."""
+    with closing(_conectar(db_path or DB_TRANSACOES)) as con:
+        df = pd.read_sql_query(
+            "SELECT CHAVE_PALLETE, STATUS, CREATED_AT_ULTIMO, TIPO_MOVIMENTO_ULTIMO, MOTIVO_ULTIMO, "
+            "TEM_REMESSA_SAIDA FROM auditoria ORDER BY CHAVE_PALLETE", con
+        )
+    df.columns = COLUNAS_AUDITORIA
+    df["created_at_ultimo"] = pd.to_datetime(
+        df["created_at_ultimo"], format=_FORMATO_ISO, errors="coerce"
+    ).astype("datetime64[ns]")
+    df["tem_remessa_saida"] = df["tem_remessa_saida"].map(lambda v: None if pd.isna(v) else bool(v))
+    return df
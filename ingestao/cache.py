@@ -0,0 +1,160 @@
+import glob
+import hashlib
+import logging
+import os
+import time
+
+import pandas as pd
+
+from .caminhos import DIR_DADOS
+
+logger = logging.getLogger(__name__)
+
+
+def log(mensagem):
+    logger.info(mensagem)
+
+
+try:
+    import pyarrow  # noqa: F401
+    EXTENSAO = ".parquet"
+except ImportError:
+    EXTENSAO = ".pkl"
+
+DIR_CACHE = os.path.join(DIR_DADOS, "cache_relatorios")
+LIMITE_CACHE_MB = 512
+IDADE_ORFAOS_S = 3600
+
+contadores = {"hits": 0, "misses": 0, "removidos": 0}
+
+
+def _assinatura(path):
+    st = os.stat(path)
+    return (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+
+
+def _chave(assinatura, esquema):
+    """Nome da entrada: relatório + hash de (caminho, tamanho, mtime, esquema).
+
+    O esquema entra no hash para que mudar colunas/tipos invalide o cache."""
+    base = f"{assinatura}|{esquema!r}"
+    return f"{esquema.nome}_{hashlib.sha1(base.encode('utf-8')).hexdigest()[:16]}"
+
+
+def _caminho_parte(chave, i):
+    return os.path.join(DIR_CACHE, f"{chave}.{i:04d}{EXTENSAO}")
+
+
+def _caminho_marcador(chave):
+    return os.path.join(DIR_CACHE, f"{chave}.ok")
+
+
+def _gravar_parte(df, path):
+    if EXTENSAO == ".parquet":
+        df.to_parquet(path, index=False)
+    else:
+        df.to_pickle(path)
+
+
+def _ler_parte(path):
+    if EXTENSAO == ".parquet":
+        return pd.read_parquet(path)
+    return pd.read_pickle(path)
+
+
+def ler_cache(path, esquema):
+    """Blocos tipados do cache para `path`, ou None se não houver entrada válida.
+
+    A entrada só vale com o marcador .ok (gravado depois da última parte)."""
+    chave = _chave(_assinatura(path), esquema)
+    marcador = _caminho_marcador(chave)
+    try:
+        with open(marcador, "r") as f:
+            n_partes = int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        contadores["misses"] += 1
+        log(f"[CACHE] miss {esquema.nome}: {os.path.basename(path)} "
+            f"(hits={contadores['hits']} misses={contadores['misses']})")
+        return None
+
+    contadores["hits"] += 1
+    os.utime(marcador)
+    log(f"[CACHE] hit {esquema.nome}: {os.path.basename(path)} "
+        f"(hits={contadores['hits']} misses={contadores['misses']})")
+    return (_ler_parte(_caminho_parte(chave, i)) for i in range(n_partes))
+
+
+def gravar_cache(path, esquema, blocos):
+    """Repassa os blocos e grava cada um como parte de uma entrada nova.
+
+    O marcador só é escrito se todos os blocos foram consumidos e o arquivo
+    de origem não mudou durante a leitura; falha ao gravar não interrompe a
+    leitura, só desliga o cache para esta entrada."""
+    assinatura = _assinatura(path)
+    chave = _chave(assinatura, esquema)
+    gravadas = []
+    gravando = True
+    completo = False
+    try:
+        os.makedirs(DIR_CACHE, exist_ok=True)
+    except OSError as e:
+        log(f"[CACHE][AVISO] Diretório de cache indisponível: {e}")
+        gravando = False
+
+    try:
+        for i, bloco in enumerate(blocos):
+            if gravando:
+                parte = _caminho_parte(chave, i)
+                try:
+                    _gravar_parte(bloco, parte)
+                    gravadas.append(parte)
+                except Exception as e:
+                    log(f"[CACHE][AVISO] Falha ao gravar {os.path.basename(parte)}: {e}")
+                    gravando = False
+            yield bloco
+        completo = True
+    finally:
+        if gravando and completo and _assinatura(path) == assinatura:
+            with open(_caminho_marcador(chave), "w") as f:
+                f.write(str(len(gravadas)))
+            evictar()
+        else:
+            for parte in gravadas:
+                _remover(parte)
+
+
+def _remover(path):
+    try:
+        os.remove(path)
+        return True
+    except OSError:
+        return False
+
+
+def evictar(limite_mb=None):
+    """Mantém o diretório de cache abaixo do limite, removendo as entradas
+    usadas há mais tempo (mtime do marcador, atualizado a cada hit)."""
+    limite = (LIMITE_CACHE_MB if limite_mb is None else limite_mb) * 1024 * 1024
+    agora = time.time()
+
+    entradas = {}
+    for marcador in glob.glob(os.path.join(DIR_CACHE, "*.ok")):
+        chave = os.path.basename(marcador)[:-3]
+        arquivos = [marcador] + glob.glob(os.path.join(DIR_CACHE, f"{chave}.*{EXTENSAO}"))
+        tamanho = sum(os.path.getsize(a) for a in arquivos if os.path.exists(a))
+        entradas[chave] = (os.path.getmtime(marcador), tamanho, arquivos)
+
+    for parte in glob.glob(os.path.join(DIR_CACHE, f"*{EXTENSAO}")):
+        chave = os.path.basename(parte).split(".")[0]
+        if chave not in entradas and agora - os.path.getmtime(parte) > IDADE_ORFAOS_S:
+            _remover(parte)
+
+    total = sum(t for _, t, _ in entradas.values())
+    for chave, (_, tamanho, arquivos) in sorted(entradas.items(), key=lambda kv: kv[1][0]):
+        if total <= limite:
+            break
+        for a in arquivos:
+            _remover(a)
+        total -= tamanho
+        contadores["removidos"] += 1
+        log(f"[CACHE] Entrada removida por limite de tamanho: {chave}")
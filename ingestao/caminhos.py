@@ -0,0 +1,6 @@
+import os
+
+# pasta dos scripts (a que contém o pacote ingestao): bancos e cache locais
+# ficam aqui, qualquer que seja a pasta de onde o script foi iniciado
+# (agendador, atalho, terminal)
+DIR_DADOS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -0,0 +1,312 @@
+import logging
+import os
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from .publicacao import ler_manifesto
+
+logger = logging.getLogger(__name__)
+
+
+def log(mensagem):
+    logger.info(mensagem)
+
+
+Oportunidades = namedtuple("Oportunidades", "chaves inicios ordem enderecos blocos coordenadas")
+
+COLUNAS_OPORTUNIDADE = ["COD_ENDERECO", "BLOCO", "OCUPACAO", "CAPACIDADE", "LIVRE"]
+MAX_DETALHES = 3
+
+# COD_ENDERECO = <bloco><rua>-<posição>-<nível>, ex.: "A01-30-2"
+PADRAO_ENDERECO = r"^\s*([A-Za-z]+)(\d+)-(\d+)-(\d+)"
+COLUNAS_COORDENADA = ["_RUA", "_POSICAO", "_NIVEL"]
+# custo de cada passo em relação a andar uma posição na mesma rua:
+# trocar de rua exige sair do corredor, trocar de nível exige a empilhadeira
+PESOS_COORDENADA = np.array([10.0, 1.0, 2.0])
+# endereço de outro bloco fica sempre depois dos do mesmo bloco
+DISTANCIA_OUTRO_BLOCO = 1e6
+
+# pallets que cada movimento põe/tira do (endereço, SKU, validade)
+DELTAS_MOVIMENTO = {"ENTRADA": 1.0, "SAIDA": -1.0}
+COLUNAS_MOVIMENTO = ["ID", "CREATED_AT", "TIPO_MOVIMENTO", "COD_ENDERECO", "COD_ITEM", "DATA_VALIDADE"]
+
+
+def _texto(serie):
+    """str() de cada valor, como nas chaves montadas com f-string; calculado
+    sobre os valores distintos."""
+    codigos, valores = pd.factorize(serie)
+    textos = np.array([str(v) for v in valores] + ["nan"], dtype=object)
+    return pd.Series(textos[codigos], index=serie.index)
+
+
+def _dia(serie):
+    return pd.to_datetime(serie, errors="coerce").astype("datetime64[ns]").dt.normalize()
+
+
+def decompor_enderecos(enderecos):
+    """_BLOCO_END (texto, "" quando não casa) e _RUA/_POSICAO/_NIVEL (float,
+    NaN quando não casa) de cada COD_ENDERECO, calculados sobre os distintos."""
+    codigos, valores = pd.factorize(pd.Series(enderecos).astype(object))
+    partes = pd.Series([str(v) for v in valores], dtype=object).str.extract(PADRAO_ENDERECO)
+    blocos = np.append(partes[0].str.upper().fillna("").to_numpy(dtype=object), "")
+    numeros = np.vstack([partes[[1, 2, 3]].to_numpy(dtype=float).reshape(-1, 3), np.full((1, 3), np.nan)])
+    decomposto = pd.DataFrame(numeros[codigos], columns=COLUNAS_COORDENADA)
+    decomposto.insert(0, "_BLOCO_END", blocos[codigos])
+    return decomposto
+
+
+def distancias(bloco_origem, coord_origem, blocos, coordenadas):
+    """Distância de cada candidata à origem: soma ponderada das diferenças de
+    rua, posição e nível dentro do mesmo bloco; DISTANCIA_OUTRO_BLOCO fora
+    dele; inf quando algum dos endereços não pôde ser decomposto. A origem
+    pode ser uma só ou um array alinhado com as candidatas."""
+    d = np.abs(coordenadas - coord_origem) @ PESOS_COORDENADA
+    d = np.where(blocos == bloco_origem, d, DISTANCIA_OUTRO_BLOCO)
+    return np.where(np.isnan(d) | (bloco_origem == "") | (blocos == ""), np.inf, d)
+
+
+def preparar_posicoes(estoque_posicao):
+    """Colunas de junção do estoque_posicao para cruzar_saidas_cheias:
+    endereço e SKU como texto, DATA_VALIDADE no dia, a ordem das linhas e o
+    endereço decomposto em bloco, rua, posição e nível. Pode ser guardado e
+    reaproveitado enquanto o estoque_posicao não muda."""
+    posicoes = estoque_posicao[COLUNAS_OPORTUNIDADE].reset_index(drop=True)
+    posicoes["FLAG_CHEIO"] = (
+        estoque_posicao["FLAG_CHEIO"].to_numpy() if "FLAG_CHEIO" in estoque_posicao.columns else 0
+    )
+    posicoes["_ORDEM"] = np.arange(len(posicoes))
+    posicoes["_END"] = _texto(estoque_posicao["COD_ENDERECO"]).to_numpy()
+    posicoes["_SKU"] = _texto(estoque_posicao["COD_ITEM"]).to_numpy()
+    posicoes["_DIA"] = _dia(estoque_posicao["DATA_VALIDADE"]).to_numpy()
+    posicoes["_CHAVE_SKU_DATA"] = _texto(estoque_posicao["CHAVE_SKU_DATA"]).to_numpy()
+    decomposto = decompor_enderecos(posicoes["_END"])
+    for coluna in decomposto.columns:
+        posicoes[coluna] = decomposto[coluna].to_numpy()
+    return posicoes
+
+
+def indexar_oportunidades(posicoes):
+    """Posições com LIVRE > 0 agrupadas por CHAVE_SKU_DATA em arrays
+    contíguos: as candidatas da chave k são ordem/enderecos[inicios[k]:inicios[k+1]],
+    na ordem do estoque_posicao, com bloco e coordenadas alinhados para
+    calcular distâncias. Vale enquanto `posicoes` não muda."""
+    livres = posicoes.loc[
+        posicoes["LIVRE"] > 0, ["_CHAVE_SKU_DATA", "_END", "_ORDEM", "_BLOCO_END"] + COLUNAS_COORDENADA
+    ]
+    codigos, chaves = pd.factorize(livres["_CHAVE_SKU_DATA"])
+    ordem = np.argsort(codigos, kind="stable")
+    return Oportunidades(
+        chaves=pd.Index(chaves),
+        inicios=np.searchsorted(codigos[ordem], np.arange(len(chaves) + 1)),
+        ordem=livres["_ORDEM"].to_numpy()[ordem],
+        enderecos=livres["_END"].to_numpy(dtype=object)[ordem],
+        blocos=livres["_BLOCO_END"].to_numpy(dtype=object)[ordem],
+        coordenadas=livres[COLUNAS_COORDENADA].to_numpy(dtype=float)[ordem],
+    )
+
+
+def instante_do_snapshot(estoque_detalhado, mtime):
+    """Momento da extração do estoque_detalhado, para ocupacao_inicial.
+
+    Vem do conteúdo: o maior DATA_RELATORIO, quando traz a hora. Só com o
+    dia, vale o `mtime` do arquivo limitado ao fim daquele dia; sem
+    DATA_RELATORIO, o `mtime`. Sincronização ou toque do OneDrive empurram
+    o mtime para depois da extração, e aplicar_movimentos pularia os
+    movimentos do intervalo."""
+    instante = pd.Timestamp(mtime)
+    if "DATA_RELATORIO" not in estoque_detalhado.columns:
+        return instante
+    relatorio = pd.to_datetime(estoque_detalhado["DATA_RELATORIO"], dayfirst=True, errors="coerce").max()
+    if pd.isna(relatorio):
+        return instante
+    if relatorio == relatorio.normalize():
+        relatorio = min(instante, relatorio + pd.Timedelta(days=1) - pd.Timedelta(seconds=1))
+    if relatorio < instante:
+        log(f"[OCUPACAO] mtime do estoque_detalhado ({instante:%d/%m/%Y %H:%M:%S}) depois do "
+            f"DATA_RELATORIO; snapshot considerado em {relatorio:%d/%m/%Y %H:%M:%S}")
+    return relatorio
+
+
+def instante_snapshot_publicado(caminho_estoque):
+    """instante_snapshot gravado no manifesto quando o estoque_posicao em
+    `caminho_estoque` foi publicado (ver instante_do_snapshot); None sem
+    registro para esse arquivo. As impressões das fontes não servem: o
+    mtime delas é regravado a cada toque do OneDrive."""
+    diretorio, nome = os.path.split(os.path.abspath(caminho_estoque))
+    entrada = ler_manifesto(diretorio).get("estoque_posicao") or {}
+    if entrada.get("arquivo") != nome or not entrada.get("instante_snapshot"):
+        return None
+    try:
+        return datetime.fromisoformat(entrada["instante_snapshot"])
+    except ValueError:
+        return None
+
+
+def ocupacao_inicial(posicoes, desde):
+    """Estado da ocupação viva: OCUPACAO do snapshot por (endereço, SKU, dia
+    da validade), a partir do qual aplicar_movimentos soma as transações
+    posteriores a `desde` (momento do estoque_detalhado). Refeito a cada
+    snapshot novo."""
+    base = posicoes.drop_duplicates(["_END", "_SKU", "_DIA"], keep="last")
+    chaves = zip(base["_END"], base["_SKU"], base["_DIA"].to_numpy())
+    return {
+        "desde": pd.Timestamp(desde),
+        "lote": None,
+        "ocupacao": dict(zip(chaves, base["OCUPACAO"].to_numpy(dtype=float))),
+        "aplicadas": set(),
+        "antes_da_saida": {},
+    }
+
+
+def aplicar_movimentos(estado, transacoes):
+    """Aplica ao estado, em ordem de chegada (CREATED_AT, ID), cada ENTRADA
+    (+1 pallet) e SAIDA (-1) posterior ao snapshot ainda não aplicada,
+    guardando a ocupação da origem antes de cada saída. Devolve quantas."""
+    if len(transacoes) == 0:
+        return 0
+    criado = pd.to_datetime(transacoes["CREATED_AT"], errors="coerce").astype("datetime64[ns]").to_numpy()
+    ids = _texto(transacoes["ID"]).to_numpy(dtype=object)
+    novas = (
+        transacoes["TIPO_MOVIMENTO"].astype(str).isin(DELTAS_MOVIMENTO).to_numpy()
+        & (criado > np.datetime64(estado["desde"]))
+        & ~pd.Series(ids).isin(estado["aplicadas"]).to_numpy()
+    )
+    if not novas.any():
+        return 0
+    linhas = np.flatnonzero(novas)
+    linhas = linhas[np.lexsort((ids[linhas].astype(str), criado[linhas]))]
+    mov, ids = transacoes.iloc[linhas], ids[linhas]
+
+    ocupacao, antes = estado["ocupacao"], estado["antes_da_saida"]
+    chaves = zip(_texto(mov["COD_ENDERECO"]), _texto(mov["COD_ITEM"]), _dia(mov["DATA_VALIDADE"]).to_numpy())
+    deltas = mov["TIPO_MOVIMENTO"].astype(str).map(DELTAS_MOVIMENTO)
+    for id_, chave, delta in zip(ids, chaves, deltas):
+        atual = ocupacao.get(chave, 0.0)
+        if delta < 0:
+            antes[id_] = atual
+        ocupacao[chave] = max(atual + delta, 0.0)
+    estado["aplicadas"].update(ids)
+    return len(mov)
+
+
+def coletar_movimentos(blocos, desde, destino):
+    """Repassa os blocos de transações e junta em `destino` (lista) as
+    ENTRADA/SAIDA posteriores a `desde`, para aplicar_movimentos sem ler o
+    arquivo uma segunda vez."""
+    desde = np.datetime64(pd.Timestamp(desde))
+    for bloco in blocos:
+        criado = pd.to_datetime(bloco["CREATED_AT"], errors="coerce").astype("datetime64[ns]").to_numpy()
+        movimento = bloco["TIPO_MOVIMENTO"].astype(str).isin(DELTAS_MOVIMENTO).to_numpy() & (criado > desde)
+        if movimento.any():
+            destino.append(bloco.loc[movimento, COLUNAS_MOVIMENTO])
+        yield bloco
+
+
+def ocupacao_antes_das_saidas(estado, saidas):
+    """Ocupação da origem antes de cada saída (NaN quando a saída não passou
+    pelo estado, p.ex. anterior ao snapshot), alinhada com `saidas`."""
+    return _texto(saidas["ID"]).map(estado["antes_da_saida"]).to_numpy(dtype=float)
+
+
+def cruzar_saidas_cheias(saidas, posicoes, max_detalhes=MAX_DETALHES, oportunidades=None, ocupacao_antes=None):
+    """Saídas que tiraram de uma posição cheia enquanto o mesmo SKU/validade
+    tinha espaço livre em outro endereço, sem varrer o estoque por saída.
+
+    A posição de origem é a linha de (endereço, SKU, dia da validade); com
+    chave repetida vale a última, como no dicionário que isto substitui.
+    Estava cheia pelo FLAG_CHEIO do snapshot ou, quando `ocupacao_antes`
+    (alinhado com `saidas`, ver ocupacao_antes_das_saidas) tem valor, pela
+    ocupação viva antes da saída comparada à CAPACIDADE. As
+    alternativas são as linhas com o mesmo CHAVE_SKU_DATA, outro endereço e
+    LIVRE > 0, fatiadas de `oportunidades` (indexar_oportunidades; montado
+    aqui quando não é passado) e ordenadas pela distância à origem (ver
+    `distancias`), com empate na ordem do estoque_posicao.
+
+    Devolve (achados, detalhes):
+    - achados: _SAIDA (posição da linha em `saidas`), _PAR, OCUPACAO_ORIGEM,
+      CAPACIDADE_ORIGEM e OPORTUNIDADES_ENCONTRADAS, na ordem das saídas;
+    - detalhes: _PAR, COLUNAS_OPORTUNIDADE e DISTANCIA das até `max_detalhes`
+      alternativas mais próximas de cada par (origem, CHAVE_SKU_DATA)."""
+    vazio = (
+        pd.DataFrame(columns=["_SAIDA", "_PAR", "OCUPACAO_ORIGEM", "CAPACIDADE_ORIGEM", "OPORTUNIDADES_ENCONTRADAS"]),
+        pd.DataFrame(columns=["_PAR"] + COLUNAS_OPORTUNIDADE + ["DISTANCIA"]),
+    )
+    if len(saidas) == 0 or len(posicoes) == 0:
+        return vazio
+
+    s = pd.DataFrame({
+        "_SAIDA": np.arange(len(saidas)),
+        "_END": _texto(saidas["COD_ENDERECO"]).to_numpy(),
+        "_SKU": _texto(saidas["COD_ITEM"]).to_numpy(),
+        "_DIA": _dia(saidas["DATA_VALIDADE"]).to_numpy(),
+    })
+    s["_OCUPACAO_VIVA"] = np.nan if ocupacao_antes is None else np.asarray(ocupacao_antes, dtype=float)
+    s = s[s["_DIA"].notna()]
+
+    origens = posicoes.drop_duplicates(["_END", "_SKU", "_DIA"], keep="last")
+    if ocupacao_antes is None:
+        origens = origens[origens["FLAG_CHEIO"] == 1]
+    origens = origens[["_END", "_SKU", "_DIA", "OCUPACAO", "CAPACIDADE", "FLAG_CHEIO"]]
+    m = s.merge(origens, on=["_END", "_SKU", "_DIA"], how="inner")
+    if ocupacao_antes is not None:
+        viva = m["_OCUPACAO_VIVA"].notna().to_numpy()
+        # mantém o tipo do snapshot (inteiro): os valores vivos são contagens
+        m["OCUPACAO"] = np.where(viva, m["_OCUPACAO_VIVA"], m["OCUPACAO"]).astype(m["OCUPACAO"].dtype)
+        m = m[np.where(viva, m["OCUPACAO"] >= m["CAPACIDADE"], m["FLAG_CHEIO"] == 1)]
+    if m.empty:
+        return vazio
+    codigos, dias = pd.factorize(m["_DIA"])
+    m["_CHAVE_SKU_DATA"] = m["_SKU"] + "|" + np.asarray(dias.strftime("%Y%m%d"), dtype=object)[codigos]
+
+    if oportunidades is None:
+        oportunidades = indexar_oportunidades(posicoes)
+    pares = m[["_END", "_CHAVE_SKU_DATA"]].drop_duplicates().reset_index(drop=True)
+    pares["_PAR"] = np.arange(len(pares))
+
+    # candidatas de cada par, lado a lado: (par, linha) sem a própria origem
+    k = oportunidades.chaves.get_indexer(pares["_CHAVE_SKU_DATA"])
+    achou = k >= 0
+    inicio = np.where(achou, oportunidades.inicios[k], 0)
+    tamanho = np.where(achou, oportunidades.inicios[k + 1] - oportunidades.inicios[k], 0)
+    par = np.repeat(pares["_PAR"].to_numpy(), tamanho)
+    pos = np.arange(tamanho.sum()) - np.repeat(np.cumsum(tamanho) - tamanho - inicio, tamanho)
+    outra = oportunidades.enderecos[pos] != pares["_END"].to_numpy(dtype=object)[par]
+    par, pos = par[outra], pos[outra]
+
+    pares["OPORTUNIDADES_ENCONTRADAS"] = np.bincount(par, minlength=len(pares))
+
+    # distância de cada candidata à origem do seu par; ordena por (par,
+    # distância, ordem do estoque) e fica com as max_detalhes primeiras
+    origem = decompor_enderecos(pares["_END"])
+    d = distancias(
+        origem["_BLOCO_END"].to_numpy(dtype=object)[par], origem[COLUNAS_COORDENADA].to_numpy()[par],
+        oportunidades.blocos[pos], oportunidades.coordenadas[pos],
+    )
+    ordem = np.lexsort((pos, d, par))
+    par, pos, d = par[ordem], pos[ordem], d[ordem]
+    primeiras = np.arange(len(par)) - np.searchsorted(par, par) < max_detalhes
+
+    achados = (
+        m.merge(pares[pares["OPORTUNIDADES_ENCONTRADAS"] > 0], on=["_END", "_CHAVE_SKU_DATA"])
+        .rename(columns={"OCUPACAO": "OCUPACAO_ORIGEM", "CAPACIDADE": "CAPACIDADE_ORIGEM"})
+        .sort_values("_SAIDA")
+        .reset_index(drop=True)
+    )
+    detalhes = posicoes.iloc[oportunidades.ordem[pos[primeiras]]][COLUNAS_OPORTUNIDADE].reset_index(drop=True)
+    detalhes.insert(0, "_PAR", par[primeiras])
+    detalhes["DISTANCIA"] = d[primeiras]
+    return (
+        achados[["_SAIDA", "_PAR", "OCUPACAO_ORIGEM", "CAPACIDADE_ORIGEM", "OPORTUNIDADES_ENCONTRADAS"]],
+        detalhes,
+    )
+
+
+def detalhes_por_par(detalhes):
+    """{_PAR: [registros das alternativas]} para montar os alertas."""
+    return {
+        par: grupo.drop(columns="_PAR").to_dict("records")
+        for par, grupo in detalhes.groupby("_PAR", sort=False)
+    }
@@ -0,0 +1,81 @@
+import logging
+import re
+import unicodedata
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+def log(mensagem):
+    logger.info(mensagem)
+
+
+TAMANHO_CACHE_CANON = 4096
+
+
+@lru_cache(maxsize=TAMANHO_CACHE_CANON)
+def _canon_texto(s: str) -> str:
+    s = unicodedata.normalize("NFKD", s).encode("ascii", "ignore").decode("ascii")
+    s = s.replace("-", " ").replace("_", " ")
+    return re.sub(r"\s+", " ", s).strip().upper()
+
+
+def canon(s: str) -> str:
+    """Forma canônica de um rótulo: sem acento, '-'/'_' viram espaço, maiúsculo.
+
+    Memoizada (LRU, compartilhada entre ciclos): cada rótulo distinto é
+    normalizado uma vez por processo."""
+    return _canon_texto(str(s))
+
+
+def _codigos_e_valores(serie):
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        return serie.cat.codes.to_numpy(), serie.cat.categories
+    return pd.factorize(serie)
+
+
+def mascara_rotulos(serie, alvos):
+    """Máscara booleana das linhas cuja forma canônica está em `alvos`.
+
+    Mesmo resultado de `serie.map(canon).isin(alvos)`, mas decidido uma vez
+    por valor distinto."""
+    alvos = set(alvos)
+    codigos, valores = _codigos_e_valores(serie)
+    # posição extra (False) para os códigos -1 dos nulos
+    dentro = np.array([canon(v) in alvos for v in valores] + [False], dtype=bool)
+    return pd.Series(dentro[codigos], index=serie.index)
+
+
+def pick_col(df, candidatos, obrigatoria=True):
+    """Nome real da primeira coluna de `df` que casa com um dos candidatos.
+
+    Compara sem caixa e, na segunda passada, com espaço igual a '_'. Sem
+    coincidência levanta ValueError, ou devolve None se `obrigatoria=False`."""
+    cols = {c.strip().lower(): c for c in df.columns}
+
+    for cand in candidatos:
+        k = cand.strip().lower()
+        if k in cols:
+            return cols[k]
+
+    norm_cands = {cand.strip().lower().replace(" ", "_") for cand in candidatos}
+    for c in df.columns:
+        if c.strip().lower().replace(" ", "_") in norm_cands:
+            return c
+
+    if not obrigatoria:
+        return None
+    raise ValueError(f"Coluna não encontrada. Candidatos: {candidatos}")
+
+
+def aplicar_aliases(df, aliases):
+    """Renomeia (no lugar) as colunas de `df` para os nomes canônicos do esquema."""
+    for novo, candidatos in aliases.items():
+        antigo = pick_col(df, list(candidatos), obrigatoria=False)
+        if antigo is not None and antigo != novo and novo not in df.columns:
+            df.rename(columns={antigo: novo}, inplace=True)
+            log(f"Coluna renomeada: {antigo} -> {novo}")
+    return df
@@ -0,0 +1,177 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+
+TAMANHO_AMOSTRA_DATAS = 200
+
+# (relatório, coluna) -> formato que mais converteu na última vez
+formatos_vencedores = {}
+
+
+def _inferir_formato(amostra, formatos):
+    """Formato que converte mais valores da amostra (empate fica com o primeiro)."""
+    melhor, melhor_ok = None, 0
+    for fmt in formatos:
+        ok = int(pd.to_datetime(amostra, format=fmt, errors="coerce").notna().sum())
+        if ok > melhor_ok:
+            melhor, melhor_ok = fmt, ok
+            if ok == len(amostra):
+                break
+    return melhor
+
+
+def converter_datas(serie, formatos=(), dayfirst=True, chave=None):
+    """Converte uma coluna de texto para datetime uma única vez.
+
+    Só os valores distintos são convertidos e depois espalhados pelas linhas.
+    O primeiro formato tentado é o vencedor guardado para `chave` (relatório,
+    coluna) ou, sem ele, o que mais converte numa amostra; os outros formatos
+    só veem o que sobrou, e o resto vai por inferência com dayfirst."""
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+
+    codigos, valores = pd.factorize(serie)
+    texto = pd.Index(valores).astype(str).str.strip()
+    pendente = ~texto.isin(("", "nan", "NaT", "None"))
+    # uma posição a mais (NaT) para os códigos -1 (nulos) do factorize
+    convertidos = np.full(len(texto) + 1, np.datetime64("NaT"), dtype="datetime64[ns]")
+
+    ordem = list(formatos)
+    vencedor = formatos_vencedores.get(chave) if chave is not None else None
+    if vencedor is None and len(ordem) > 1 and pendente.any():
+        candidatos = texto[pendente]
+        passo = max(1, len(candidatos) // TAMANHO_AMOSTRA_DATAS)
+        vencedor = _inferir_formato(candidatos[::passo][:TAMANHO_AMOSTRA_DATAS], ordem)
+    if vencedor in ordem:
+        ordem.remove(vencedor)
+        ordem.insert(0, vencedor)
+
+    mais_ok = (None, 0)
+    for fmt in ordem:
+        if not pendente.any():
+            break
+        conv = pd.to_datetime(texto[pendente], format=fmt, errors="coerce")
+        ok = conv.notna()
+        posicoes = np.flatnonzero(pendente)[ok]
+        convertidos[posicoes] = conv[ok].to_numpy(dtype="datetime64[ns]")
+        pendente[posicoes] = False
+        if ok.sum() > mais_ok[1]:
+            mais_ok = (fmt, int(ok.sum()))
+
+    if pendente.any():
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", UserWarning)
+            conv = pd.to_datetime(texto[pendente], dayfirst=dayfirst, errors="coerce")
+        convertidos[np.flatnonzero(pendente)] = conv.to_numpy(dtype="datetime64[ns]")
+
+    if chave is not None and mais_ok[0] is not None:
+        formatos_vencedores[chave] = mais_ok[0]
+
+    return pd.Series(convertidos[codigos], index=serie.index, name=serie.name)
+
+
+def _limpar_numeros(texto, decimal, milhar):
+    """Texto no padrão brasileiro -> texto que o pd.to_numeric entende."""
+    tem_decimal = texto.str.contains(decimal, regex=False)
+    if tem_decimal.any():
+        texto = texto.where(~tem_decimal, texto.str.replace(milhar, "", regex=False))
+        texto = texto.str.replace(decimal, ".", regex=False)
+    return texto.str.replace(r"[^0-9\.\-]", "", regex=True)
+
+
+def converter_numeros(serie, decimal=",", milhar="."):
+    """Converte números no padrão brasileiro ("1.234,56") para float/int.
+
+    O separador de milhar só é removido quando o valor tem separador decimal,
+    então "1.5" continua sendo 1.5; qualquer outro caractere é descartado.
+    A limpeza roda só nos valores distintos, e coluna que já está limpa vai
+    direto para o pd.to_numeric."""
+    if pd.api.types.is_numeric_dtype(serie):
+        return serie
+
+    codigos, valores = pd.factorize(serie)
+    texto = pd.Series(pd.Index(valores).astype(str), dtype=object)
+    try:
+        numeros = pd.to_numeric(texto)
+    except (ValueError, TypeError):
+        numeros = pd.to_numeric(_limpar_numeros(texto, decimal, milhar), errors="coerce")
+
+    valores_num = numeros.to_numpy()
+    if (codigos < 0).any():
+        # posição extra (NaN) para os códigos -1 dos nulos
+        valores_num = np.append(valores_num.astype("float64"), np.nan)
+    return pd.Series(valores_num[codigos], index=serie.index, name=serie.name)
+
+
+def converter_categoria(serie):
+    """Texto de poucos valores -> categórica normalizada (strip + maiúsculo).
+
+    A normalização roda só nos valores distintos; as categorias ficam em
+    ordem alfabética, então sort/groupby dão a mesma ordem do texto."""
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        return serie
+
+    codigos, valores = pd.factorize(serie)
+    norm = pd.Index(valores).astype(str).str.strip().str.upper()
+    categorias = norm.unique().sort_values()
+    codigos = np.where(codigos >= 0, categorias.get_indexer(norm)[codigos], -1)
+    return pd.Series(
+        pd.Categorical.from_codes(codigos, categorias), index=serie.index, name=serie.name
+    )
+
+
+def _texto_codigo(valor):
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return str(valor).strip()
+
+
+def converter_texto(serie):
+    """Coluna de código -> texto aparado, sem o ".0" que o Excel põe em número.
+
+    Roda só nos valores distintos; nulos continuam nulos."""
+    codigos, valores = pd.factorize(serie)
+    texto = np.array([_texto_codigo(v) for v in valores] + [np.nan], dtype=object)
+    return pd.Series(texto[codigos], index=serie.index, name=serie.name, dtype="str")
+
+
+def alinhar_categorias(*dfs, colunas):
+    """Deixa as colunas categóricas de vários frames com as mesmas categorias.
+
+    Merge/concat só mantêm o dtype categórico (e comparam por código)
+    quando as categorias são iguais dos dois lados. Devolve os frames na
+    mesma ordem; os que precisam de ajuste são copiados."""
+    dfs = list(dfs)
+    for col in colunas:
+        if not all(col in df.columns and isinstance(df[col].dtype, pd.CategoricalDtype) for df in dfs):
+            continue
+        categorias = dfs[0][col].cat.categories
+        for df in dfs[1:]:
+            categorias = categorias.union(df[col].cat.categories)
+        for i, df in enumerate(dfs):
+            if not df[col].cat.categories.equals(categorias):
+                dfs[i] = df.assign(**{col: df[col].cat.set_categories(categorias)})
+    return dfs
+
+
+def tipar(df, esquema):
+    """Converte, no lugar, as colunas de data, número, categoria e texto do esquema."""
+    for col, formatos in esquema.datas.items():
+        if col in df.columns:
+            df[col] = converter_datas(df[col], formatos, chave=(esquema.nome, col))
+
+    for col in esquema.numeros:
+        if col in df.columns:
+            df[col] = converter_numeros(df[col], esquema.decimal, esquema.milhar)
+
+    for col in esquema.categorias:
+        if col in df.columns:
+            df[col] = converter_categoria(df[col])
+
+    for col in esquema.textos:
+        if col in df.columns:
+            df[col] = converter_texto(df[col])
+
+    return df
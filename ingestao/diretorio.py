@@ -0,0 +1,78 @@
+import fnmatch
+import os
+import time
+from collections import namedtuple
+
+Arquivo = namedtuple("Arquivo", "nome caminho tamanho mtime")
+
+# a listagem é refeita quando o mtime da pasta muda (arquivo criado,
+# removido ou renomeado) ou quando passou esse intervalo desde a última
+INTERVALO_VARREDURA_S = 30.0
+
+contadores = {"varreduras": 0, "consultas": 0}
+
+# caminho absoluto da pasta -> {"mtime_pasta", "lido_em", "arquivos", "buscas": {padrão: [Arquivo]}}
+_indices = {}
+
+
+def _varrer(diretorio):
+    """Uma passada de os.scandir; no Windows o stat de cada entrada já vem
+    da própria listagem. Temporários "~$" (Excel, gravar_atomico) ficam de fora."""
+    arquivos = []
+    with os.scandir(diretorio) as it:
+        for entrada in it:
+            if entrada.name.startswith("~$"):
+                continue
+            try:
+                if not entrada.is_file():
+                    continue
+                st = entrada.stat()
+            except OSError:
+                continue
+            arquivos.append(Arquivo(entrada.name, entrada.path, st.st_size, st.st_mtime))
+    return arquivos
+
+
+def _indice(diretorio):
+    chave = os.path.abspath(diretorio)
+    mtime_pasta = os.stat(chave).st_mtime_ns
+    contadores["consultas"] += 1
+
+    indice = _indices.get(chave)
+    if indice and indice["mtime_pasta"] == mtime_pasta and time.monotonic() - indice["lido_em"] < INTERVALO_VARREDURA_S:
+        return indice
+
+    indice = {"mtime_pasta": mtime_pasta, "lido_em": time.monotonic(), "arquivos": _varrer(chave), "buscas": {}}
+    _indices[chave] = indice
+    contadores["varreduras"] += 1
+    return indice
+
+
+def listar_arquivos(diretorio):
+    """Arquivos da pasta com tamanho e mtime, do índice em memória."""
+    return _indice(diretorio)["arquivos"]
+
+
+def buscar(diretorio, padrao):
+    """Arquivos cujo nome casa com o padrão (sintaxe do glob, maiúsculas
+    conforme o sistema), do mais novo para o mais antigo."""
+    indice = _indice(diretorio)
+    achados = indice["buscas"].get(padrao)
+    if achados is None:
+        nomes = set(fnmatch.filter([a.nome for a in indice["arquivos"]], padrao))
+        achados = sorted((a for a in indice["arquivos"] if a.nome in nomes), key=lambda a: a.mtime, reverse=True)
+        indice["buscas"][padrao] = achados
+    return achados
+
+
+def mais_recente(diretorio, padrao):
+    achados = buscar(diretorio, padrao)
+    return achados[0].caminho if achados else None
+
+
+def invalidar(diretorio=None):
+    """Descarta o índice da pasta (ou de todas), depois de escrever ou apagar nela."""
+    if diretorio is None:
+        _indices.clear()
+    else:
+        _indices.pop(os.path.abspath(diretorio), None)
@@ -0,0 +1,116 @@
+from dataclasses import dataclass, field
+
+FORMATOS_DATA_BR = ("%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M", "%d/%m/%Y")
+FORMATOS_DATA_AMPLOS = FORMATOS_DATA_BR + (
+    "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d",
+    "%m/%d/%Y %H:%M:%S", "%m/%d/%Y %H:%M", "%m/%d/%Y",
+)
+
+
+@dataclass(frozen=True)
+class Esquema:
+    """Descrição declarativa de um relatório.
+
+    colunas: ordem fixa das colunas no CSV; None usa o header do próprio arquivo.
+    header: nomes que identificam a linha de header no CSV.
+    datas: coluna -> formatos tentados em ordem (o que sobrar vai por dayfirst).
+    numeros: colunas numéricas, com `decimal` e `milhar` no padrão brasileiro.
+    aliases: nome canônico -> nomes aceitos, em ordem de preferência.
+    categorias: colunas de poucos valores guardadas como categórica, já
+    normalizadas (strip + maiúsculo), para filtro/groupby por código.
+    textos: colunas de código que viram texto aparado mesmo quando a
+    planilha traz número (101.0 -> "101") ou espaço sobrando.
+    """
+    nome: str
+    colunas: tuple = None
+    header: tuple = ()
+    datas: dict = field(default_factory=dict)
+    numeros: tuple = ()
+    decimal: str = ","
+    milhar: str = "."
+    aliases: dict = field(default_factory=dict)
+    categorias: tuple = ()
+    textos: tuple = ()
+
+    def e_header(self, parts):
+        return all(c in parts for c in self.header)
+
+
+_ALIASES_ENDERECO = {
+    "BLOCO": ("BLOCO", "BLOCO_ENDERECO", "LOCAL"),
+    "COD_ENDERECO": ("COD_ENDERECO", "ENDERECO", "POSICAO"),
+    "TIPO_ENDERECO": ("TIPO_ENDERECO", "TIPO ENDERECO", "TIPO", "TIPO_POSICAO"),
+}
+
+ESTOQUE_DETALHADO = Esquema(
+    nome="estoque_detalhado",
+    colunas=(
+        "LOCAL_EXPEDICAO", "COD_DEPOSITO", "COD_ENDERECO", "CHAVE_PALLET", "VOLUME",
+        "COD_ITEM", "DESC_ITEM", "LOTE", "UOM", "DOCUMENTO",
+        "DATA_VALIDADE", "DATA_ULTIMA_TRANSACAO", "OCUPACAO",
+        "CAPACIDADE", "DESCRICAO", "QTDE_POR_PALLET", "PALLET_COMPLETO", "BLOCO", "TIPO_ENDERECO",
+        "STATUS_PALLET", "SHELF_ITEM", "DATA_FABRICACAO", "SHELF_ESTOQUE", "DIAS_ESTOQUE", "DIAS_VALIDADE", "DATA_RELATORIO",
+    ),
+    header=("LOCAL_EXPEDICAO", "COD_ENDERECO"),
+    datas={
+        "DATA_VALIDADE": FORMATOS_DATA_BR,
+        "DATA_ULTIMA_TRANSACAO": FORMATOS_DATA_BR,
+        "DATA_FABRICACAO": FORMATOS_DATA_BR,
+        "DATA_RELATORIO": FORMATOS_DATA_BR,
+    },
+    numeros=("OCUPACAO", "CAPACIDADE", "QTDE_POR_PALLET", "VOLUME", "DIAS_ESTOQUE", "DIAS_VALIDADE"),
+    categorias=("LOCAL_EXPEDICAO", "COD_DEPOSITO", "UOM", "BLOCO", "TIPO_ENDERECO", "STATUS_PALLET"),
+    aliases={
+        **_ALIASES_ENDERECO,
+        "COD_ITEM": ("COD_ITEM", "SKU", "ITEM", "PRODUTO"),
+        "DATA_VALIDADE": ("DATA_VALIDADE", "VALIDADE", "DT_VALIDADE"),
+        "CHAVE_PALLET": ("CHAVE_PALLET", "PALLET", "LOTE"),
+        "DATA_ULTIMA_TRANSACAO": ("DATA_ULTIMA_TRANSACAO", "DT_ULTIMA_TRANSACAO", "ULTIMA_TRANSACAO", "DATA_TRANSACAO"),
+    },
+)
+
+HISTORICO_TRANSACOES = Esquema(
+    nome="historico_transacoes",
+    colunas=(
+        "ID", "COD_CENTRO", "LOCAL_EXPEDICAO", "COD_DEPOSITO", "COD_ENDERECO",
+        "COD_ITEM", "DESC_ITEM", "LOTE", "VOLUME", "UOM",
+        "DATA_VALIDADE", "TIPO_MOVIMENTO", "CHAVE_PALLET", "MOTIVO", "CREATED_AT", "CRIADO_POR_LOGIN",
+    ),
+    header=("ID", "COD_ITEM", "TIPO_MOVIMENTO"),
+    datas={
+        "DATA_VALIDADE": FORMATOS_DATA_BR,
+        "CREATED_AT": FORMATOS_DATA_BR,
+    },
+    numeros=("VOLUME",),
+    categorias=("LOCAL_EXPEDICAO", "COD_DEPOSITO", "UOM", "TIPO_MOVIMENTO", "MOTIVO", "CRIADO_POR_LOGIN"),
+    aliases={
+        "CHAVE_PALLET": ("CHAVE_PALLET", "CHAVE_PALLETE"),
+        "COD_ENDERECO": ("COD_ENDERECO", "ENDERECO"),
+    },
+)
+
+RASTREABILIDADE = Esquema(
+    nome="rastreabilidade",
+    datas={
+        "DATA_VALIDADE": FORMATOS_DATA_BR,
+        "DATA_FABRICACAO": FORMATOS_DATA_BR,
+        "CREATED_AT": FORMATOS_DATA_BR,
+    },
+    textos=("COD_RASTREABILIDADE", "COD_ITEM"),
+    aliases={
+        "COD_RASTREABILIDADE": ("COD_RASTREABILIDADE", "CODIGO_RASTREABILIDADE"),
+    },
+)
+
+CAP_ENDERECO = Esquema(
+    nome="cap_endereco",
+    numeros=("CAPACIDADE",),
+    categorias=("BLOCO", "TIPO_ENDERECO"),
+    textos=("COD_ENDERECO",),
+    aliases={
+        **_ALIASES_ENDERECO,
+        "CAPACIDADE": ("CAPACIDADE", "CAP", "QTD_MAXIMA"),
+    },
+)
+
+ESQUEMAS = {e.nome: e for e in (ESTOQUE_DETALHADO, HISTORICO_TRANSACOES, RASTREABILIDADE, CAP_ENDERECO)}
@@ -0,0 +1,556 @@
+import codecs
+import csv
+import functools
+import io
+import logging
+import mmap
+import os
+import re
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from . import cache
+from .colunas import aplicar_aliases
+from .conversores import alinhar_categorias, tipar
+from .esquemas import HISTORICO_TRANSACOES
+
+logger = logging.getLogger(__name__)
+
+
+def log(mensagem):
+    logger.info(mensagem)
+
+
+ENCODINGS_CSV = ("utf-8-sig", "utf-8", "latin1", "cp1252")
+TAMANHO_AMOSTRA_ENCODING = 64 * 1024
+TAMANHO_BLOCO = 50_000
+MOTOR_CSV = "texto"
+
+try:
+    import python_calamine  # noqa: F401
+    MOTOR_EXCEL = "calamine"
+except ImportError:
+    MOTOR_EXCEL = None  # openpyxl, o padrão do pandas
+
+_cache_csv = {}
+
+
+def _split_fix(parts, n):
+    if len(parts) > n:
+        head = parts[:n-1]
+        tail = ";".join(parts[n-1:])
+        return head + [tail]
+    elif len(parts) < n:
+        return parts + [""] * (n - len(parts))
+    return parts
+
+
+def _detectar_encoding(amostra, encodings=ENCODINGS_CSV):
+    """Escolhe o encoding olhando só o BOM e uma amostra do início do arquivo."""
+    if amostra.startswith(codecs.BOM_UTF8) and "utf-8-sig" in encodings:
+        return "utf-8-sig"
+    for enc in encodings:
+        try:
+            codecs.getincrementaldecoder(enc)().decode(amostra, final=False)
+            return enc
+        except UnicodeDecodeError:
+            continue
+    return encodings[-1]
+
+
+def _info_csv(bruto, path, encodings=ENCODINGS_CSV):
+    """Entrada do _cache_csv para o arquivo aberto em `bruto` (modo binário).
+
+    O cache é por caminho e só vale enquanto (tamanho, mtime) não mudarem;
+    guarda o encoding detectado e, por esquema, onde o header está."""
+    st = os.fstat(bruto.fileno())
+    chave = os.path.abspath(path)
+    assinatura = (st.st_size, st.st_mtime_ns)
+
+    info = _cache_csv.get(chave)
+    if info is None or info["assinatura"] != assinatura:
+        amostra = bruto.read(TAMANHO_AMOSTRA_ENCODING)
+        bruto.seek(0)
+        info = {"assinatura": assinatura, "encoding": _detectar_encoding(amostra, encodings),
+                "headers": {}, "offsets": {}}
+        _cache_csv[chave] = info
+    return info
+
+
+def _abrir_csv(path, encodings=ENCODINGS_CSV):
+    """Abre o arquivo uma única vez e devolve (arquivo_texto, info_cache).
+
+    info["headers"][esquema.header] guarda a linha física e o texto do
+    header (motor "texto"); info["offsets"] o byte onde começam os dados
+    (motor "mmap")."""
+    bruto = open(path, "rb")
+    info = _info_csv(bruto, path, encodings)
+    return io.TextIOWrapper(bruto, encoding=info["encoding"], errors="replace"), info
+
+
+def _linhas_apos_header(f, info, esquema):
+    """Gera as linhas de dados (não vazias, sem \\r\\n) que vêm depois do header.
+
+    Com a posição do header no cache, só pula as linhas; senão procura a
+    primeira linha em que `esquema.e_header(parts)` é verdadeiro e guarda a
+    posição. Sem header, vale a primeira linha não vazia. O texto do header
+    fica em info["headers"][esquema.header] antes da primeira linha de dados."""
+    headers = info["headers"]
+    if esquema.header in headers:
+        linha_header, _ = headers[esquema.header]
+        for _ in range(linha_header + 1):
+            f.readline()
+        yield from (ln.rstrip("\r\n") for ln in f if ln.strip())
+        return
+
+    antes_header = []
+    for i, ln in enumerate(f):
+        if not ln.strip():
+            continue
+        ln = ln.rstrip("\r\n")
+        if esquema.e_header(ln.split(";")):
+            headers[esquema.header] = (i, ln)
+            del antes_header
+            yield from (ln.rstrip("\r\n") for ln in f if ln.strip())
+            return
+        antes_header.append((i, ln))
+
+    if not antes_header:
+        raise ValueError("Arquivo CSV vazio ou inválido")
+    log("Header não encontrado, usando primeira linha")
+    headers[esquema.header] = antes_header[0]
+    yield from (ln for _, ln in antes_header[1:])
+
+
+_RE_ESPACO_APOS_SEP = re.compile(r";[^\S\n]+")
+_RE_ESPACO_APOS_NL = re.compile(r"\n[^\S\n]+")
+_RE_ESPACO_APOS_SEP_B = re.compile(rb";[^\S\n]+")
+_RE_ESPACO_APOS_NL_B = re.compile(rb"\n[^\S\n]+")
+
+# espaço do motor "texto" visto nos bytes de um encoding (ver _espacos_em_bytes)
+_EspacosBytes = namedtuple("_EspacosBytes", "padroes padroes_invertidos nao_espaco raros")
+
+
+def _aparar_campos(texto):
+    """Faz o strip de todos os campos de um texto ';'/'\\n' de uma vez.
+
+    Os padrões começam por literal (rápido no `re`); o espaço antes do
+    separador é tirado aplicando os mesmos padrões no texto invertido."""
+    texto = texto.strip()
+    texto = _RE_ESPACO_APOS_NL.sub("\n", _RE_ESPACO_APOS_SEP.sub(";", texto))[::-1]
+    texto = _RE_ESPACO_APOS_NL.sub("\n", _RE_ESPACO_APOS_SEP.sub(";", texto))[::-1]
+    return texto
+
+
+@functools.lru_cache(maxsize=None)
+def _espacos_em_bytes(enc):
+    """Como o espaço (str.isspace, fora o '\\n') aparece nos bytes de `enc`.
+
+    NBSP e os demais espaços Unicode entram como a sequência de bytes do
+    encoding (b"\\xa0" no latin1, b"\\xc2\\xa0" no UTF-8), para o motor
+    "mmap" aparar igual ao "texto". `padroes` são os de após ';'/'\\n'
+    (`padroes_invertidos` para o texto invertido); `nao_espaco` marca os
+    bytes que não são espaço nem '\\n'; `raros` os bytes que começam um
+    espaço fora do ASCII, que só então pede os padrões completos."""
+    if codecs.lookup(enc).name == "utf-8-sig":
+        enc = "utf-8"
+    sequencias = set()
+    for c in range(0x3001):  # o último espaço do Unicode é U+3000
+        if c != 10 and chr(c).isspace():
+            try:
+                sequencias.add(chr(c).encode(enc))
+            except UnicodeEncodeError:
+                pass
+
+    def padroes(seqs):
+        simples = b"".join(re.escape(q) for q in sorted(q for q in seqs if len(q) == 1))
+        alternativas = [b"[" + simples + b"]"] + [re.escape(q) for q in sorted(q for q in seqs if len(q) > 1)]
+        espaco = b"(?:" + b"|".join(alternativas) + b")+"
+        return re.compile(b";" + espaco), re.compile(b"\n" + espaco)
+
+    nao_espaco = np.ones(256, dtype=bool)
+    nao_espaco[list(b"".join(sequencias) + b"\n")] = False
+    raros = tuple(sorted({q[:1] for q in sequencias if not q.isspace()}))
+    return _EspacosBytes(padroes(sequencias), padroes({q[::-1] for q in sequencias}), nao_espaco, raros)
+
+
+def _aparar_campos_bytes(texto, enc):
+    """_aparar_campos sobre bytes em `enc`, com o mesmo conjunto de espaços
+    do motor "texto". Sem byte `raro` no texto bastam os padrões ASCII."""
+    espacos = _espacos_em_bytes(enc)
+    texto = texto.strip()
+    if not any(b in texto for b in espacos.raros):
+        sep, nl = _RE_ESPACO_APOS_SEP_B, _RE_ESPACO_APOS_NL_B
+        texto = nl.sub(b"\n", sep.sub(b";", texto))[::-1]
+        return nl.sub(b"\n", sep.sub(b";", texto))[::-1]
+
+    # o '\n' posto na frente faz as pontas passarem pelo padrão de início de linha
+    (sep, nl), (sep_inv, nl_inv) = espacos.padroes, espacos.padroes_invertidos
+    texto = nl.sub(b"\n", sep.sub(b";", b"\n" + texto))[:0:-1]
+    return nl_inv.sub(b"\n", sep_inv.sub(b";", b"\n" + texto))[:0:-1]
+
+
+def _limpar_campo(valor):
+    return valor.strip().replace('"', '').replace("'", '')
+
+
+def _df_linhas_estrito(linhas, colunas):
+    """Tokeniza as linhas com o parser C do pandas, já com os campos limpos.
+
+    Só as linhas com quantidade de campos diferente de len(colunas) passam
+    pelo _split_fix: elas entram no parser com "_" no último campo e o
+    valor certo (cauda juntada com ';' ou "") é gravado depois na mesma
+    posição, então a ordem das linhas não muda.
+
+    A limpeza (strip de cada campo e remoção de aspas) é feita uma vez
+    sobre o texto inteiro antes do parser, no lugar do .str por coluna."""
+    n = len(colunas)
+    if not linhas:
+        return pd.DataFrame(columns=colunas, dtype=str)
+
+    ultimos = {}
+    for i, ln in enumerate(linhas):
+        if ln.count(";") != n - 1:
+            parts = _split_fix(ln.split(";"), n)
+            linhas[i] = ";".join(parts[:-1] + ["_"])
+            ultimos[i] = _limpar_campo(parts[-1])
+
+    texto = _aparar_campos("\n".join(linhas)).replace('"', '').replace("'", '')
+
+    df = pd.read_csv(
+        io.StringIO(texto), sep=";", header=None, names=colunas,
+        dtype=str, engine="c", quoting=csv.QUOTE_NONE, na_filter=False
+    )
+    if ultimos:
+        df.iloc[list(ultimos), n - 1] = list(ultimos.values())
+    return df
+
+
+def _colunas_do_header(header):
+    return [_limpar_campo(c).upper() for c in header.split(";")]
+
+
+def _iter_csv_texto(path, esquema, tamanho_bloco, encodings):
+    f, info = _abrir_csv(path, encodings)
+    with f:
+        colunas = list(esquema.colunas) if esquema.colunas else None
+        total = 0
+        linhas = []
+        entregou = False
+        for ln in _linhas_apos_header(f, info, esquema):
+            if colunas is None:
+                colunas = _colunas_do_header(info["headers"][esquema.header][1])
+            linhas.append(ln)
+            if len(linhas) >= tamanho_bloco:
+                total += len(linhas)
+                entregou = True
+                yield _df_linhas_estrito(linhas, colunas)
+                linhas = []
+
+        if linhas or not entregou:
+            if colunas is None:
+                colunas = _colunas_do_header(info["headers"][esquema.header][1])
+            total += len(linhas)
+            yield _df_linhas_estrito(linhas, colunas)
+
+    log(f"Total de linhas lidas: {total}")
+    log(f"CSV lido com sucesso usando encoding: {info['encoding']}")
+
+
+BYTES_POR_LINHA_JANELA = 256
+
+
+def _inicio_dados_mmap(mm, info, esquema):
+    """(offset do primeiro byte de dados, texto do header) no arquivo mapeado.
+
+    Só as linhas até o header são decodificadas; sem header, vale a
+    primeira linha não vazia, como no motor "texto"."""
+    offsets = info["offsets"]
+    if esquema.header in offsets:
+        return offsets[esquema.header]
+
+    enc = info["encoding"]
+    pos = 0
+    primeira = None
+    while pos < len(mm):
+        fim = mm.find(b"\n", pos)
+        fim = len(mm) if fim == -1 else fim + 1
+        ln = mm[pos:fim].decode(enc, errors="replace").rstrip("\r\n")
+        if ln.strip():
+            if esquema.e_header(ln.split(";")):
+                offsets[esquema.header] = (fim, ln)
+                return offsets[esquema.header]
+            if primeira is None:
+                primeira = (fim, ln)
+        pos = fim
+
+    if primeira is None:
+        raise ValueError("Arquivo CSV vazio ou inválido")
+    log("Header não encontrado, usando primeira linha")
+    offsets[esquema.header] = primeira
+    return primeira
+
+
+def _df_bytes_estrito(seg, colunas, usecols, enc):
+    """Equivalente ao _df_linhas_estrito sobre um pedaço de bytes (linhas inteiras).
+
+    Fronteiras de linha e contagem de ';' por linha saem do numpy sobre os
+    bytes; só as linhas fora do tamanho (e as vazias) viram objetos Python.
+    O parser C tokeniza os bytes e só decodifica as colunas de `usecols`."""
+    n = len(colunas)
+    arr = np.frombuffer(seg, dtype=np.uint8)
+    inicios = np.flatnonzero(arr == 10) + 1
+    inicios = np.concatenate(([0], inicios[inicios < len(arr)]))
+    fins = np.append(inicios[1:], len(arr))
+
+    seps = np.diff(np.searchsorted(np.flatnonzero(arr == 59), np.append(inicios, len(arr))))
+    fora = np.flatnonzero(seps != n - 1)
+
+    ultimos = {}
+    if len(fora):
+        # Linhas vazias somem no parser; o índice da linha no DataFrame
+        # desconta as vazias anteriores. Com n > 1 toda linha vazia já está
+        # em `fora` (tem 0 ';'); com n == 1 a tabela de bytes de espaço
+        # separa as candidatas. Vazia é como o motor "texto" vê (ln.strip(),
+        # com NBSP etc.), então as candidatas são decodificadas.
+        if n > 1:
+            candidatas = fora
+        else:
+            candidatas = np.flatnonzero(np.add.reduceat(_espacos_em_bytes(enc).nao_espaco[arr], inicios) == 0)
+        vazias = np.zeros(len(inicios), dtype=bool)
+        vazias[candidatas] = [
+            not seg[inicios[i]:fins[i]].decode(enc, errors="replace").strip() for i in candidatas
+        ]
+        fora = fora[~vazias[fora]]
+        linha_df = np.arange(len(inicios)) - np.cumsum(vazias)
+
+    if len(fora):
+        pedacos = []
+        anterior = 0
+        for i in fora:
+            parts = seg[inicios[i]:fins[i]].rstrip(b"\r\n").split(b";")
+            if len(parts) > n:
+                cauda = b";".join(parts[n - 1:])
+                parts = parts[:n - 1]
+            else:
+                cauda = b""
+                parts = parts + [b""] * (n - 1 - len(parts))
+            pedacos.append(seg[anterior:inicios[i]])
+            pedacos.append(b";".join(parts + [b"_"]) + b"\n")
+            anterior = fins[i]
+            ultimos[int(linha_df[i])] = _limpar_campo(cauda.decode(enc, errors="replace"))
+        pedacos.append(seg[anterior:])
+        seg = b"".join(pedacos)
+
+    texto = _aparar_campos_bytes(bytes(seg), enc).replace(b'"', b"").replace(b"'", b"")
+    if not texto:
+        return pd.DataFrame(columns=[c for c in colunas if c in usecols], dtype=str)
+
+    df = pd.read_csv(
+        io.BytesIO(texto), sep=";", header=None, names=colunas, usecols=usecols,
+        dtype=str, engine="c", quoting=csv.QUOTE_NONE, na_filter=False,
+        encoding=enc, encoding_errors="replace"
+    )
+    if ultimos and colunas[-1] in df.columns:
+        df.iloc[list(ultimos), df.columns.get_loc(colunas[-1])] = list(ultimos.values())
+    return df
+
+
+def _iter_csv_mmap(path, esquema, tamanho_bloco, encodings, colunas_pedidas):
+    with open(path, "rb") as bruto:
+        info = _info_csv(bruto, path, encodings)
+        if os.fstat(bruto.fileno()).st_size == 0:
+            raise ValueError("Arquivo CSV vazio ou inválido")
+        mm = mmap.mmap(bruto.fileno(), 0, access=mmap.ACCESS_READ)
+
+    enc = info["encoding"]
+    total = 0
+    with mm:
+        pos, header = _inicio_dados_mmap(mm, info, esquema)
+        colunas = list(esquema.colunas) if esquema.colunas else _colunas_do_header(header)
+        usecols = [c for c in colunas if colunas_pedidas is None or c in colunas_pedidas]
+
+        janela = max(tamanho_bloco * BYTES_POR_LINHA_JANELA, 1024 * 1024)
+        tamanho = len(mm)
+        entregou = False
+        while pos < tamanho:
+            fim = min(pos + janela, tamanho)
+            if fim < tamanho:
+                quebras = np.flatnonzero(np.frombuffer(mm, dtype=np.uint8, count=fim - pos, offset=pos) == 10)
+                if not len(quebras):
+                    janela *= 2
+                    continue
+                fim = pos + int(quebras[min(tamanho_bloco, len(quebras)) - 1]) + 1
+                del quebras
+            df = _df_bytes_estrito(mm[pos:fim], colunas, usecols, enc)
+            pos = fim
+            if hasattr(mmap, "MADV_DONTNEED"):
+                mm.madvise(mmap.MADV_DONTNEED, 0, pos - pos % mmap.PAGESIZE)
+            if len(df) or not entregou:
+                total += len(df)
+                entregou = True
+                yield df
+
+        if not entregou:
+            yield pd.DataFrame(columns=usecols, dtype=str)
+
+    log(f"Total de linhas lidas: {total}")
+    log(f"CSV lido com sucesso usando encoding: {enc} (motor mmap)")
+
+
+def iter_csv_estrito(path, esquema, tamanho_bloco=TAMANHO_BLOCO, encodings=ENCODINGS_CSV,
+                     colunas=None, motor=None):
+    """Lê um CSV ';' do SGR em blocos de até `tamanho_bloco` linhas, só texto.
+
+    As colunas vêm de `esquema.colunas` (linhas fora do tamanho são
+    ajustadas pelo _split_fix) ou, se o esquema não fixa colunas, do header
+    do arquivo. O arquivo é aberto uma vez só; encoding e posição do header
+    vêm do _cache_csv quando o arquivo não mudou.
+
+    motor "texto" (padrão, MOTOR_CSV) decodifica o arquivo e trabalha com as
+    linhas em str; motor "mmap" mapeia o arquivo e acha linhas/campos nos
+    bytes, decodificando só as `colunas` pedidas (None = todas). O resultado
+    é o mesmo; o "mmap" gasta bem menos memória em exportações grandes."""
+    motor = motor or MOTOR_CSV
+    if motor == "mmap":
+        yield from _iter_csv_mmap(path, esquema, tamanho_bloco, encodings, colunas)
+        return
+    if motor != "texto":
+        raise ValueError(f"Motor de CSV desconhecido: {motor}")
+
+    for df in _iter_csv_texto(path, esquema, tamanho_bloco, encodings):
+        yield df if colunas is None else df[[c for c in df.columns if c in colunas]]
+
+
+def ler_csv_estrito(path, esquema, encodings=ENCODINGS_CSV, colunas=None, motor=None):
+    return pd.concat(
+        list(iter_csv_estrito(path, esquema, encodings=encodings, colunas=colunas, motor=motor)),
+        ignore_index=True
+    )
+
+
+def _ler_excel(path):
+    inicio = time.time()
+    df = pd.read_excel(path, engine=MOTOR_EXCEL)
+    log(f"[EXCEL] {os.path.basename(path)} convertido com {MOTOR_EXCEL or 'openpyxl'} "
+        f"em {time.time() - inicio:.2f} segundos")
+    df.columns = [str(c).strip().upper() for c in df.columns]
+    return df
+
+
+def _blocos_tipados(path, esquema, tamanho_bloco, colunas=None, motor=None):
+    if not path.lower().endswith(".csv"):
+        blocos = [_ler_excel(path)]
+    else:
+        blocos = iter_csv_estrito(path, esquema, tamanho_bloco, colunas=colunas, motor=motor)
+
+    for bloco in blocos:
+        aplicar_aliases(bloco, esquema.aliases)
+        yield tipar(bloco, esquema)
+
+
+def ler_relatorio_em_blocos(path, esquema, tamanho_bloco=TAMANHO_BLOCO, usar_cache=True,
+                            colunas=None, motor=None):
+    """Gera o relatório em DataFrames já tipados (aliases e conversões aplicados).
+
+    CSV é lido em pedaços de `tamanho_bloco` linhas; Excel vem num bloco só.
+    Com `usar_cache`, um arquivo que já foi lido (mesmo caminho, tamanho e
+    mtime) sai direto das partes gravadas em ingestao.cache, bloco a bloco.
+    Leitura parcial (`colunas`) não passa pelo cache; `motor` vai para o
+    iter_csv_estrito."""
+    if not usar_cache or colunas is not None:
+        yield from _blocos_tipados(path, esquema, tamanho_bloco, colunas, motor)
+        return
+
+    partes = cache.ler_cache(path, esquema)
+    if partes is not None:
+        yield from partes
+        return
+    yield from cache.gravar_cache(path, esquema, _blocos_tipados(path, esquema, tamanho_bloco, motor=motor))
+
+
+def concatenar_blocos(blocos):
+    """pd.concat dos blocos tipados mantendo as colunas categóricas.
+
+    Cada bloco tem as próprias categorias; sem alinhar, o concat viraria
+    texto de novo."""
+    blocos = list(blocos)
+    if len(blocos) == 1:
+        return blocos[0]
+    categoricas = [c for c in blocos[0].columns if isinstance(blocos[0][c].dtype, pd.CategoricalDtype)]
+    return pd.concat(alinhar_categorias(*blocos, colunas=categoricas), ignore_index=True)
+
+
+def ler_transacoes_em_blocos(caminho_transacoes, tamanho_bloco=TAMANHO_BLOCO, colunas=None, motor=None):
+    """Histórico de transações em DataFrames já tipados.
+
+    Para .xlsx o arquivo é lido inteiro e entregue como um único bloco.
+    Erros de leitura são propagados para quem consome o gerador.
+    `colunas`/`motor` vão para o leitor (motor "mmap" decodifica só as
+    colunas pedidas)."""
+    log(f"Lendo transações em blocos de {tamanho_bloco} linhas de: {caminho_transacoes}")
+    return ler_relatorio_em_blocos(
+        caminho_transacoes, HISTORICO_TRANSACOES, tamanho_bloco, colunas=colunas, motor=motor
+    )
+
+
+def mascara_transacoes_recentes(created_at, agora, horas_retroativas):
+    """CREATED_AT nas últimas `horas_retroativas` horas até `agora`, sem
+    passar do início do dia atual."""
+    data_limite = agora - timedelta(hours=horas_retroativas)
+    data_hoje = agora.replace(hour=0, minute=0, second=0, microsecond=0)
+    return (
+        (created_at >= data_limite) &
+        (created_at <= agora) &
+        (created_at >= data_hoje)
+    )
+
+
+def filtrar_blocos_recentes(blocos, horas_retroativas, agora=None):
+    """Junta só as linhas recentes (mascara_transacoes_recentes) de cada
+    bloco, sem manter o arquivo inteiro em memória. Bloco sem CREATED_AT
+    passa inteiro; se nenhum bloco tem data válida, devolve todas."""
+    agora = agora or datetime.now()
+    recentes = []
+    sem_data = []
+    viu_data_valida = False
+    total = 0
+
+    for bloco in blocos:
+        total += len(bloco)
+        if 'CREATED_AT' not in bloco.columns:
+            recentes.append(bloco)
+            continue
+
+        if not pd.api.types.is_datetime64_any_dtype(bloco['CREATED_AT']):
+            bloco['CREATED_AT'] = pd.to_datetime(bloco['CREATED_AT'], errors='coerce')
+
+        if bloco['CREATED_AT'].notnull().any():
+            viu_data_valida = True
+            sem_data = []
+        elif not viu_data_valida:
+            sem_data.append(bloco)
+
+        recentes.append(bloco[mascara_transacoes_recentes(bloco['CREATED_AT'], agora, horas_retroativas)].copy())
+
+    if not viu_data_valida and sem_data:
+        log("Nenhuma data válida encontrada em CREATED_AT - usando todas as transações")
+        recentes = sem_data
+
+    log(f"Total de transações lidas em blocos: {total}")
+    return concatenar_blocos(recentes) if recentes else pd.DataFrame(columns=list(HISTORICO_TRANSACOES.colunas))
+
+
+def ler_relatorio(path, esquema, usar_cache=True, colunas=None, motor=None):
+    """Lê um relatório (CSV estrito ou Excel) e devolve o DataFrame tipado.
+
+    Aplica os aliases do esquema e converte cada coluna de data/número uma
+    vez só, então todo script recebe o mesmo frame para o mesmo arquivo."""
+    inicio = time.time()
+    df = concatenar_blocos(ler_relatorio_em_blocos(path, esquema, usar_cache=usar_cache, colunas=colunas, motor=motor))
+    log(f"[{esquema.nome}] {os.path.basename(path)} lido - Shape: {df.shape} em {time.time() - inicio:.2f} segundos")
+    return df
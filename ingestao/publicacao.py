@@ -0,0 +1,274 @@
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+
+import pandas as pd
+
+from .diretorio import invalidar
+
+logger = logging.getLogger(__name__)
+
+
+def log(mensagem):
+    logger.info(mensagem)
+
+
+try:
+    import pyarrow  # noqa: F401
+    EXTENSAO_TABELA = ".parquet"
+except ImportError:
+    EXTENSAO_TABELA = ".pkl"
+
+EXTENSOES_TABELA = (".parquet", ".pkl")
+MANIFESTO = "manifesto_publicacao.json"
+MAX_LIDOS = 4
+
+# hash do conteúdo publicado -> DataFrame já lido neste processo
+_lidos = OrderedDict()
+
+
+def _atualizar_hash(h, conteudo):
+    if isinstance(conteudo, pd.DataFrame):
+        h.update(repr([(str(c), str(t)) for c, t in conteudo.dtypes.items()]).encode("utf-8"))
+        h.update(pd.util.hash_pandas_object(conteudo, index=False).to_numpy().tobytes())
+    elif isinstance(conteudo, dict):
+        for k, v in conteudo.items():
+            h.update(str(k).encode("utf-8"))
+            _atualizar_hash(h, v)
+    elif isinstance(conteudo, (bytes, bytearray)):
+        h.update(conteudo)
+    else:
+        h.update(json.dumps(conteudo, sort_keys=True, default=str, ensure_ascii=False).encode("utf-8"))
+
+
+def hash_conteudo(conteudo):
+    """sha256 do conteúdo lógico (DataFrame, {aba: DataFrame}, dict/lista ou bytes).
+
+    É calculado antes de escrever, então não depende de metadados do
+    arquivo (o xlsx, por exemplo, grava a data de criação)."""
+    h = hashlib.sha256()
+    _atualizar_hash(h, conteudo)
+    return h.hexdigest()
+
+
+def hash_arquivo(path, tamanho_bloco=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for bloco in iter(lambda: f.read(tamanho_bloco), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+def impressao_fontes(fontes, anteriores=None):
+    """{nome: {arquivo, tamanho, mtime_ns, hash}} para as fontes ({nome: caminho}).
+
+    O hash da impressão anterior é reaproveitado quando arquivo, tamanho e
+    mtime são os mesmos; só arquivo mexido (download novo, sync do
+    OneDrive) é lido de novo."""
+    anteriores = anteriores or {}
+    impressoes = {}
+    for nome, path in fontes.items():
+        st = os.stat(path)
+        atual = {"arquivo": os.path.basename(path), "tamanho": st.st_size, "mtime_ns": st.st_mtime_ns}
+        anterior = anteriores.get(nome) or {}
+        if all(anterior.get(k) == v for k, v in atual.items()) and anterior.get("hash"):
+            atual["hash"] = anterior["hash"]
+        else:
+            atual["hash"] = hash_arquivo(path)
+        impressoes[nome] = atual
+    return impressoes
+
+
+def fontes_alteradas(impressoes, anteriores):
+    """Nomes das fontes cujo conteúdo (hash) difere do registrado."""
+    anteriores = anteriores or {}
+    return sorted(n for n, i in impressoes.items() if i["hash"] != (anteriores.get(n) or {}).get("hash"))
+
+
+def _descrever(conteudo):
+    """(linhas, esquema) para o manifesto; None quando não é tabela."""
+    if isinstance(conteudo, pd.DataFrame):
+        return len(conteudo), {str(c): str(t) for c, t in conteudo.dtypes.items()}
+    if isinstance(conteudo, dict) and conteudo and all(isinstance(v, pd.DataFrame) for v in conteudo.values()):
+        return (
+            {aba: len(df) for aba, df in conteudo.items()},
+            {aba: {str(c): str(t) for c, t in df.dtypes.items()} for aba, df in conteudo.items()},
+        )
+    return None, None
+
+
+def _fsync_diretorio(diretorio):
+    if os.name != "posix":
+        return
+    fd = os.open(diretorio, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def gravar_atomico(path, escrever):
+    """Chama escrever(tmp) num arquivo temporário da mesma pasta, faz fsync e
+    renomeia por cima de `path`: quem lê vê o arquivo antigo ou o novo,
+    nunca metade. O temporário começa com "~$", que o OneDrive não sincroniza,
+    e é único por escrita (pid + uuid), para não ser o arquivo de trava do
+    Excel nem o de outro processo publicando o mesmo destino. Como termina em
+    ".tmp", `escrever` não pode deduzir o formato pela extensão."""
+    diretorio, nome = os.path.split(os.path.abspath(path))
+    tmp = os.path.join(diretorio, f"~${nome}.{os.getpid()}.{uuid.uuid4().hex}.tmp")
+    try:
+        escrever(tmp)
+        with open(tmp, "rb+") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    _fsync_diretorio(diretorio)
+    invalidar(diretorio)
+
+
+def gravar_tabela(path, df, formato=None):
+    """Grava o DataFrame mantendo os tipos (datas, inteiros, categorias):
+    parquet quando o pyarrow está instalado, senão pickle. `formato`
+    (".parquet"/".pkl") vale no lugar da extensão de `path`, para gravar
+    no temporário do gravar_atomico."""
+    formato = (formato or os.path.splitext(path)[1]).lower()
+    if formato == ".parquet":
+        df.to_parquet(path, index=False)
+    else:
+        df.to_pickle(path)
+
+
+def ler_tabela(path):
+    if path.lower().endswith(".parquet"):
+        return pd.read_parquet(path)
+    return pd.read_pickle(path)
+
+
+def eh_tabela(path):
+    return path.lower().endswith(EXTENSOES_TABELA)
+
+
+def ler_manifesto(diretorio):
+    try:
+        with open(os.path.join(diretorio, MANIFESTO), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _gravar_manifesto(diretorio, manifesto):
+    def escrever(tmp):
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifesto, f, ensure_ascii=False, indent=2)
+
+    gravar_atomico(os.path.join(diretorio, MANIFESTO), escrever)
+
+
+def _confere(path, entrada):
+    """O arquivo ainda é o que o manifesto registrou (tamanho e mtime)?"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    return st.st_size == entrada.get("tamanho") and st.st_mtime_ns == entrada.get("mtime_ns")
+
+
+def publicar(path, escrever, conteudo, chave=None, dependencias=None, extras=None):
+    """Publica um artefato com gravar_atomico e registra no manifesto da pasta
+    (hash, linhas, esquema, tamanho, mtime).
+
+    `chave` identifica o artefato lógico (padrão: nome do arquivo), para
+    arquivos com timestamp no nome. Se o hash é o mesmo da última publicação
+    e aquele arquivo não foi mexido, nada é escrito e o caminho dele é
+    devolvido. `dependencias` (impressao_fontes das entradas usadas) é
+    registrada junto com o horário da verificação, mesmo quando o arquivo
+    é mantido. `extras` ({campo: valor}) vai para a entrada da mesma forma:
+    descreve a publicação atual (p.ex. o momento do snapshot), mesmo que o
+    conteúdo não tenha mudado. Devolve o caminho publicado."""
+    diretorio, nome = os.path.split(os.path.abspath(path))
+    chave = chave or nome
+    hash_novo = hash_conteudo(conteudo)
+
+    manifesto = ler_manifesto(diretorio)
+    entrada = manifesto.get(chave)
+    if entrada and entrada.get("hash") == hash_novo:
+        anterior = os.path.join(diretorio, entrada["arquivo"])
+        if _confere(anterior, entrada):
+            if dependencias is not None or extras:
+                entrada.update(extras or {})
+                if dependencias is not None:
+                    entrada["dependencias"] = dependencias
+                    entrada["verificado_em"] = time.time()
+                _gravar_manifesto(diretorio, manifesto)
+            log(f"[PUBLICACAO] {chave} sem mudança - mantido {entrada['arquivo']}")
+            return anterior
+
+    gravar_atomico(path, escrever)
+    st = os.stat(path)
+    linhas, esquema = _descrever(conteudo)
+    manifesto = ler_manifesto(diretorio)
+    manifesto[chave] = {
+        "arquivo": nome,
+        "hash": hash_novo,
+        "linhas": linhas,
+        "esquema": esquema,
+        "tamanho": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "publicado_em": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    manifesto[chave].update(extras or {})
+    if dependencias is not None:
+        manifesto[chave]["dependencias"] = dependencias
+        manifesto[chave]["verificado_em"] = time.time()
+    _gravar_manifesto(diretorio, manifesto)
+    log(f"[PUBLICACAO] {chave} publicado em {nome}")
+    return path
+
+
+def registrar_dependencias(diretorio, chave, dependencias):
+    """Atualiza só as impressões das fontes de `chave`, quando o conteúdo é o
+    mesmo e mudou apenas o mtime; evita reler as fontes no próximo ciclo."""
+    manifesto = ler_manifesto(diretorio)
+    if chave in manifesto:
+        manifesto[chave]["dependencias"] = dependencias
+        _gravar_manifesto(diretorio, manifesto)
+
+
+def entrada_publicada(path):
+    """Entrada do manifesto para `path`, se o arquivo ainda é o publicado."""
+    diretorio, nome = os.path.split(os.path.abspath(path))
+    for entrada in ler_manifesto(diretorio).values():
+        if entrada.get("arquivo") == nome and _confere(path, entrada):
+            return entrada
+    return None
+
+
+def ler_publicado(path, ler):
+    """ler(path), a não ser que o mesmo conteúdo (hash do manifesto) já tenha
+    sido lido neste processo; nesse caso devolve uma cópia do último frame.
+    Arquivo fora do manifesto é sempre lido."""
+    entrada = entrada_publicada(path)
+    if entrada is None:
+        return ler(path)
+
+    hash_atual = entrada["hash"]
+    if hash_atual in _lidos:
+        _lidos.move_to_end(hash_atual)
+        log(f"[PUBLICACAO] {os.path.basename(path)} sem mudança desde a última leitura")
+        return _lidos[hash_atual].copy()
+
+    df = ler(path)
+    if df is not None:
+        _lidos[hash_atual] = df.copy()
+        while len(_lidos) > MAX_LIDOS:
+            _lidos.popitem(last=False)
+    return df
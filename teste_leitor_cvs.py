@@ -1,9 +1,8 @@
-import re
-import sys
-import pandas as pd
-from pathlib import Path
 import os
-import io
+import time
+import tracemalloc
+
+from ingestao import ESTOQUE_DETALHADO, ler_relatorio
 
 def _find_onedrive_subfolder(subfolder_name: str):
     user_dir = os.environ.get("USERPROFILE", "")
@@ -20,64 +19,7 @@ if not BASE_DIR_AUD:
 
 caminho = os.path.join(BASE_DIR_AUD, "estoque_detalhado.csv")
 
-EXPECTED_COLS = [
-    "LOCAL_EXPEDICAO","COD_DEPOSITO","COD_ENDERECO","CHAVE_PALLET","VOLUME",
-    "COD_ITEM","DESC_ITEM","LOTE","UOM","DOCUMENTO",
-    "DATA_VALIDADE","DATA_ULTIMA_TRANSACAO","OCUPACAO",
-    "CAPACIDADE","DESCRICAO","QTDE_POR_PALLET","PALLET_COMPLETO","BLOCO","TIPO_ENDERECO",
-    "STATUS_PALLET","SHELF_ITEM","DATA_FABRICACAO","SHELF_ESTOQUE","DIAS_ESTOQUE","DIAS_VALIDADE","DATA_RELATORIO"
-]
-
-def _split_fix(parts, n):
-    """Normaliza a lista 'parts' para ter exatamente n campos,
-       unindo excedentes no último campo e preenchendo faltantes com vazio."""
-    if len(parts) > n:
-        head = parts[:n-1]
-        tail = ";".join(parts[n-1:])
-        return head + [tail]
-    elif len(parts) < n:
-        return parts + [""] * (n - len(parts))
-    return parts
-
-def _read_csv_strict_build_df(path, encodings=("utf-8-sig","utf-8","latin1","cp1252")):
-    last_exc = None
-    for enc in encodings:
-        try:
-            with open(path, "r", encoding=enc, errors="replace") as f:
-                lines = [ln.rstrip("\r\n") for ln in f]
-
-            header_idx = None
-            for i, ln in enumerate(lines):
-                parts = ln.split(";")
-                if ("LOCAL_EXPEDICAO" in parts) and ("COD_ENDERECO" in parts):
-                    header_idx = i
-                    break
-
-            if header_idx is None:
-                header_idx = 0
-
-            header = _split_fix(lines[header_idx].split(";"), len(EXPECTED_COLS))
-            use_cols = EXPECTED_COLS
-
-            rows = []
-            for ln in lines[header_idx+1:]:
-                parts = _split_fix(ln.split(";"), len(EXPECTED_COLS))
-                rows.append(parts)
-
-            df_out = pd.DataFrame(rows, columns=use_cols, dtype=str)
-
-            df_out.columns = [c.strip() for c in df_out.columns]
-            for c in df_out.columns:
-                if df_out[c].dtype == object:
-                    df_out[c] = df_out[c].str.strip()
-
-            return df_out
-        except Exception as e:
-            last_exc = e
-            continue
-    raise last_exc if last_exc else RuntimeError("Falha ao ler CSV com encodings testados.")
-
-df = _read_csv_strict_build_df(caminho)
+df = ler_relatorio(caminho, ESTOQUE_DETALHADO)
 
 print("Colunas do CSV (ajustadas):")
 print(df.columns.tolist())
@@ -90,4 +32,13 @@ if "BLOCO" in df.columns:
     print(df["BLOCO"].head(10).tolist())
     print("dtype de ID:", df["BLOCO"].dtype)
 else:
-    print("\n[ALERTA] Coluna 'BLOCO' não encontrada; verifique o cabeçalho.")
\ No newline at end of file
+    print("\n[ALERTA] Coluna 'BLOCO' não encontrada; verifique o cabeçalho.")
+
+print("\nComparação dos motores de leitura (tempo / pico de memória Python):")
+for motor in ("texto", "mmap"):
+    tracemalloc.start()
+    inicio = time.time()
+    ler_relatorio(caminho, ESTOQUE_DETALHADO, usar_cache=False, motor=motor)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {motor}: {time.time() - inicio:.2f} s | pico {pico / 1024 / 1024:.1f} MB")